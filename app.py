@@ -8,6 +8,7 @@ import time
 import logging
 import shutil
 import importlib
+import multiprocessing
 import ctypes
 import keyboard
 import json
@@ -48,6 +49,12 @@ class SharedResources:
         self.final_message = None # 用于模式执行后传递总结信息
         self.is_admin = False # GUI适配：添加is_admin属性
         self.available_modes = [] # GUI适配：存储从config.json加载的模式元数据
+        self.capture_backend = None # 截图后端 (core.capture)，首次截图时按 global_settings.capture_backend 创建
+        self.delay_learner = None # 自适应延迟学习器 (core.delay_learner)，按需创建
+        self.window_geometry = None # 窗口几何缓存 (core.window_geometry)，窗口移动/缩放时自动刷新
+        self.screen_state_recognizer = None # 界面状态识别器 (core.screen_state)，没有模板时为 False
+        self.status_callback = None # 可选的进度文字回调 (GUI 状态栏)，见 core.utils.report_status
+        self.intro_cache = None # 模式10 片头缓存 (core.intro_cache)，按需创建，创建失败时为 False
 
     def get_stitch_background_color(self):
         """
@@ -111,6 +118,8 @@ class ModeSpecificConfig:
         self.m6_group_prefix = mode_defaults.get('output_group_prefix', 'Group')
         self.m6_start_group = mode_defaults.get('start_group_index', 0)
         self.m6_end_group = mode_defaults.get('end_group_index', 7)
+        self.m6_tournament_poster = mode_defaults.get('tournament_poster', False) # 是否把所有比赛总览图拼成一张赛事海报
+        self.m6_tournament_poster_scale = mode_defaults.get('tournament_poster_scale', 0.5)
 
     def _load_mode7_config(self, mode_defaults):
         self.m7_group_prefix = mode_defaults.get('output_group_prefix', 'Group')
@@ -127,6 +136,18 @@ class ModeSpecificConfig:
         self.m9_zip_filename = mode_defaults.get('zip_filename', 'mode9_archive.zip')
         self.m9_webp_quality = mode_defaults.get('webp_quality', 85)
         self.m9_webp_lossless = mode_defaults.get('webp_lossless', False) # 新增 webp_lossless 加载
+        self.m9_webp_method = mode_defaults.get('webp_method', core_constants.R_M9_WEBP_METHOD) # 0 (快) - 6 (小)
+        self.m9_worker_processes = mode_defaults.get('worker_processes', 0) # 转换进程数，0 为自动 (CPU 核心数 - 1)
+        self.m9_resize_enabled = mode_defaults.get('resize_enabled', False) # 编码前把宽图等比缩小到 m9_target_width
+        self.m9_target_width = mode_defaults.get('target_width', core_constants.R_M9_TARGET_WIDTH)
+        self.m9_recursive = mode_defaults.get('recursive', False) # 递归处理子目录 (输出保留相对路径)
+        self.m9_include_patterns = mode_defaults.get('include_patterns', []) # 例如 ["*_overview_*"]
+        self.m9_exclude_patterns = mode_defaults.get('exclude_patterns', [])
+        self.m9_min_size_kb = mode_defaults.get('min_size_kb', 0)
+        self.m9_min_age_seconds = mode_defaults.get('min_age_seconds', 0) # 跳过最近修改 (可能仍在写入) 的文件
+        self.m9_dedup_enabled = mode_defaults.get('dedup_enabled', False) # 近重复图片只归档一张 (core.image_dedup)
+        self.m9_dedup_max_distance = mode_defaults.get('dedup_max_distance', 4) # dHash 汉明距离阈值 (共 hash_size² 位)
+        self.m9_dedup_hash_size = mode_defaults.get('dedup_hash_size', 8)
         self.m9_del_orig_after_webp = mode_defaults.get('delete_originals_after_webp', False)
         self.m9_del_webp_after_zip = mode_defaults.get('delete_webp_after_zip', True)
         self.m9_configured_absolute_input_dir = mode_defaults.get('m9_configured_absolute_input_dir', None) # 新增配置项
@@ -147,6 +168,9 @@ class ModeSpecificConfig:
         self.m10_video_width = mode_defaults.get('video_resolution_width', 1920)
         self.m10_video_height = mode_defaults.get('video_resolution_height', 1080)
 
+    def _load_mode11_config(self, mode_defaults):
+        self.m11_state_name = mode_defaults.get('state_name', 'player_detail')
+
     def __init__(self, mode_number=None, app_config=None):
         # 通用配置项
         gs_defaults = app_config.get('global_settings', {}) if app_config else {}
@@ -168,6 +192,7 @@ class ModeSpecificConfig:
             9: self._load_mode9_config,
             41: self._load_mode41_config,
             10: self._load_mode10_config, # 新增
+            11: self._load_mode11_config,
         }
 
         if mode_number and app_config:
@@ -255,7 +280,10 @@ def load_app_config(logger):
            "default_image_spacing": 20,
            "default_stitch_background_color": "0,0,0",
            "log_to_file": False,
-           "log_filename": "app_log.log"
+           "log_filename": "app_log.log",
+           "capture_backend": "pyautogui",
+           "capture_replay_dir": "",
+           "capture_replay_frame_interval": 0
        },
        "mode_specific_defaults": {},
        "modes_meta": [] # Ensure default has an empty modes list
@@ -421,6 +449,9 @@ def setup_app_environment(context: AppContext):
     if nikke_window:
         context.shared.nikke_window = nikke_window
         logger.info(f"Successfully found NIKKE window: {nikke_window.title} (activation deferred)") # 修改日志
+        # 启用界面状态识别时，按当前客户区尺寸预计算模板金字塔
+        from core import screen_state
+        screen_state.init_screen_state_recognizer(context, nikke_window)
     else:
         logger.error(f"Failed to find NIKKE window. Ensure the game is running.") # 修改日志
         # GUI 需要知道这个结果
@@ -484,6 +515,12 @@ def execute_mode(context: AppContext, mode_number: int, mode_specific_inputs: di
                 logger.error(f"Mode 9 path initialization failed. Aborting mode 9.")
                 return # 无法继续
 
+        # 本次运行的缩放设置可由 mode_specific_inputs 覆盖 (m9_target_width 为 0 表示不缩放)
+        if mode_specific_inputs and 'm9_target_width' in mode_specific_inputs:
+            context.mode_config.m9_target_width = int(mode_specific_inputs['m9_target_width'] or 0)
+            context.mode_config.m9_resize_enabled = context.mode_config.m9_target_width > 0
+            logger.info(f"Mode 9: Using target_width from inputs: {context.mode_config.m9_target_width}")
+
         logger.info(f"Mode 9 Input directory: {getattr(context.mode_config, 'm9_actual_input_dir', 'Not set')}")
         logger.info(f"Mode 9 WebP output directory: {getattr(context.mode_config, 'm9_actual_output_webp_dir', 'Not set')}")
         logger.info(f"Mode 9 ZIP file path: {getattr(context.mode_config, 'm9_actual_zip_filepath', 'Not set')}")
@@ -494,6 +531,11 @@ def execute_mode(context: AppContext, mode_number: int, mode_specific_inputs: di
              logger.warning("Mode 9: WebP output directory is not set, cannot create it.")
 
 
+    elif mode_number == 11:
+        if mode_specific_inputs and mode_specific_inputs.get('m11_state_name'):
+            context.mode_config.m11_state_name = mode_specific_inputs['m11_state_name']
+        logger.info(f"Mode 11: Capturing screen state template '{context.mode_config.m11_state_name}'.")
+
     # 3. 模式调度
     module_name = f"modes.mode{mode_number}"
     logger.info(f"Attempting to import {module_name}...")
@@ -530,6 +572,11 @@ def execute_mode(context: AppContext, mode_number: int, mode_specific_inputs: di
         logger.error(f"Could not import mode module {module_name}. Ensure 'modes/mode{mode_number}.py' exists and is correct.")
     except Exception as mode_exc:
         logger.exception(f"An error occurred while executing mode {mode_number} ({module_name}): {mode_exc}")
+    finally:
+        # 保存本次运行学到的界面切换耗时 (global_settings.adaptive_delay_enabled)
+        learner = getattr(context.shared, 'delay_learner', None)
+        if learner is not None:
+            learner.save()
 
 # --- 辅助函数 ---
 def is_admin():
@@ -756,4 +803,5 @@ def main():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # 打包为 exe 后模式9 的转换进程池需要
     main()
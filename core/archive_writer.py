@@ -0,0 +1,159 @@
+# core/archive_writer.py
+"""
+流式 ZIP 写入。
+
+模式9 的输出几乎都是已压缩的图片 (WebP/PNG/JPEG)，再用 DEFLATE 压缩只会浪费 CPU；
+ZipArchiveWriter 按扩展名选择压缩方式 (图片 STORED，文本类 DEFLATED)，
+并以固定大小的块把文件或内存中的编码结果直接写入 ZIP，不经过中间目录、也不整体缓存归档内容。
+所有条目都允许 ZIP64，归档超过 4 GB 或 65535 个条目时仍然有效。
+
+更新已有归档时:
+    - 只新增条目：以追加模式打开原文件 (只重写中央目录)；
+    - 需要替换已有条目：写入临时文件，先原样复制未被替换的条目，commit() 时替换原文件；
+    - fresh=True：忽略原有内容，写入临时文件后替换 (与原 create_zip_archive 的 'w' 模式一致)。
+事先不知道哪些条目会被替换时 (例如边遍历边转换)，写入与原有条目同名的条目也是允许的：
+先追加为重复条目，commit() 时再整理一次归档，只保留每个名称最后写入的内容。
+"""
+import os
+import time
+import shutil
+import zipfile
+import logging
+import warnings
+
+COPY_CHUNK_SIZE = 1024 * 1024
+STORED_EXTENSIONS = ('.webp', '.png', '.jpg', '.jpeg', '.gif', '.zip', '.7z', '.mp4', '.mkv')
+
+
+def compression_for(name: str) -> int:
+    """已压缩格式使用 ZIP_STORED，其余 (文本、清单等) 使用 ZIP_DEFLATED。"""
+    return zipfile.ZIP_STORED if name.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+
+
+class ZipArchiveWriter:
+    """向 zip_path 写入条目；必须调用 commit() (或作为上下文管理器正常退出) 才会生效。"""
+
+    def __init__(self, zip_path: str, replace_names=(), fresh: bool = False, logger=None):
+        self.zip_path = zip_path
+        self.logger = logger or logging.getLogger(__name__)
+        self.names_written = []
+        self.tmp_path = None
+        zip_dir = os.path.dirname(zip_path)
+        if zip_dir:
+            os.makedirs(zip_dir, exist_ok=True)
+
+        existing = []
+        if not fresh and os.path.exists(zip_path):
+            with zipfile.ZipFile(zip_path, 'r') as old_zip:
+                existing = old_zip.infolist()
+        replace_set = {name.replace(os.sep, '/') for name in replace_names}
+
+        self._superseded = set()
+        if existing and not any(info.filename in replace_set for info in existing):
+            self._zip = zipfile.ZipFile(zip_path, 'a', allowZip64=True)
+            self._names = {info.filename for info in existing}
+            return
+
+        self.tmp_path = f"{zip_path}.tmp"
+        self._zip = zipfile.ZipFile(self.tmp_path, 'w', allowZip64=True)
+        self._names = set()
+        if existing:
+            kept = 0
+            with zipfile.ZipFile(zip_path, 'r') as old_zip:
+                for info in existing:
+                    if info.filename in replace_set:
+                        continue
+                    # 沿用原条目的压缩方式；STORED 条目 (图片) 的复制只是字节搬运
+                    with old_zip.open(info) as src, self._zip.open(info, 'w', force_zip64=True) as dst:
+                        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+                    self._names.add(info.filename)
+                    kept += 1
+            self.logger.debug(f"重建 ZIP '{zip_path}'：保留 {kept} 个条目，替换 {len(replace_set)} 个。")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+    def _new_info(self, name: str, date_time=None) -> zipfile.ZipInfo:
+        name = name.replace(os.sep, '/')
+        if name in self.names_written:
+            raise ValueError(f"条目 '{name}' 已在本次写入过")
+        if name in self._names:
+            self._superseded.add(name)  # 替换原有条目，commit() 时整理
+        info = zipfile.ZipInfo(name, date_time=date_time or time.localtime()[:6])
+        info.compress_type = compression_for(name)
+        info.external_attr = 0o644 << 16
+        return info
+
+    def _open_entry(self, info: zipfile.ZipInfo):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)  # 被替换条目的 "Duplicate name" 警告
+            return self._zip.open(info, 'w', force_zip64=True)
+
+    def add_file(self, name: str, file_path: str):
+        """以 COPY_CHUNK_SIZE 为块把磁盘文件写入条目 name。"""
+        date_time = time.localtime(os.path.getmtime(file_path))[:6]
+        info = self._new_info(name, date_time if date_time[0] >= 1980 else None)
+        with open(file_path, 'rb') as src, self._open_entry(info) as dst:
+            shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+        self._names.add(info.filename)
+        self.names_written.append(info.filename)
+
+    def add_bytes(self, name: str, data: bytes):
+        """把内存中的编码结果 (例如转换进程返回的 WebP 数据) 直接写入条目 name。"""
+        info = self._new_info(name)
+        with self._open_entry(info) as dst:
+            view = memoryview(data)
+            for offset in range(0, len(view), COPY_CHUNK_SIZE):
+                dst.write(view[offset:offset + COPY_CHUNK_SIZE])
+        self._names.add(info.filename)
+        self.names_written.append(info.filename)
+
+    def commit(self):
+        """写入中央目录并 (重建时) 替换原文件。"""
+        if self._zip is None:
+            return
+        self._zip.close()
+        self._zip = None
+        if self._superseded:
+            self._compact(self.tmp_path or self.zip_path)
+        if self.tmp_path:
+            os.replace(self.tmp_path, self.zip_path)
+            self.tmp_path = None
+
+    def _compact(self, path: str):
+        """去掉被替换条目的旧内容 (同名条目只保留最后一个)。"""
+        compact_path = f"{path}.compact"
+        with zipfile.ZipFile(path, 'r') as src_zip:
+            infos = src_zip.infolist()
+            last_index = {info.filename: i for i, info in enumerate(infos)}
+            with zipfile.ZipFile(compact_path, 'w', allowZip64=True) as dst_zip:
+                for i, info in enumerate(infos):
+                    if last_index[info.filename] != i:
+                        continue
+                    with src_zip.open(info) as src, dst_zip.open(info, 'w', force_zip64=True) as dst:
+                        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+        os.replace(compact_path, path)
+        self.logger.debug(f"整理 ZIP '{self.zip_path}'：替换了 {len(self._superseded)} 个条目。")
+        self._superseded = set()
+
+    def abort(self):
+        """放弃写入。重建模式下删除临时文件、原归档不变；追加模式下已追加的条目仍会保留。"""
+        if self._zip is None:
+            return
+        try:
+            self._zip.close()
+        finally:
+            self._zip = None
+            if self.tmp_path and os.path.exists(self.tmp_path):
+                try:
+                    os.remove(self.tmp_path)
+                except OSError as e:
+                    self.logger.warning(f"删除临时 ZIP 文件 '{self.tmp_path}' 失败: {e}")
+            self.tmp_path = None
@@ -0,0 +1,310 @@
+# core/capture.py
+"""
+屏幕截图后端层。
+
+所有屏幕读取 (区域截图、单点取色) 都经过这里的后端对象，具体后端在
+config.json 的 global_settings.capture_backend 中选择:
+    - "pyautogui": 默认，兼容性最好。
+    - "mss":       基于 GDI 的快速截图。
+    - "dxcam":     基于 Desktop Duplication 的高帧率截图 (仅 Windows)。
+    - "replay":    从 global_settings.capture_replay_dir 目录中按顺序回放已录制的帧，
+                   用于离线调试、基准测试和无桌面环境下运行。帧按显式的 step() (每次点击) 前进，
+                   或在 global_settings.capture_replay_frame_interval > 0 时按时钟前进。
+
+区域格式统一为屏幕绝对坐标 (left, top, width, height)，返回 RGB 模式的 PIL Image。
+"""
+import os
+import time
+import logging
+import threading
+from PIL import Image
+
+DEFAULT_CAPTURE_BACKEND = "pyautogui"
+REPLAY_FRAME_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+class CaptureBackend:
+    """截图后端基类。子类至少需要实现 grab() 和 screen_size()。"""
+
+    name = "base"
+    simulated = False  # True 表示画面来自回放而非真实窗口 (点击不操作鼠标，只推进帧)
+
+    def step(self, count: int = 1):
+        """推进回放帧；实时后端无操作。"""
+        pass
+
+    def grab(self, region: tuple) -> Image.Image:
+        """截取屏幕区域 (left, top, width, height)，返回 RGB 图像。"""
+        raise NotImplementedError
+
+    def pixel(self, x: int, y: int) -> tuple:
+        """获取屏幕坐标 (x, y) 处的 RGB 颜色。"""
+        img = self.grab((x, y, 1, 1))
+        try:
+            return img.getpixel((0, 0))[:3]
+        finally:
+            img.close()
+
+    def screen_size(self) -> tuple:
+        """返回 (宽, 高)，用于坐标越界检查。"""
+        raise NotImplementedError
+
+    def client_rect(self, window):
+        """
+        返回窗口客户区在屏幕上的 (left, top, width, height)。
+        返回 None 表示由调用方通过 win32 API 计算 (实时屏幕后端均如此)。
+        """
+        return None
+
+    def close(self):
+        pass
+
+
+class PyAutoGuiBackend(CaptureBackend):
+    name = "pyautogui"
+
+    def __init__(self):
+        import pyautogui
+        self._pyautogui = pyautogui
+
+    def grab(self, region: tuple) -> Image.Image:
+        img = self._pyautogui.screenshot(region=tuple(region))
+        return img if img.mode == 'RGB' else img.convert('RGB')
+
+    def pixel(self, x: int, y: int) -> tuple:
+        return tuple(self._pyautogui.pixel(x, y))
+
+    def screen_size(self) -> tuple:
+        return tuple(self._pyautogui.size())
+
+
+class MssBackend(CaptureBackend):
+    name = "mss"
+
+    def __init__(self):
+        import mss
+        self._mss = mss
+        # mss 实例不能跨线程共享，每个线程各持有一个
+        self._local = threading.local()
+        with mss.mss() as sct:
+            virtual = sct.monitors[0]
+            self._screen_size = (virtual['width'], virtual['height'])
+
+    def _sct(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is None:
+            sct = self._mss.mss()
+            self._local.sct = sct
+        return sct
+
+    def grab(self, region: tuple) -> Image.Image:
+        left, top, width, height = region
+        shot = self._sct().grab({'left': int(left), 'top': int(top), 'width': int(width), 'height': int(height)})
+        return Image.frombytes('RGB', shot.size, shot.bgra, 'raw', 'BGRX')
+
+    def screen_size(self) -> tuple:
+        return self._screen_size
+
+    def close(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is not None:
+            sct.close()
+            self._local.sct = None
+
+
+class DxcamBackend(CaptureBackend):
+    name = "dxcam"
+
+    def __init__(self):
+        import dxcam
+        self._camera = dxcam.create(output_color="RGB")
+        if self._camera is None:
+            raise RuntimeError("dxcam.create() 未返回可用的输出设备。")
+        self._lock = threading.Lock()
+        self._last_frame = None
+
+    def _full_frame(self):
+        # 画面未变化时 dxcam.grab() 返回 None，此时沿用上一帧
+        with self._lock:
+            frame = self._camera.grab()
+            if frame is not None:
+                self._last_frame = frame
+            if self._last_frame is None:
+                raise RuntimeError("dxcam 尚未获取到任何帧。")
+            return self._last_frame
+
+    def grab(self, region: tuple) -> Image.Image:
+        left, top, width, height = (int(v) for v in region)
+        frame = self._full_frame()
+        return Image.fromarray(frame[top:top + height, left:left + width].copy())
+
+    def pixel(self, x: int, y: int) -> tuple:
+        frame = self._full_frame()
+        return tuple(int(c) for c in frame[int(y), int(x)][:3])
+
+    def screen_size(self) -> tuple:
+        return (self._camera.width, self._camera.height)
+
+    def close(self):
+        try:
+            self._camera.release()
+        except Exception:
+            pass
+
+
+class ReplayBackend(CaptureBackend):
+    """
+    从目录中按文件名顺序回放已录制的客户区帧。
+    每帧视为整个客户区，客户区原点固定为屏幕 (0, 0)；播放完后循环。
+    grab() 本身不前进，同一界面上的多次截图 (例如 wait_until_stable 的连续采样) 看到的是同一帧，
+    与实时画面静止时的行为一致。帧在 step() (click_coordinates 每次点击调用) 时前进；
+    frame_interval > 0 时改为按录制时的帧间隔随时钟前进，此时 step() 无效。
+    """
+
+    name = "replay"
+    simulated = True
+
+    def __init__(self, frames_dir: str, frame_interval: float = 0.0):
+        if not frames_dir or not os.path.isdir(frames_dir):
+            raise FileNotFoundError(f"回放帧目录不存在: '{frames_dir}'")
+        self.frames_dir = frames_dir
+        self.frame_paths = sorted(
+            os.path.join(frames_dir, name) for name in os.listdir(frames_dir)
+            if name.lower().endswith(REPLAY_FRAME_EXTENSIONS)
+        )
+        if not self.frame_paths:
+            raise FileNotFoundError(f"回放帧目录 '{frames_dir}' 中没有可用的帧图片。")
+        self._lock = threading.Lock()
+        self._index = 0
+        self.frame_interval = max(0.0, float(frame_interval or 0.0))
+        self._start = time.perf_counter()
+        self._cached_index = None
+        self._cached_frame = None
+        first = self._load(0)
+        self._size = first.size
+
+    def _load(self, index: int) -> Image.Image:
+        if self._cached_index != index:
+            with Image.open(self.frame_paths[index]) as img:
+                self._cached_frame = img.convert('RGB')
+            self._cached_index = index
+        return self._cached_frame
+
+    def _current_index(self) -> int:
+        if self.frame_interval > 0:
+            return int((time.perf_counter() - self._start) / self.frame_interval) % len(self.frame_paths)
+        return self._index
+
+    def step(self, count: int = 1):
+        with self._lock:
+            self._index = (self._index + count) % len(self.frame_paths)
+
+    def current_frame(self) -> Image.Image:
+        with self._lock:
+            return self._load(self._current_index())
+
+    def grab(self, region: tuple) -> Image.Image:
+        left, top, width, height = (int(v) for v in region)
+        with self._lock:
+            frame = self._load(self._current_index())
+            return frame.crop((left, top, left + width, top + height))
+
+    def pixel(self, x: int, y: int) -> tuple:
+        return self.current_frame().getpixel((int(x), int(y)))[:3]
+
+    def screen_size(self) -> tuple:
+        return self._size
+
+    def client_rect(self, window):
+        return (0, 0, self._size[0], self._size[1])
+
+
+def create_capture_backend(name: str, replay_dir: str = None, replay_frame_interval: float = 0.0) -> CaptureBackend:
+    """按名称创建截图后端。未知名称会抛出 ValueError。"""
+    name = (name or DEFAULT_CAPTURE_BACKEND).lower()
+    if name == "pyautogui":
+        return PyAutoGuiBackend()
+    if name == "mss":
+        return MssBackend()
+    if name == "dxcam":
+        return DxcamBackend()
+    if name == "replay":
+        return ReplayBackend(replay_dir, replay_frame_interval)
+    raise ValueError(f"未知的截图后端: '{name}'")
+
+
+def get_capture_backend(context) -> CaptureBackend:
+    """
+    获取 (并缓存于 context.shared.capture_backend) 当前配置的截图后端。
+    配置的后端初始化失败时记录警告并回退到 pyautogui。
+    """
+    shared = getattr(context, 'shared', None)
+    backend = getattr(shared, 'capture_backend', None)
+    if backend is not None:
+        return backend
+
+    logger = getattr(shared, 'logger', logging)
+    app_config = getattr(shared, 'app_config', None) or {}
+    gs = app_config.get('global_settings', {})
+    backend_name = gs.get('capture_backend', DEFAULT_CAPTURE_BACKEND)
+    replay_dir = gs.get('capture_replay_dir', '')
+    replay_interval = gs.get('capture_replay_frame_interval', 0.0)
+
+    try:
+        backend = create_capture_backend(backend_name, replay_dir, replay_interval)
+        logger.info(f"截图后端: {backend.name}")
+    except Exception as e:
+        logger.warning(f"初始化截图后端 '{backend_name}' 失败 ({e})，回退到 {DEFAULT_CAPTURE_BACKEND}。")
+        backend = create_capture_backend(DEFAULT_CAPTURE_BACKEND)
+
+    if shared is not None:
+        shared.capture_backend = backend
+    return backend
+
+
+def release_capture_backend(context):
+    """释放当前缓存的截图后端 (例如切换配置后)。"""
+    shared = getattr(context, 'shared', None)
+    backend = getattr(shared, 'capture_backend', None)
+    if backend is not None:
+        backend.close()
+        shared.capture_backend = None
+
+
+def benchmark_capture_backend(backend: CaptureBackend, region: tuple, iterations: int = 100) -> dict:
+    """
+    测量后端截取指定屏幕区域的吞吐量。
+
+    返回:
+        dict: {'backend', 'iterations', 'total_s', 'ms_per_frame', 'fps'}
+    """
+    iterations = max(1, int(iterations))
+    backend.grab(region).close() # 预热 (dxcam/mss 首次调用较慢)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        backend.grab(region).close()
+    total = time.perf_counter() - start
+    return {
+        'backend': backend.name,
+        'iterations': iterations,
+        'total_s': total,
+        'ms_per_frame': total * 1000.0 / iterations,
+        'fps': iterations / total if total > 0 else float('inf'),
+    }
+
+
+if __name__ == '__main__':
+    import sys
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # 用法: python -m core.capture [后端名...] ; replay 需要设置环境变量 NCA_REPLAY_DIR
+    names = sys.argv[1:] or ["pyautogui", "mss", "dxcam"]
+    for backend_name in names:
+        try:
+            b = create_capture_backend(backend_name, os.environ.get("NCA_REPLAY_DIR"))
+        except Exception as e:
+            logging.warning(f"跳过后端 {backend_name}: {e}")
+            continue
+        w, h = b.screen_size()
+        result = benchmark_capture_backend(b, (0, 0, min(w, 1920), min(h, 1080)), iterations=50)
+        logging.info(f"{result['backend']}: {result['ms_per_frame']:.2f} ms/帧, {result['fps']:.1f} fps")
+        b.close()
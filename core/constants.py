@@ -23,6 +23,32 @@ WINDOW_RESTORE_DELAY = 1.0  # 窗口恢复时的等待
 POST_SHOW_WINDOW_DELAY = 0.1  # ShowWindow 后的短暂等待
 POST_WINDOW_ACTIVATION_DELAY = 0.5  # 窗口激活操作后的等待
 
+# core/utils.py - wait_until_stable (画面稳定检测，固定延迟仅作为上限)
+STABILITY_MIN_WAIT = 0.15  # 点击后至少等待这么久再开始判断，给游戏响应点击的时间
+STABILITY_SAMPLE_INTERVAL = 0.05  # 两次采样之间的间隔
+STABILITY_REQUIRED_SAMPLES = 2  # 至少连续多少个采样间隔无变化才视为稳定
+STABILITY_WINDOW = 0.2  # 无变化的采样须持续的最短时间 (秒)，与 STABILITY_REQUIRED_SAMPLES 同时满足才视为稳定
+STABILITY_DIFF_THRESHOLD = 2.0  # 缩小后灰度图的平均绝对差低于此值视为无变化 (0-255)
+STABILITY_SAMPLE_WIDTH = 160  # 采样帧缩小到的宽度 (像素)
+
+# core/window_geometry.py - 窗口几何缓存
+GEOMETRY_CHECK_INTERVAL = 0.1  # 窗口几何缓存两次检查窗口位置之间的最短间隔 (秒)
+
+# core/screen_state.py - 界面状态识别 (默认不启用；模板由模式11采集，目录相对于程序目录)
+SCREEN_STATE_TEMPLATE_DIR = "screen_states"
+SCREEN_STATE_FINEST_WIDTH = 320  # 金字塔最细一级的宽度 (像素)
+SCREEN_STATE_PYRAMID_LEVELS = 3  # 金字塔级数 (每级宽度减半)
+SCREEN_STATE_MATCH_THRESHOLD = 12.0  # 最细一级平均灰度差低于此值视为匹配 (0-255)
+SCREEN_STATE_COARSE_SLACK = 2.0  # 逐级淘汰候选时阈值的放宽倍数
+SCREEN_STATE_EXPECT_TIMEOUT = 1.0  # expect_screen_state 的默认等待时间 (秒)
+SCREEN_STATE_CLICK_RETRIES = 2  # 点击后未进入预期界面时重新点击的次数
+# 模板文件名 (不含扩展名) 约定
+SCREEN_STATE_BRACKET = "bracket_view"
+SCREEN_STATE_PLAYER_DETAIL = "player_detail"
+SCREEN_STATE_TEAM_VIEW = "team_view"
+SCREEN_STATE_RESULT_OVERLAY = "result_overlay"
+SCREEN_STATE_REPLAY_PLAYING = "replay_playing"
+
 # core/player_processing.py
 POST_WINDOW_ACTIVATION_SHORT_DELAY = 0.2
 
@@ -77,6 +103,12 @@ _PRED_PLAYER_DETAILINFO_3_ABS = (2200, 2000)
 _PRED_PLAYER_INFO_3_REGION_ABS = (1433, 1768, 2417, 1850) # player info panel 3
 _PRED_PLAYER_DETAILINFO_CLOSE_ABS = (2418, 202) # 已根据用户反馈统一为X值较小的那个 (原为3500,200)
 
+# 界面状态模板的默认比较区域 (core/screen_state.py)，可由 global_settings.screen_state_regions 覆盖；
+# 未列出的状态比较整个客户区。玩家详情只比较不随玩家变化的队伍按钮一栏。
+SCREEN_STATE_DEFAULT_REGIONS = {
+    SCREEN_STATE_PLAYER_DETAIL: _to_rel_region((1433, 1000, 2417, 1130)),
+}
+
 # 相对坐标 (这些是主要使用的)
 PRED_PLAYER1_ENTRY_REL = _to_rel_coord(_PRED_PLAYER1_COORD_ABS)
 PRED_PLAYER2_ENTRY_REL = _to_rel_coord(_PRED_PLAYER2_COORD_ABS)
@@ -241,6 +273,7 @@ R_DELAY_AFTER_SECOND_MATCH_ENTRY = 0.5 # mode6 中已用，这里明确
 R_DELAY_BETWEEN_MATCHES_IN_GROUP = 1.0 # mode6 中已用 (cc.R_DELAY_BETWEEN_MATCHES_IN_GROUP)，这里明确
 
 R_NUM_TOTAL_GROUPS = 8 # 假设总组数 (用于 mode6)
+R_COLOR_PROBE_RADIUS = 2 # 模式6/7/8 颜色判断时对每个检查点取 (2r+1)^2 邻域的平均颜色
 
 # 模式6/7/8 颜色判断逻辑的结构化常量 (针对4in2阶段)
 # R_MATCH_NAMES = ["8in4_1", "8in4_2", "8in4_3", "8in4_4", "4in2_1", "4in2_2", "2in1"] # 假设的比赛名称顺序
@@ -0,0 +1,182 @@
+# core/conversion_manifest.py
+"""
+模式9 增量转换清单。
+
+清单保存在 WebP 输出目录旁 (<输出目录名>_manifest.json)，为每个输入图片 (相对输入目录的路径) 记录:
+    size, mtime_ns, sha256   输入文件的大小、修改时间和内容哈希
+    settings                 转换参数 (质量/无损/method，或 {'copy': True} 表示原样复制)
+    output                   输出名 (相对 WebP 输出目录、以 '/' 分隔)，重新运行时沿用，保证 ZIP 内名称稳定
+    archived                 是否已写入 ZIP
+    dhash, dims, hash_size   去重启用时代表图的感知哈希 (十六进制)、尺寸和计算哈希所用的 hash_size (见 core.image_dedup)
+    duplicate_of             重复图片对应的代表图 (输入路径键)；此时 output 为代表图的输出名
+
+再次运行时，大小和修改时间都没变的输入直接视为未变化；只有二者之一变化时才重新计算哈希，
+因此 "touch 过但内容没变" 的文件也不会重新转换。输入文件被删除 (例如 delete_originals_after_webp)
+后，其记录和 ZIP 条目保留，归档按天累积。
+"""
+import os
+import json
+import hashlib
+import logging
+
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = "_manifest.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def manifest_path_for(output_dir: str) -> str:
+    """WebP 输出目录对应的清单路径 (与输出目录同级)。"""
+    output_dir = os.path.normpath(output_dir)
+    return os.path.join(os.path.dirname(output_dir), f"{os.path.basename(output_dir)}{MANIFEST_SUFFIX}")
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ConversionManifest:
+    """输入图片 -> 输出文件的转换记录。"""
+
+    def __init__(self, path: str, input_dir: str, output_dir: str, logger=None):
+        self.path = path
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.logger = logger or logging.getLogger(__name__)
+        self.entries = {}
+        self._dirty = False
+        self.load()
+
+    def key_for(self, input_path: str) -> str:
+        return os.path.relpath(input_path, self.input_dir).replace(os.sep, '/')
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != MANIFEST_VERSION:
+                self.logger.warning(f"转换清单 '{self.path}' 版本不匹配，将重新转换全部图片。")
+                return
+            self.entries = data.get('entries', {})
+            self.logger.info(f"已加载转换清单 ({len(self.entries)} 条记录): {self.path}")
+        except Exception as e:
+            self.logger.warning(f"读取转换清单 '{self.path}' 失败，将重新转换全部图片: {e}")
+            self.entries = {}
+
+    def save(self) -> bool:
+        """写回清单 (先写临时文件再替换)。没有改动时不写。"""
+        if not self._dirty:
+            return True
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': MANIFEST_VERSION, 'entries': self.entries}, f, indent=1, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            return True
+        except Exception as e:
+            self.logger.error(f"保存转换清单 '{self.path}' 失败: {e}")
+            return False
+
+    @property
+    def output_names(self) -> set:
+        return {entry['output'] for entry in self.entries.values() if entry.get('output')}
+
+    def output_name_for(self, input_path: str):
+        entry = self.entries.get(self.key_for(input_path))
+        return entry.get('output') if entry else None
+
+    def output_name(self, output_path: str) -> str:
+        """输出路径 -> 清单和 ZIP 中使用的输出名。"""
+        return os.path.relpath(output_path, self.output_dir).replace(os.sep, '/')
+
+    def is_up_to_date(self, input_path: str, settings: dict, zip_exists: bool,
+                      size: int = None, mtime_ns: int = None) -> bool:
+        """
+        输入未变化、参数相同且输出仍可用 (输出文件存在，或已写入仍存在的 ZIP) 时返回 True。
+        size / mtime_ns 可由调用方提供 (例如遍历目录时已取得)，否则重新 stat。
+        内容未变但修改时间变了的文件会顺带更新记录中的 mtime。
+        """
+        entry = self.entries.get(self.key_for(input_path))
+        if not entry or entry.get('settings') != settings:
+            return False
+        output_path = os.path.join(self.output_dir, entry.get('output', ''))
+        if not (os.path.isfile(output_path) or (entry.get('archived') and zip_exists)):
+            return False
+        if size is None or mtime_ns is None:
+            stat = os.stat(input_path)
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+        if size == entry.get('size') and mtime_ns == entry.get('mtime_ns'):
+            return True
+        if size != entry.get('size') or file_sha256(input_path) != entry.get('sha256'):
+            return False
+        entry['mtime_ns'] = mtime_ns
+        self._dirty = True
+        return True
+
+    def record(self, input_path: str, output_path: str, settings: dict, extra: dict = None):
+        """记录一次成功的转换 (尚未写入 ZIP)。extra 为附加字段 (例如 dhash)。"""
+        stat = os.stat(input_path)
+        self.entries[self.key_for(input_path)] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': file_sha256(input_path),
+            'settings': settings,
+            'output': self.output_name(output_path),
+            'archived': False,
+            **(extra or {}),
+        }
+        self._dirty = True
+
+    def record_duplicate(self, input_path: str, representative_key: str, representative_output: str, settings: dict):
+        """记录一张被判定为重复的图片：不单独转换，输出沿用代表图。"""
+        stat = os.stat(input_path)
+        representative = self.entries.get(representative_key, {})
+        self.entries[self.key_for(input_path)] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': file_sha256(input_path),
+            'settings': settings,
+            'output': representative_output,
+            'archived': bool(representative.get('archived')),
+            'duplicate_of': representative_key,
+        }
+        self._dirty = True
+
+    def representatives(self, hash_size: int):
+        """
+        产出带有感知哈希的代表图 (键, 输出名, (宽, 高), 哈希整数)，用于初始化去重索引。
+        只产出以相同 hash_size 计算的哈希；不同尺寸 (或未记录尺寸) 的哈希位数不同，不能比较。
+        """
+        for key, entry in self.entries.items():
+            if (entry.get('dhash') and entry.get('dims') and not entry.get('duplicate_of')
+                    and entry.get('hash_size') == hash_size):
+                yield key, entry['output'], tuple(entry['dims']), int(entry['dhash'], 16)
+
+    def same_content(self, key: str, other_key: str) -> bool:
+        """两条记录的输入文件内容是否完全相同 (sha256 一致)。"""
+        digest = self.entries.get(key, {}).get('sha256')
+        return bool(digest) and digest == self.entries.get(other_key, {}).get('sha256')
+
+    def duplicate_map(self) -> dict:
+        """{重复图片的输入路径键: 代表图的输出名}。"""
+        return {key: entry['output'] for key, entry in sorted(self.entries.items()) if entry.get('duplicate_of')}
+
+    def mark_archived(self, output_names):
+        output_names = set(output_names)
+        for entry in self.entries.values():
+            if entry.get('output') in output_names and not entry.get('archived'):
+                entry['archived'] = True
+                self._dirty = True
+
+    def unarchived_outputs(self) -> list:
+        """已转换但尚未写入 ZIP 的输出名 (且输出文件仍存在)。"""
+        return sorted({
+            entry['output'] for entry in self.entries.values()
+            if entry.get('output') and not entry.get('archived')
+            and os.path.isfile(os.path.join(self.output_dir, entry['output']))
+        })
@@ -0,0 +1,172 @@
+# core/delay_learner.py
+"""
+自适应延迟学习器。
+
+记录每个命名界面切换 (例如 'click_detail_info_2'、'team_button_click'、'group_click')
+从点击到画面稳定实际花费的时间 (只记录在上限内检测到稳定的等待，超时不计入)，在本地 JSON 文件中保存最近的样本及 p50/p95/p99，
+下次运行时以 "配置的百分位 × (1 + 比例余量) + 固定余量" 作为该切换的等待上限。
+样本不足时使用原有的手工延迟；学习值最多放大到手工延迟的 ADAPTIVE_DELAY_MAX_FACTOR 倍。
+
+相关配置 (config.json -> global_settings):
+    adaptive_delay_enabled, adaptive_delay_stats_file, adaptive_delay_percentile,
+    adaptive_delay_margin_ratio, adaptive_delay_margin_seconds, adaptive_delay_min_samples
+"""
+import os
+import json
+import logging
+import threading
+
+DEFAULT_STATS_FILENAME = "delay_stats.json"
+ADAPTIVE_DELAY_MAX_SAMPLES = 200  # 每个切换保留的最近样本数
+ADAPTIVE_DELAY_MAX_FACTOR = 2.0  # 学习值相对手工延迟的上限倍数
+ADAPTIVE_DELAY_MIN_DELAY = 0.1  # 学习值的下限 (秒)
+
+
+def _percentile(sorted_values: list, pct: float) -> float:
+    """对已排序列表做线性插值百分位。"""
+    if not sorted_values:
+        return 0.0
+    if len(sorted_values) == 1:
+        return float(sorted_values[0])
+    rank = (len(sorted_values) - 1) * (pct / 100.0)
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    frac = rank - lower
+    return float(sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * frac)
+
+
+class DelayLearner:
+    """按切换名称记录耗时样本并给出下一次的等待上限。"""
+
+    def __init__(self, stats_path: str, percentile: float = 95, margin_ratio: float = 0.2,
+                 margin_seconds: float = 0.1, min_samples: int = 5, logger=None):
+        self.stats_path = stats_path
+        self.percentile = float(percentile)
+        self.margin_ratio = float(margin_ratio)
+        self.margin_seconds = float(margin_seconds)
+        self.min_samples = int(min_samples)
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """从 stats_path 读取历史样本；文件不存在或损坏时从空记录开始。"""
+        if not os.path.exists(self.stats_path):
+            return
+        try:
+            with open(self.stats_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            transitions = data.get('transitions', {})
+            with self._lock:
+                self._samples = {
+                    name: [float(v) for v in entry.get('samples', [])][-ADAPTIVE_DELAY_MAX_SAMPLES:]
+                    for name, entry in transitions.items()
+                }
+            self.logger.info(f"已加载 {len(self._samples)} 个界面切换的延迟统计: {self.stats_path}")
+        except Exception as e:
+            self.logger.warning(f"读取延迟统计文件 '{self.stats_path}' 失败，将重新统计: {e}")
+            self._samples = {}
+
+    def record(self, name: str, seconds: float):
+        """记录一次名为 name 的切换耗时 (秒)。"""
+        if not name or seconds is None or seconds < 0:
+            return
+        with self._lock:
+            samples = self._samples.setdefault(name, [])
+            samples.append(round(float(seconds), 4))
+            if len(samples) > ADAPTIVE_DELAY_MAX_SAMPLES:
+                del samples[:-ADAPTIVE_DELAY_MAX_SAMPLES]
+            self._dirty = True
+
+    def percentiles(self, name: str) -> dict:
+        """返回 {'count', 'p50', 'p95', 'p99'}；没有样本时返回 None。"""
+        with self._lock:
+            samples = sorted(self._samples.get(name, []))
+        if not samples:
+            return None
+        return {
+            'count': len(samples),
+            'p50': _percentile(samples, 50),
+            'p95': _percentile(samples, 95),
+            'p99': _percentile(samples, 99),
+        }
+
+    def suggest_delay(self, name: str, default_delay: float) -> float:
+        """
+        给出切换 name 的等待上限。样本数不足 min_samples 时返回 default_delay。
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(name, []))
+        if len(samples) < self.min_samples:
+            return default_delay
+        learned = _percentile(samples, self.percentile) * (1.0 + self.margin_ratio) + self.margin_seconds
+        upper = default_delay * ADAPTIVE_DELAY_MAX_FACTOR if default_delay > 0 else learned
+        return max(ADAPTIVE_DELAY_MIN_DELAY, min(learned, upper))
+
+    def save(self):
+        """把样本和百分位写回 stats_path (先写临时文件再替换)。没有新样本时不写。"""
+        with self._lock:
+            if not self._dirty:
+                return True
+            snapshot = {name: list(samples) for name, samples in self._samples.items()}
+        transitions = {}
+        for name, samples in sorted(snapshot.items()):
+            ordered = sorted(samples)
+            transitions[name] = {
+                'count': len(samples),
+                'p50': round(_percentile(ordered, 50), 4),
+                'p95': round(_percentile(ordered, 95), 4),
+                'p99': round(_percentile(ordered, 99), 4),
+                'samples': samples,
+            }
+        try:
+            stats_dir = os.path.dirname(self.stats_path)
+            if stats_dir:
+                os.makedirs(stats_dir, exist_ok=True)
+            tmp_path = f"{self.stats_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': 1, 'transitions': transitions}, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.stats_path)
+            with self._lock:
+                self._dirty = False
+            self.logger.info(f"延迟统计已保存 ({len(transitions)} 个界面切换): {self.stats_path}")
+            return True
+        except Exception as e:
+            self.logger.error(f"保存延迟统计文件 '{self.stats_path}' 失败: {e}")
+            return False
+
+
+def get_delay_learner(context):
+    """
+    获取 (并缓存于 context.shared.delay_learner) 延迟学习器。
+    global_settings.adaptive_delay_enabled 为 false 时返回 None。
+    """
+    shared = getattr(context, 'shared', None)
+    learner = getattr(shared, 'delay_learner', None)
+    if learner is not None:
+        return learner
+
+    app_config = getattr(shared, 'app_config', None) or {}
+    gs = app_config.get('global_settings', {})
+    if not gs.get('adaptive_delay_enabled', False):
+        return None
+
+    logger = getattr(shared, 'logger', logging)
+    stats_path = gs.get('adaptive_delay_stats_file') or DEFAULT_STATS_FILENAME
+    if not os.path.isabs(stats_path):
+        from .utils import get_base_path
+        stats_path = os.path.join(get_base_path(), stats_path)
+
+    learner = DelayLearner(
+        stats_path,
+        percentile=gs.get('adaptive_delay_percentile', 95),
+        margin_ratio=gs.get('adaptive_delay_margin_ratio', 0.2),
+        margin_seconds=gs.get('adaptive_delay_margin_seconds', 0.1),
+        min_samples=gs.get('adaptive_delay_min_samples', 5),
+        logger=logger,
+    )
+    if shared is not None:
+        shared.delay_learner = learner
+    return learner
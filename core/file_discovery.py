@@ -0,0 +1,85 @@
+# core/file_discovery.py
+"""
+模式9 输入文件发现。
+
+原实现对每种扩展名各调用一次 glob.glob，且只看输入目录本身。iter_image_files 改为一次 os.scandir 遍历：
+    - 可选递归进入子目录 (赛季文件夹等)，输出时保留相对路径；
+    - include / exclude 通配符 (fnmatch，不区分大小写) 同时匹配相对路径 (用 '/' 分隔) 和文件名，
+      exclude 匹配到的目录整体跳过；
+    - 最小文件大小、最小 "年龄" (修改时间距今秒数，用于跳过仍在写入的文件) 过滤；
+    - 顺序稳定：每个目录内按名称 (不区分大小写) 排序，先文件后子目录，与遍历和文件系统返回顺序无关；
+    - 以生成器逐个产出结果，调用方可以在遍历大目录树的同时开始转换。
+DirEntry.stat() 在 Windows 上直接取自目录枚举结果，不需要额外的系统调用。
+"""
+import os
+import time
+import fnmatch
+import logging
+import collections
+
+DEFAULT_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp')
+
+# path: 绝对路径；rel_path: 相对输入目录、以 '/' 分隔的路径
+DiscoveredFile = collections.namedtuple('DiscoveredFile', ['path', 'rel_path', 'size', 'mtime_ns'])
+
+
+def _matches(rel_path: str, patterns) -> bool:
+    rel_lower = rel_path.lower()
+    name_lower = rel_lower.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatchcase(rel_lower, p) or fnmatch.fnmatchcase(name_lower, p) for p in patterns)
+
+def iter_image_files(root: str, extensions=DEFAULT_IMAGE_EXTENSIONS, recursive: bool = False,
+                     include=(), exclude=(), min_size: int = 0, min_age: float = 0,
+                     skip_dirs=(), logger=None):
+    """
+    遍历 root 并逐个产出符合条件的 DiscoveredFile。
+    参数:
+        extensions: 允许的扩展名 (小写，含点)。
+        include: 非空时文件必须匹配其中之一；exclude: 匹配的文件/目录被跳过。
+        min_size: 小于此字节数的文件被跳过；min_age: 修改时间距今不足此秒数的文件被跳过。
+        skip_dirs: 不进入的目录 (例如位于输入目录内的 WebP 输出目录)。
+    """
+    logger = logger or logging.getLogger(__name__)
+    include = [p.lower() for p in include or ()]
+    exclude = [p.lower() for p in exclude or ()]
+    skip = {os.path.normcase(os.path.abspath(d)) for d in skip_dirs if d}
+    extensions = tuple(ext.lower() for ext in extensions)
+    newest_mtime_ns = (time.time() - min_age) * 1e9 if min_age else None
+
+    stack = [(root, '')]
+    while stack:
+        dir_path, rel_dir = stack.pop()
+        try:
+            with os.scandir(dir_path) as it:
+                entries = sorted(it, key=lambda e: (e.name.lower(), e.name))
+        except OSError as e:
+            logger.warning(f"无法读取目录 '{dir_path}': {e}")
+            continue
+
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}{entry.name}"
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if (recursive and not _matches(rel_path, exclude)
+                            and os.path.normcase(os.path.abspath(entry.path)) not in skip):
+                        subdirs.append((entry.path, f"{rel_path}/"))
+                    continue
+                if not entry.is_file() or not entry.name.lower().endswith(extensions):
+                    continue
+                if include and not _matches(rel_path, include):
+                    continue
+                if exclude and _matches(rel_path, exclude):
+                    continue
+                stat = entry.stat()
+            except OSError as e:
+                logger.warning(f"无法读取 '{entry.path}' 的文件信息: {e}")
+                continue
+            if stat.st_size < min_size:
+                continue
+            if newest_mtime_ns is not None and stat.st_mtime_ns > newest_mtime_ns:
+                logger.debug(f"跳过最近修改的文件 (可能仍在写入): {entry.path}")
+                continue
+            yield DiscoveredFile(entry.path, rel_path, stat.st_size, stat.st_mtime_ns)
+        # 栈后进先出，倒序压入使子目录按名称顺序处理
+        stack.extend(reversed(subdirs))
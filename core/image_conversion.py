@@ -0,0 +1,291 @@
+# core/image_conversion.py
+"""
+多进程图片转换 (模式9 的 WebP 转换)。
+
+WebP 编码 (尤其 method=6) 是纯 CPU 运算，逐张串行转换时只用到一个核心。
+convert_images_to_webp 把转换任务分发到进程池 (默认 CPU 核心数 - 1 个进程)：
+    - 同时在途的任务数限制为进程数的 TASK_WINDOW_FACTOR 倍，停止信号在一张图片的转换时间内生效；
+    - 任务可以是边遍历边产生的迭代器 (见 core.file_discovery)，遍历大目录树时转换已经开始；
+    - 结果按输入顺序汇报 (先完成的结果暂存，等待前面的图片)，日志和删除原图的顺序与串行版本一致；
+    - 输出文件名由输入的相对路径决定 (OutputNamer，按输入顺序消解重名)，与进程调度无关；
+    - 已是 WebP 的输入原样复制 (不重新编码)；
+    - 定期把进度和吞吐量 (张/秒、MB/秒) 写入日志，并通过 report_status 显示在 GUI 状态栏；
+    - target_width > 0 时先缩小到该宽度 (downscale_to_width) 再编码，编码耗时随像素数下降；
+    - in_memory=True 时工作进程返回编码后的字节而不写文件，由调用方直接写入 ZIP (见 core.archive_writer)，
+      在途和待汇报的结果总数同样受窗口限制，内存占用有上限；
+    - hash_size > 0 时工作进程顺带计算感知哈希 (dHash，见 core.image_dedup)，复用编码所需的解码结果，随结果返回。
+"""
+import io
+import os
+import time
+import shutil
+import logging
+import itertools
+import collections
+import concurrent.futures
+from PIL import Image
+from .image_dedup import dhash_image, dhash_file
+
+TASK_WINDOW_FACTOR = 2  # 每个工作进程最多排队的任务数
+PROGRESS_REPORT_INTERVAL = 1.0  # 进度汇报的最小间隔 (秒)
+
+# 单张转换结果。output_path 为输出路径 (in_memory 时为规划的路径，文件并未写入)，失败时为 None；
+# data 仅在 in_memory 时为编码后的字节，汇报给 on_result 之后即被丢弃；
+# dhash 仅在要求计算感知哈希时为 ((原图宽, 原图高), 哈希整数)，计算失败或未要求时为 None。
+ConversionResult = collections.namedtuple(
+    'ConversionResult', ['input_path', 'output_path', 'input_size', 'output_size', 'error', 'data', 'dhash'],
+    defaults=(None,))
+
+
+def default_worker_count() -> int:
+    """默认工作进程数：CPU 核心数 - 1 (至少 1 个)，留出一个核心给 GUI 和主进程。"""
+    return max(1, (os.cpu_count() or 2) - 1)
+
+class OutputNamer:
+    """
+    按输入顺序为图片分配输出名 (相对输出目录、以 '/' 分隔，保留输入的子目录结构)。
+    <子目录>/<名称><extension> 已被占用 (仅扩展名不同的同名文件，或 reserved_names 中的名称) 时
+    依次尝试 <名称>_<原扩展名><extension>、<名称>_<原扩展名>_2<extension> ……
+    """
+
+    def __init__(self, extension: str = '.webp', reserved_names=()):
+        self.extension = extension
+        self.used = {name.lower() for name in reserved_names}
+
+    def name_for(self, rel_path: str) -> str:
+        rel_dir, _, filename = rel_path.replace(os.sep, '/').rpartition('/')
+        prefix = f"{rel_dir}/" if rel_dir else ''
+        stem, ext = os.path.splitext(filename)
+        candidates = [f"{prefix}{stem}{self.extension}", f"{prefix}{stem}_{ext.lstrip('.').lower()}{self.extension}"]
+        name = next((c for c in candidates if c.lower() not in self.used), None)
+        counter = 2
+        while name is None:
+            candidate = f"{prefix}{stem}_{ext.lstrip('.').lower()}_{counter}{self.extension}"
+            if candidate.lower() not in self.used:
+                name = candidate
+            counter += 1
+        self.used.add(name.lower())
+        return name
+
+def plan_output_paths(image_paths: list, output_dir: str, extension: str = '.webp', reserved_names=()) -> list:
+    """为同一目录下的输入图片确定输出路径 (与输入顺序一一对应)，命名规则见 OutputNamer。"""
+    namer = OutputNamer(extension, reserved_names)
+    return [os.path.join(output_dir, namer.name_for(os.path.basename(path))) for path in image_paths]
+
+def downscale_to_width(img: Image.Image, target_width: int) -> Image.Image:
+    """
+    把图片等比缩小到 target_width 宽 (不放大)。
+    大整数倍部分走快速路径：JPEG 用 draft() 在解码时按 1/2、1/4、1/8 缩小，其余格式用 reduce() 做整数倍盒式缩小；
+    剩余的非整数比例再用 LANCZOS 缩放到精确宽度。需在图片解码前调用才能用上 draft()。
+    """
+    if not target_width or img.width <= target_width:
+        return img
+    target_size = (int(target_width), max(1, round(img.height * target_width / img.width)))
+    if img.format == 'JPEG':
+        img.draft(img.mode, target_size)  # 解码尺寸不会小于 target_size
+    factor = img.width // target_size[0]
+    if factor >= 2:
+        img = img.reduce(factor)
+    if img.size != target_size:
+        img = img.resize(target_size, Image.LANCZOS)
+    return img
+
+def _try_dhash(func, *args):
+    """感知哈希失败不影响转换本身，只是该图片不参与去重。"""
+    try:
+        return func(*args)
+    except Exception:
+        return None
+
+def convert_to_webp_file(input_path: str, output_path: str, quality: int, lossless: bool, method: int,
+                         in_memory: bool = False, target_width: int = 0, hash_size: int = 0) -> ConversionResult:
+    """
+    在工作进程中执行的单张转换 (不依赖 context，可被 pickle)。
+    target_width > 0 时先缩小到该宽度；in_memory 为 True 时不写文件，编码结果放在 ConversionResult.data 中返回。
+    hash_size > 0 时在编码用的 (已缩小的) 图像上计算 dHash，放在 ConversionResult.dhash 中返回。
+    输入已是 WebP 时原样复制 (不缩放、不重新编码)，需要哈希时单独以缩小的尺寸解码一次。
+    """
+    try:
+        input_size = os.path.getsize(input_path)
+        if not in_memory:
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        if input_path.lower().endswith('.webp'):
+            dhash = _try_dhash(dhash_file, input_path, hash_size) if hash_size else None
+            if in_memory:
+                with open(input_path, 'rb') as f:
+                    data = f.read()
+                return ConversionResult(input_path, output_path, input_size, len(data), None, data, dhash)
+            if os.path.abspath(input_path) != os.path.abspath(output_path):
+                shutil.copy2(input_path, output_path)
+            return ConversionResult(input_path, output_path, input_size, input_size, None, None, dhash)
+        with Image.open(input_path) as img:
+            original_size = img.size
+            img = downscale_to_width(img, target_width)
+            dhash = None
+            if hash_size:
+                value = _try_dhash(dhash_image, img, hash_size)
+                dhash = (original_size, value) if value is not None else None
+            if img.mode not in ('RGB', 'RGBA'):
+                has_alpha = img.mode == 'LA' or (img.mode == 'P' and 'transparency' in img.info)
+                img = img.convert('RGBA' if has_alpha and lossless else 'RGB')
+            elif img.mode == 'RGBA' and not lossless:
+                img = img.convert('RGB')  # 有损压缩时去掉透明通道
+            save_params = {'format': 'WEBP', 'method': int(method)}
+            if lossless:
+                save_params['lossless'] = True
+            else:
+                save_params['quality'] = int(quality)
+            if in_memory:
+                buffer = io.BytesIO()
+                img.save(buffer, **save_params)
+                data = buffer.getvalue()
+                return ConversionResult(input_path, output_path, input_size, len(data), None, data, dhash)
+            tmp_path = f"{output_path}.part"
+            img.save(tmp_path, **save_params)
+        os.replace(tmp_path, output_path)
+        return ConversionResult(input_path, output_path, input_size, os.path.getsize(output_path), None, None, dhash)
+    except Exception as e:
+        try:
+            if os.path.exists(f"{output_path}.part"):
+                os.remove(f"{output_path}.part")
+        except OSError:
+            pass
+        return ConversionResult(input_path, None, 0, 0, str(e), None)
+
+
+class ConversionProgress:
+    """统计已完成的转换数量、字节数及吞吐量，并按间隔汇报。"""
+
+    def __init__(self, total, report, interval: float = PROGRESS_REPORT_INTERVAL):
+        """total 为 None 表示总数未知 (任务边遍历边产生)。"""
+        self.total = total
+        self.report = report
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.start = time.perf_counter()
+        self._last_report = 0.0
+
+    def add(self, result: ConversionResult):
+        self.done += 1
+        if result.error or not result.output_path:
+            self.failed += 1
+        self.input_bytes += result.input_size
+        self.output_bytes += result.output_size
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self.report(self.summary())
+
+    def summary(self) -> str:
+        elapsed = max(time.perf_counter() - self.start, 1e-6)
+        count = f"{self.done}/{self.total}" if self.total is not None else f"{self.done}"
+        return (f"已转换 {count} 张 (失败 {self.failed})，"
+                f"{self.done / elapsed:.1f} 张/秒，{self.input_bytes / elapsed / 1048576:.1f} MB/秒")
+
+
+def convert_images_to_webp(context, tasks, quality: int = 85, lossless: bool = False, method: int = 4,
+                           workers: int = 0, on_result=None, in_memory: bool = False,
+                           target_width: int = 0, total: int = None, hash_size: int = 0) -> list:
+    """
+    用进程池把图片转换为 WebP。
+    参数:
+        tasks: (输入路径, 输出路径) 的可迭代对象，可以是生成器 (按需取用，不会一次性展开)。
+        workers: 工作进程数，0 表示自动 (default_worker_count)；1 表示在当前进程内串行转换。
+        on_result: 可选回调 on_result(result)，按输入顺序对每个结果调用一次 (例如删除原图、写入 ZIP)。
+        in_memory: 为 True 时不写输出文件，on_result 收到的结果带有编码后的 data。
+        target_width: 大于 0 时把宽度超过它的图片等比缩小到该宽度后再编码。
+        total: 已知的任务总数，仅用于进度显示。
+        hash_size: 大于 0 时工作进程同时计算该尺寸的 dHash (ConversionResult.dhash)。
+    返回:
+        按输入顺序排列的 ConversionResult 列表 (不含 data)；被停止时只包含已汇报的部分。
+    """
+    from .utils import check_stop_signal, report_status
+    logger = getattr(context.shared, 'logger', logging)
+    tasks = iter(tasks)
+    workers = int(workers) if workers else default_worker_count()
+    if total is not None:
+        workers = max(1, min(workers, total))
+
+    def report(text):
+        logger.info(f"WebP 转换进度: {text}")
+        report_status(context, f"模式9: {text}")
+
+    progress = ConversionProgress(total, report)
+    results = []
+
+    def emit(result):
+        results.append(result._replace(data=None))
+        progress.add(result)
+        if on_result is not None:
+            on_result(result)
+
+    first_task = next(tasks, None)
+    if first_task is None:
+        return results
+    tasks = itertools.chain([first_task], tasks)
+    count_text = f"{total} 张" if total is not None else "图片"
+    logger.info(f"开始转换{count_text}为 WebP (进程数: {workers}, 质量: {quality}, 无损: {lossless}, "
+                f"method: {method}, 目标宽度: {target_width or '不缩放'})")
+    if workers <= 1:
+        for input_path, output_path in tasks:
+            if check_stop_signal(context):
+                logger.info("WebP 转换被停止。")
+                break
+            emit(convert_to_webp_file(input_path, output_path, quality, lossless, method, in_memory, target_width,
+                                      hash_size))
+        report(progress.summary())
+        return results
+
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    pending = {}  # 任务序号 -> future
+    finished = {}  # 已完成但前面还有未完成任务的结果
+    inputs = {}  # 任务序号 -> 输入路径 (工作进程异常时用于汇报)
+    next_submit = 0
+    next_emit = 0
+    exhausted = False
+    stopped = False
+    try:
+        while True:
+            # 待汇报的结果也计入窗口：前面某张图片特别慢时不会无限积压已完成的结果
+            while not (stopped or exhausted) and len(pending) + len(finished) < workers * TASK_WINDOW_FACTOR:
+                task = next(tasks, None)
+                if task is None:
+                    exhausted = True
+                    break
+                input_path, output_path = task
+                inputs[next_submit] = input_path
+                pending[next_submit] = executor.submit(
+                    convert_to_webp_file, input_path, output_path, quality, lossless, method, in_memory, target_width,
+                    hash_size)
+                next_submit += 1
+            if not pending:
+                break
+            done, _ = concurrent.futures.wait(list(pending.values()), timeout=0.2,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for index in [i for i, f in pending.items() if f in done]:
+                future = pending.pop(index)
+                try:
+                    finished[index] = future.result()
+                except Exception as e:  # 例如工作进程异常退出
+                    finished[index] = ConversionResult(inputs[index], None, 0, 0, str(e), None)
+            while next_emit in finished:
+                inputs.pop(next_emit, None)
+                emit(finished.pop(next_emit))
+                next_emit += 1
+            if not stopped and check_stop_signal(context):
+                stopped = True
+                for future in pending.values():
+                    future.cancel()
+                pending = {i: f for i, f in pending.items() if not f.cancelled()}
+                logger.info(f"WebP 转换被停止，等待 {len(pending)} 个正在进行的转换结束。")
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    if stopped:
+        # 停止时已完成的结果仍按顺序汇报，之后的空缺不再等待
+        for index in sorted(finished):
+            emit(finished[index])
+    report(progress.summary())
+    return results
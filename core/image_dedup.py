@@ -0,0 +1,80 @@
+# core/image_dedup.py
+"""
+模式9 近重复图片去重。
+
+同一玩家的阵容在 mode1/2/6/8 的多次运行中会被反复截取，赛季归档里大量图片几乎相同。
+这里为每张图片计算 dHash (差值哈希：缩小为 (N+1)xN 灰度图后比较相邻像素，得到 N*N 位)，
+尺寸相同且汉明距离不超过阈值的图片视为重复，只转换、归档第一张 (代表图)，
+其余的对应关系写入映射文件 (DUPLICATE_MAP_FILENAME)。
+
+哈希在转换进程中复用编码所需的解码结果计算 (见 core.image_conversion 的 hash_size)，不占用主进程。
+按输入顺序贪心分组：每张图片只与之前已确定的代表图比较，结果按输入顺序汇报时即可判断，
+与进程调度无关；代表图的哈希保存在转换清单中，下次运行新增的图片也能与旧图去重。
+"""
+import numpy as np
+from PIL import Image
+
+DUPLICATE_MAP_FILENAME = "duplicates.json"
+DEFAULT_HASH_SIZE = 8
+DEFAULT_MAX_DISTANCE = 4
+
+
+def dhash_image(img: Image.Image, hash_size: int = DEFAULT_HASH_SIZE) -> int:
+    """计算 dHash (hash_size * hash_size 位的整数)。"""
+    small = img.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR, reducing_gap=2.0)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def dhash_file(path: str, hash_size: int = DEFAULT_HASH_SIZE) -> tuple:
+    """返回 ((宽, 高), dHash)。JPEG 通过 draft() 以缩小的尺寸解码。"""
+    with Image.open(path) as img:
+        size = img.size
+        if img.format == 'JPEG':
+            img.draft('L', (max(hash_size * 8, 64), max(hash_size * 8, 64)))
+        return size, dhash_image(img, hash_size)
+
+
+class DuplicateIndex:
+    """代表图的 (尺寸, 哈希) 索引，用 NumPy 一次性计算与所有代表图的汉明距离。"""
+
+    def __init__(self, max_distance: int = DEFAULT_MAX_DISTANCE, hash_size: int = DEFAULT_HASH_SIZE):
+        self.max_distance = int(max_distance)
+        self.hash_size = int(hash_size)
+        self._keys = []
+        self._positions = {}
+        self._sizes = np.zeros((16, 2), dtype=np.int64)
+        self._hashes = np.zeros((16, (hash_size * hash_size + 7) // 8), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _hash_bytes(self, value: int) -> np.ndarray:
+        return np.frombuffer(value.to_bytes(self._hashes.shape[1], 'big'), dtype=np.uint8)
+
+    def add(self, key, size: tuple, value: int):
+        """登记代表图 key；同一 key 再次登记时覆盖原值。"""
+        position = self._positions.get(key)
+        if position is None:
+            position = len(self._keys)
+            if position == len(self._sizes):
+                self._sizes = np.concatenate([self._sizes, np.zeros_like(self._sizes)])
+                self._hashes = np.concatenate([self._hashes, np.zeros_like(self._hashes)])
+            self._keys.append(key)
+            self._positions[key] = position
+        self._sizes[position] = size
+        self._hashes[position] = self._hash_bytes(value)
+
+    def find(self, size: tuple, value: int):
+        """返回与 (size, value) 重复的代表图 key (距离最小者，同距离取最早登记的)；没有则返回 None。"""
+        count = len(self._keys)
+        if not count:
+            return None
+        same_size = np.all(self._sizes[:count] == np.asarray(size, dtype=np.int64), axis=1)
+        if not same_size.any():
+            return None
+        diff = np.bitwise_xor(self._hashes[:count], self._hash_bytes(value))
+        distances = np.unpackbits(diff, axis=1).sum(axis=1)
+        distances[~same_size] = self.hash_size * self.hash_size + 1
+        best = int(np.argmin(distances))
+        return self._keys[best] if distances[best] <= self.max_distance else None
@@ -0,0 +1,97 @@
+# core/intro_cache.py
+"""
+模式10 片头缓存。
+
+片头 (阵容对比图 + 胜负标记编码成的 2 秒视频) 只由两张阵容截图、胜负结果和输出参数决定。
+IntroClipCache 以这些输入的哈希为键，把编码好的片头保存在磁盘缓存目录中，
+重试合成或重新导出同一局时直接复用，跳过阵容图渲染和片头编码。
+
+缓存按最近使用时间 (LRU) 淘汰：命中时更新文件的修改时间，写入新片头后按修改时间从旧到新删除，
+直到条目数和总大小都不超过上限。缓存文件写入临时名后再改名，不会读到写了一半的片头。
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+
+HASH_CHUNK_SIZE = 1024 * 1024
+CACHE_SUFFIX = ".mp4"
+
+
+def intro_cache_key(image_paths, is_win, params: dict) -> str:
+    """按阵容截图内容、胜负结果和输出参数计算缓存键 (sha256 十六进制)。"""
+    digest = hashlib.sha256()
+    for path in image_paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        digest.update(b'\0')
+    digest.update(json.dumps({'is_win': is_win, 'params': params}, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class IntroClipCache:
+    """磁盘上的片头缓存 (每个条目一个 <键>.mp4 文件)。"""
+
+    def __init__(self, cache_dir: str, max_entries: int = 32, max_bytes: int = 512 * 1024 * 1024, logger=None):
+        self.cache_dir = cache_dir
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(0, int(max_bytes))
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}{CACHE_SUFFIX}")
+
+    def get(self, key: str):
+        """命中时返回缓存文件路径并刷新其最近使用时间；未命中返回 None。"""
+        path = self.path_for(key)
+        with self._lock:
+            if not os.path.isfile(path):
+                return None
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+        return path
+
+    def put(self, key: str, clip_path: str) -> str:
+        """把已编码的片头移入缓存并返回缓存路径；随后按 LRU 淘汰超出上限的条目。"""
+        path = self.path_for(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._lock:
+            shutil.move(clip_path, tmp_path)  # 临时目录与缓存目录可能不在同一磁盘
+            os.replace(tmp_path, path)
+            self._evict(keep=path)
+        return path
+
+    def _evict(self, keep: str):
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(CACHE_SUFFIX) and entry.is_file():
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError as e:
+            self.logger.warning(f"无法读取片头缓存目录 '{self.cache_dir}': {e}")
+            return
+        entries.sort()  # 最久未使用的在前
+        total = sum(size for _, size, _ in entries)
+        count = len(entries)
+        for _, size, path in entries:
+            if count <= self.max_entries and (not self.max_bytes or total <= self.max_bytes):
+                break
+            if os.path.normcase(path) == os.path.normcase(keep):
+                continue
+            try:
+                os.remove(path)
+            except OSError as e:  # 例如另一个任务正在读取
+                self.logger.debug(f"淘汰片头缓存 '{path}' 失败: {e}")
+                continue
+            count -= 1
+            total -= size
+            self.logger.debug(f"已淘汰片头缓存: {os.path.basename(path)}")
@@ -0,0 +1,126 @@
+# core/job_queue.py
+"""
+后台后期处理队列。
+
+模式10 原来在 record_single_match 中同步调用 FFmpeg，合成完成前不能开始下一局的阵容截图和录制，
+5 局的会话时间被编码时间串行拉长。PostProcessQueue 用固定数量的工作线程 (FFmpeg 本身是子进程，
+线程只负责等待) 依次执行提交的任务，UI 自动化可以立即继续下一局:
+    - 并发数有上限 (max_workers)，避免多个编码同时抢占录制所需的 CPU；
+    - 任务的开始/完成/失败写入日志，并通过 utils.report_status 显示在 GUI 状态栏；
+    - wait() 等待队列清空 (模式结束时调用)；收到停止信号后尚未开始的任务被取消，正在执行的任务自行响应停止 (模式10 会终止 FFmpeg 子进程)；
+    - close() 结束工作线程。
+"""
+import time
+import queue
+import logging
+import threading
+import collections
+
+from .utils import report_status
+
+# name: 任务名称 (日志/状态栏显示)；result: 任务函数返回值；error: 异常 (成功时为 None)；elapsed: 用时 (秒)
+JobResult = collections.namedtuple('JobResult', ['name', 'result', 'error', 'elapsed'])
+
+
+class PostProcessQueue:
+    """有界并发的后台任务队列。"""
+
+    def __init__(self, context, max_workers: int = 1, name: str = "后期处理"):
+        self.context = context
+        self.logger = getattr(context.shared, 'logger', logging)
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.results = []
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._cancelled = 0
+        self._idle = threading.Condition(self._lock)
+        self._threads = []
+
+    def _stop_requested(self) -> bool:
+        return bool(getattr(self.context.shared, 'stop_requested', False))
+
+    def _ensure_workers(self):
+        while len(self._threads) < self.max_workers:
+            thread = threading.Thread(target=self._worker, name=f"PostProcess-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, name: str, func, *args, **kwargs):
+        """提交任务 func(*args, **kwargs)；立即返回。"""
+        with self._lock:
+            self._pending += 1
+        self._queue.put((name, func, args, kwargs))
+        self.logger.info(f"[{self.name}] 已加入队列: {name}")
+        self._report()
+        self._ensure_workers()
+
+    def _report(self, text: str = None):
+        with self._lock:
+            summary = (f"{self.name}: 进行中 {self._running}，排队 {self._pending}，"
+                       f"完成 {sum(1 for r in self.results if r.error is None)}，"
+                       f"失败 {sum(1 for r in self.results if r.error is not None)}")
+        report_status(self.context, f"{summary} - {text}" if text else summary)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            name, func, args, kwargs = job
+
+            with self._lock:
+                self._pending -= 1
+                if self._stop_requested():
+                    self._cancelled += 1
+                    self._idle.notify_all()
+                    skip = True
+                else:
+                    self._running += 1
+                    skip = False
+            if skip:
+                self.logger.warning(f"[{self.name}] 已收到停止信号，取消未开始的任务: {name}")
+                continue
+
+            self._report(f"开始 {name}")
+            start = time.time()
+            result, error = None, None
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                error = e
+                self.logger.exception(f"[{self.name}] 任务失败: {name}: {e}")
+            elapsed = time.time() - start
+            with self._lock:
+                self._running -= 1
+                self.results.append(JobResult(name, result, error, elapsed))
+                self._idle.notify_all()
+            if error is None:
+                self.logger.info(f"[{self.name}] 任务完成: {name} (用时 {elapsed:.1f}s)")
+                self._report(f"完成 {name}")
+            else:
+                self._report(f"失败 {name}: {error}")
+
+    def wait(self, timeout: float = None) -> bool:
+        """等待所有已提交的任务结束 (或被取消)。超时返回 False。"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            while self._pending or self._running:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(1.0 if remaining is None else min(1.0, remaining))
+        return True
+
+    def close(self):
+        """通知工作线程在处理完已提交的任务后退出。"""
+        for _ in self._threads:
+            self._queue.put(None)
+        self._threads = []
+
+    def summary(self) -> str:
+        ok = sum(1 for r in self.results if r.error is None)
+        failed = len(self.results) - ok
+        return f"{self.name}共 {len(self.results) + self._cancelled} 个任务：成功 {ok}，失败 {failed}，取消 {self._cancelled}。"
@@ -4,7 +4,7 @@ import time
 import logging
 import datetime
 
-from .utils import click_coordinates, take_screenshot, stitch_images_horizontally, check_stop_signal # stitch_images_horizontally 稍后添加
+from .utils import click_coordinates, take_screenshot, stitch_images_horizontally, check_stop_signal, wait_for_transition, get_output_extension # stitch_images_horizontally 稍后添加
 from .player_processing import collect_player_data
 from . import constants as core_constants
 
@@ -178,13 +178,13 @@ def process_match_flow(
         if close_result_rel:
             if check_stop_signal(context): return None
             logger.info(f"  ({match_name}) 尝试关闭赛果界面 (无图拼接)...")
-            click_coordinates(context, close_result_rel, nikke_window)
-            time.sleep(delay_after_close_result)
+            click_coordinates(context, close_result_rel, nikke_window, wait_after=False)
+            wait_for_transition(context, nikke_window, 'close_result', core_constants.UNIVERSAL_ACTION_DELAY + delay_after_close_result)
         return None
 
     # 最终拼接的图片保存到基于 context.shared.base_output_dir 的路径
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    final_stitched_filename = f"{file_prefix}_overview_{timestamp}.png"
+    final_stitched_filename = f"{file_prefix}_overview_{timestamp}{get_output_extension(context)}"
     final_stitched_path = os.path.join(base_output_dir, final_stitched_filename)
     
     # 确保 base_output_dir 存在
@@ -210,8 +210,8 @@ def process_match_flow(
         if close_result_rel:
             if check_stop_signal(context): return None
             logger.info(f"  ({match_name}) 拼接失败，尝试关闭赛果界面...")
-            click_coordinates(context, close_result_rel, nikke_window)
-            time.sleep(delay_after_close_result)
+            click_coordinates(context, close_result_rel, nikke_window, wait_after=False)
+            wait_for_transition(context, nikke_window, 'close_result', core_constants.UNIVERSAL_ACTION_DELAY + delay_after_close_result)
         return None
     
     logger.info(f"  ({match_name}) 总览图片已成功横向拼接至: {final_stitched_path}")
@@ -223,12 +223,12 @@ def process_match_flow(
             return final_stitched_path # 总览图已生成
 
         logger.info(f"  ({match_name}) 点击关闭赛果界面: {close_result_rel}")
-        if not click_coordinates(context, close_result_rel, nikke_window):
+        if not click_coordinates(context, close_result_rel, nikke_window, wait_after=False):
             logger.warning(f"  ({match_name}) 未能点击关闭赛果界面坐标 {close_result_rel}。")
             # 即使关闭失败，总览图已生成
         else:
-            logger.info(f"  ({match_name}) 等待 {delay_after_close_result} 秒...")
-            time.sleep(delay_after_close_result)
+            logger.info(f"  ({match_name}) 等待画面稳定 (最长 {delay_after_close_result} 秒)...")
+            wait_for_transition(context, nikke_window, 'close_result', core_constants.UNIVERSAL_ACTION_DELAY + delay_after_close_result)
             if check_stop_signal(context):
                 logger.info(f"操作在等待关闭赛果后被取消 ({match_name})，总览图: {final_stitched_path}")
                 return final_stitched_path
@@ -9,8 +9,32 @@ import datetime # 新增 datetime
 from PIL import Image
 
 # 从 core.utils 导入必要的函数
-from .utils import click_coordinates, take_screenshot, stitch_images_vertically, check_stop_signal
+from .utils import click_coordinates, capture_client_frame, stitch_images_vertically, check_stop_signal, wait_for_transition
 from . import constants as core_constants
+from .screen_state import expect_screen_state
+
+def _capture_frame_for_state(context, nikke_window, logger):
+    """激活窗口后为当前界面状态截取一帧客户区 (内存)。"""
+    try:
+        if hasattr(nikke_window, 'activate'): nikke_window.activate()
+        time.sleep(core_constants.POST_WINDOW_ACTIVATION_SHORT_DELAY)
+    except Exception as e_act:
+        logger.debug(f"    尝试激活窗口时出现轻微问题: {e_act}")
+    return capture_client_frame(context, nikke_window)
+
+def _discard_frame(frame):
+    """释放一帧截图 (界面状态改变后调用)，始终返回 None 以便直接赋值。"""
+    if frame is not None:
+        frame.close()
+    return None
+
+def _close_images(images: list):
+    """关闭内存中的截图对象。"""
+    for img in images:
+        try:
+            img.close()
+        except Exception:
+            pass
 
 def collect_player_data(
     context, # 新增 context 参数
@@ -29,7 +53,8 @@ def collect_player_data(
     """
     处理单个玩家的完整信息和队伍截图流程。
     内部使用 context.shared.nikke_window, context.shared.logger。
-    临时文件路径基于 context.shared.base_temp_dir 和传入的 temp_file_prefix。
+    各区域截图从每个界面状态的单帧客户区截图中在内存里裁剪，只有最终的拼接图写入磁盘，
+    路径基于 context.shared.base_temp_dir 和传入的 temp_file_prefix。
     在适当位置调用 core.utils.check_stop_signal(context) 并提前返回。
 
     参数:
@@ -76,23 +101,46 @@ def collect_player_data(
         logger.info(f"操作在点击玩家入口前被取消 ({temp_file_prefix})。")
         return None
     logger.info(f"  点击玩家入口: {player_entry_coord_rel}")
-    if not click_coordinates(context, player_entry_coord_rel, nikke_window): # 传递 context
+    if not click_coordinates(context, player_entry_coord_rel, nikke_window, wait_after=False): # 传递 context
         error_msg = f"错误 ({temp_file_prefix})：未能点击玩家入口 {player_entry_coord_rel}。"
         logger.error(error_msg)
         if hasattr(context, 'shared'):
             context.shared.final_message = error_msg
         return None
-    logger.info(f"  等待 {initial_delay_after_entry} 秒...")
-    time.sleep(initial_delay_after_entry)
+    logger.info(f"  等待画面稳定 (最长 {initial_delay_after_entry} 秒)...")
+    wait_for_transition(context, nikke_window, 'player_entry', core_constants.UNIVERSAL_ACTION_DELAY + initial_delay_after_entry)
     if check_stop_signal(context):
         logger.info(f"操作在进入玩家界面后被取消 ({temp_file_prefix})。")
         return None
+    # 启用界面状态识别时确认已进入玩家详情：点击未生效则立即重新点击，仍未进入则放弃该玩家，不截取错误的画面。
+    # 无法判断 (未启用或没有该状态的模板) 时按原流程继续。
+    in_detail = expect_screen_state(context, nikke_window, core_constants.SCREEN_STATE_PLAYER_DETAIL)
+    retries = 0
+    while in_detail is False and retries < core_constants.SCREEN_STATE_CLICK_RETRIES:
+        if check_stop_signal(context):
+            return None
+        retries += 1
+        logger.warning(f"  未识别到玩家详情界面，重新点击玩家入口 ({retries}/{core_constants.SCREEN_STATE_CLICK_RETRIES}): {player_entry_coord_rel}")
+        click_coordinates(context, player_entry_coord_rel, nikke_window, wait_after=False)
+        wait_for_transition(context, nikke_window, 'player_entry', core_constants.UNIVERSAL_ACTION_DELAY + initial_delay_after_entry)
+        in_detail = expect_screen_state(context, nikke_window, core_constants.SCREEN_STATE_PLAYER_DETAIL)
+    if check_stop_signal(context):
+        return None
+    if in_detail is False:
+        error_msg = f"错误 ({temp_file_prefix})：点击玩家入口 {player_entry_coord_rel} 后未进入玩家详情界面。"
+        logger.error(error_msg)
+        if hasattr(context, 'shared'):
+            context.shared.final_message = error_msg
+        return None
 
     # 2. 处理玩家信息区域截图 (根据 player_info_regions_config)
+    # 截图只在内存中裁剪：同一界面状态只截取一帧客户区，点击后该帧失效，下次截图时重新截取。
+    current_frame = None
     logger.info(f"  开始处理玩家信息区域截图...")
     for i, config_item in enumerate(player_info_regions_config):
         if check_stop_signal(context):
             logger.info(f"操作在处理玩家信息区域 {i} 前被取消 ({temp_file_prefix})。")
+            _close_images(all_player_screenshots)
             return None # 或者根据逻辑决定是否可以继续部分操作
         action_type = config_item.get('type')
         item_delay_after = config_item.get('delay_after', 0.5) # 每个动作后的默认延迟
@@ -104,23 +152,17 @@ def collect_player_data(
                 logger.warning(f"    配置项 {region_name} 缺少 'region_rel'，跳过截图。")
                 continue
 
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            screenshot_filename = f"{temp_file_prefix}_{region_name}_{timestamp}.png"
-            screenshot_path = os.path.join(current_player_temp_dir, screenshot_filename) # 使用新的临时目录
-            logger.info(f"    截图 '{region_name}' 到 {screenshot_path} (区域: {region_rel})")
+            if current_frame is None:
+                current_frame = _capture_frame_for_state(context, nikke_window, logger)
+            region_image = current_frame.crop(region_rel) if current_frame else None
+            logger.info(f"    截图 '{region_name}' (区域: {region_rel})")
 
-            try:
-                if hasattr(nikke_window, 'activate'): nikke_window.activate()
-                time.sleep(core_constants.POST_WINDOW_ACTIVATION_SHORT_DELAY)
-            except Exception as e_act:
-                logger.debug(f"    尝试激活窗口时出现轻微问题: {e_act}")
-
-            if take_screenshot(context, region_rel, nikke_window, screenshot_path): # 传递 context
-                all_player_screenshots.append(screenshot_path)
+            if region_image is not None:
+                all_player_screenshots.append(region_image)
                 logger.info(f"    截图 '{region_name}' 成功。")
             else:
-                logger.warning(f"    未能截取 '{region_name}' ({screenshot_path})。")
-            time.sleep(item_delay_after)
+                logger.warning(f"    未能截取 '{region_name}'。")
+            # 内存截图不改变界面状态，因此截图项的 delay_after 不再需要等待
 
         elif action_type == 'click':
             coord_rel = config_item.get('coord_rel')
@@ -130,14 +172,18 @@ def collect_player_data(
                 continue
 
             logger.info(f"    点击 '{click_name}' (坐标: {coord_rel})")
-            if not click_coordinates(context, coord_rel, nikke_window): # 传递 context
+            if not click_coordinates(context, coord_rel, nikke_window, wait_after=False): # 传递 context
                 logger.warning(f"    未能点击 '{click_name}' ({coord_rel})。")
-            time.sleep(item_delay_after)
+            current_frame = _discard_frame(current_frame)
+            wait_for_transition(context, nikke_window, click_name, core_constants.UNIVERSAL_ACTION_DELAY + item_delay_after)
         else:
             logger.warning(f"    未知的 player_info_regions_config 类型: {action_type}，跳过。")
         if check_stop_signal(context):
             logger.info(f"操作在处理玩家信息区域 {i} 后被取消 ({temp_file_prefix})。")
+            _discard_frame(current_frame)
+            _close_images(all_player_screenshots)
             return None
+    current_frame = _discard_frame(current_frame)
     logger.info(f"  玩家信息区域处理完毕。")
 
     # 3. 循环处理5个队伍
@@ -145,37 +191,34 @@ def collect_player_data(
     for i, team_coord_rel in enumerate(team_button_coords_rel):
         if check_stop_signal(context):
             logger.info(f"操作在处理队伍 {i+1} 前被取消 ({temp_file_prefix})。")
+            _close_images(all_player_screenshots)
             return None
         team_num = i + 1
         logger.info(f"    处理队伍 {team_num}，点击坐标: {team_coord_rel}")
-        if not click_coordinates(context, team_coord_rel, nikke_window): # 传递 context
+        if not click_coordinates(context, team_coord_rel, nikke_window, wait_after=False): # 传递 context
             logger.warning(f"    未能点击队伍 {team_num} ({team_coord_rel})，跳过此队伍。")
             continue
 
-        logger.info(f"    等待 {delay_after_team_click} 秒...")
-        time.sleep(delay_after_team_click)
+        logger.info(f"    等待画面稳定 (最长 {delay_after_team_click} 秒)...")
+        wait_for_transition(context, nikke_window, 'team_button_click', core_constants.UNIVERSAL_ACTION_DELAY + delay_after_team_click)
         if check_stop_signal(context):
             logger.info(f"操作在点击队伍 {team_num} 后被取消 ({temp_file_prefix})。")
+            _close_images(all_player_screenshots)
             return None
 
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        team_screenshot_filename = f"{temp_file_prefix}_team_{team_num}_{timestamp}.png"
-        team_screenshot_path = os.path.join(current_player_temp_dir, team_screenshot_filename) # 使用新的临时目录
-        logger.info(f"    截图队伍 {team_num} 到 {team_screenshot_path} (区域: {team_screenshot_region_rel})")
-
-        try:
-            if hasattr(nikke_window, 'activate'): nikke_window.activate()
-            time.sleep(core_constants.POST_WINDOW_ACTIVATION_SHORT_DELAY)
-        except Exception as e_act:
-            logger.debug(f"    尝试激活窗口时出现轻微问题: {e_act}")
+        logger.info(f"    截图队伍 {team_num} (区域: {team_screenshot_region_rel})")
+        team_frame = _capture_frame_for_state(context, nikke_window, logger)
+        team_image = team_frame.crop(team_screenshot_region_rel) if team_frame else None
+        _discard_frame(team_frame)
 
-        if take_screenshot(context, team_screenshot_region_rel, nikke_window, team_screenshot_path): # 传递 context
-            all_player_screenshots.append(team_screenshot_path)
+        if team_image is not None:
+            all_player_screenshots.append(team_image)
             logger.info(f"    截图队伍 {team_num} 成功。")
         else:
-            logger.warning(f"    未能截取队伍 {team_num} ({team_screenshot_path})。")
+            logger.warning(f"    未能截取队伍 {team_num}。")
         if check_stop_signal(context):
             logger.info(f"操作在截图队伍 {team_num} 后被取消 ({temp_file_prefix})。")
+            _close_images(all_player_screenshots)
             return None
     logger.info(f"  队伍截图处理完毕。")
 
@@ -195,10 +238,10 @@ def collect_player_data(
                 # context.shared.final_message = f"操作取消 ({temp_file_prefix})：关闭空视图前。" # 取消一般不设为final_message
                 return None
             logger.info(f"  尝试关闭玩家视图 ({temp_file_prefix})，即使没有截图...")
-            if not click_coordinates(context, close_player_view_coord_rel, nikke_window): # 传递 context
+            if not click_coordinates(context, close_player_view_coord_rel, nikke_window, wait_after=False): # 传递 context
                 logger.warning(f"  未能点击关闭玩家视图坐标 {close_player_view_coord_rel} ({temp_file_prefix})。")
             else:
-                time.sleep(delay_after_close_view)
+                wait_for_transition(context, nikke_window, 'close_player_view', core_constants.UNIVERSAL_ACTION_DELAY + delay_after_close_view)
         return None
 
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -209,6 +252,7 @@ def collect_player_data(
 
     if check_stop_signal(context):
         logger.info(f"操作在拼接图片前被取消 ({temp_file_prefix})。")
+        _close_images(all_player_screenshots)
         return None
     if not stitch_images_vertically(context, all_player_screenshots, stitched_image_path): # 传递 context
         error_msg = f"错误 ({temp_file_prefix})：垂直拼接玩家截图失败。"
@@ -222,25 +266,16 @@ def collect_player_data(
                 # context.shared.final_message = f"操作取消 ({temp_file_prefix})：关闭拼接失败视图前。"
                 return None
             logger.info(f"  拼接失败 ({temp_file_prefix})，但仍尝试关闭玩家视图...")
-            if not click_coordinates(context, close_player_view_coord_rel, nikke_window): # 传递 context
+            if not click_coordinates(context, close_player_view_coord_rel, nikke_window, wait_after=False): # 传递 context
                 logger.warning(f"  未能点击关闭玩家视图坐标 {close_player_view_coord_rel} ({temp_file_prefix})。")
             else:
-                time.sleep(delay_after_close_view)
+                wait_for_transition(context, nikke_window, 'close_player_view', core_constants.UNIVERSAL_ACTION_DELAY + delay_after_close_view)
         return None
 
     logger.info(f"  玩家 {temp_file_prefix} 的截图已成功垂直拼接至: {stitched_image_path}")
 
-    # 5. (可选) 清理单个截图文件 (在拼接成功后)
-    # 注意：如果拼接后的图片与原始截图在同一目录，并且后续流程需要这个目录（例如打包），则不应删除
-    # 这里假设 current_player_temp_dir 只是临时存放，最终的拼接图会被移走或复制
-    logger.info(f"  清理 {temp_file_prefix} 的单个截图文件...")
-    for temp_path in all_player_screenshots:
-        if os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-                logger.debug(f"    已删除临时文件: {temp_path}")
-            except OSError as e:
-                logger.warning(f"    无法删除临时文件 {temp_path}: {e}")
+    # 5. 释放内存中的单个截图
+    _close_images(all_player_screenshots)
 
     # 6. 点击关闭玩家界面 (如果提供了坐标)
     if close_player_view_coord_rel:
@@ -248,11 +283,11 @@ def collect_player_data(
             logger.info(f"操作在最后关闭视图前被取消 ({temp_file_prefix})。")
             return stitched_image_path # 即使取消，拼接图已生成
         logger.info(f"  点击关闭玩家视图: {close_player_view_coord_rel}")
-        if not click_coordinates(context, close_player_view_coord_rel, nikke_window): # 传递 context
+        if not click_coordinates(context, close_player_view_coord_rel, nikke_window, wait_after=False): # 传递 context
             logger.warning(f"  未能点击关闭玩家视图坐标 {close_player_view_coord_rel}。")
         else:
-            logger.info(f"  等待 {delay_after_close_view} 秒...")
-            time.sleep(delay_after_close_view)
+            logger.info(f"  等待画面稳定 (最长 {delay_after_close_view} 秒)...")
+            wait_for_transition(context, nikke_window, 'close_player_view', core_constants.UNIVERSAL_ACTION_DELAY + delay_after_close_view)
             if check_stop_signal(context):
                 logger.info(f"操作在等待关闭视图后被取消 ({temp_file_prefix})。")
                 return stitched_image_path # 拼接图已生成
@@ -0,0 +1,109 @@
+# core/recording_watcher.py
+"""
+模式10 录像文件交接。
+
+原来的 get_latest_video 在停止录制后固定等待 3 秒，再按扩展名 glob 源目录并取修改时间最新的文件；
+录屏软件缓冲较大时，可能拿到尚未写完的文件，甚至上一局的文件。RecordingWatcher 改为:
+    1. snapshot(): 开始录制前记录源目录中已有的视频文件 (名称 -> 大小、修改时间)；
+    2. wait_for_recording(): 停止录制后只关注快照之外的新文件 (或快照中被继续写入的文件)，
+       等待其大小在 stable_seconds 内不再变化，并且 (Windows 上) 可以被独占重命名，即录屏软件已释放文件；
+       满足条件后立即返回该文件，没有固定等待。
+每次轮询只对源目录做一次 os.scandir，并只 stat 新出现的视频文件。
+"""
+import os
+import time
+import logging
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.mov', '.flv', '.ts')
+
+
+def is_file_released(path: str) -> bool:
+    """
+    文件是否已被写入方释放。Windows 上以原名重命名文件，写入方未以共享删除方式打开时会失败；
+    其他平台没有强制锁，始终返回 True (只依赖大小稳定判断)。
+    """
+    if os.name != 'nt':
+        return True
+    try:
+        os.replace(path, path)
+        return True
+    except OSError:
+        return False
+
+
+class RecordingWatcher:
+    """监视录屏软件输出目录，找出本次录制产生的文件。"""
+
+    def __init__(self, source_dir: str, extensions=VIDEO_EXTENSIONS, logger=None):
+        self.source_dir = source_dir
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.logger = logger or logging.getLogger(__name__)
+        self._snapshot = None
+        self._scan_error_logged = False
+
+    @property
+    def has_snapshot(self) -> bool:
+        return self._snapshot is not None
+
+    def _scan(self, known=None) -> dict:
+        """{文件路径: (大小, 修改时间)}。known 中大小和修改时间都没变的文件不会出现在结果里。"""
+        files = {}
+        try:
+            with os.scandir(self.source_dir) as it:
+                for entry in it:
+                    if not entry.name.lower().endswith(self.extensions):
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    state = (stat.st_size, stat.st_mtime_ns)
+                    if known is None or known.get(entry.path) != state:
+                        files[entry.path] = state
+        except OSError as e:
+            # 轮询期间只提示一次
+            if not self._scan_error_logged:
+                self.logger.warning(f"无法读取录像目录 '{self.source_dir}': {e}")
+                self._scan_error_logged = True
+        return files
+
+    def snapshot(self):
+        """在开始录制前调用，记录已有的视频文件。源目录未设置或不存在时不建立快照 (has_snapshot 为 False)。"""
+        self._scan_error_logged = False
+        self._snapshot = self._scan() if self.source_dir and os.path.isdir(self.source_dir) else None
+
+    def wait_for_recording(self, timeout: float = 60.0, stable_seconds: float = 1.0,
+                           poll_interval: float = 0.25, should_stop=None):
+        """
+        等待本次录制的文件写完并返回其路径；被停止、没有快照或始终没有新文件时返回 None。
+        有多个新文件时 (例如录屏软件分段或自动转封装) 取最后修改的那个。
+        超时时仍返回最后看到的新文件 (可能尚未完全写完)，并记录警告。
+        should_stop: 可选的无参函数，返回 True 时放弃等待。
+        """
+        if self._snapshot is None:
+            return None
+        deadline = time.time() + timeout
+        candidate, last_state, stable_since = None, None, None
+        while time.time() < deadline:
+            if should_stop is not None and should_stop():
+                return None
+            changed = self._scan(self._snapshot)
+            if changed:
+                path = max(changed, key=lambda p: changed[p][1])
+                state = changed[path]
+                if path != candidate or state != last_state:
+                    if path != candidate:
+                        self.logger.debug(f"检测到录像文件: {os.path.basename(path)}")
+                    candidate, last_state, stable_since = path, state, time.time()
+                elif (state[0] > 0 and time.time() - stable_since >= stable_seconds
+                      and is_file_released(path)):
+                    self.logger.info(f"录像文件已写入完成: {os.path.basename(path)} ({state[0] / 1024 / 1024:.1f} MB)")
+                    return path
+            time.sleep(poll_interval)
+        if candidate:
+            self.logger.warning(f"等待录像文件写入完成超时 ({timeout:.0f}s)，使用最新的新文件: {os.path.basename(candidate)}")
+            return candidate
+        self.logger.warning(f"{timeout:.0f}s 内录像目录中没有出现新的视频文件。")
+        return None
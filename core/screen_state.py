@@ -0,0 +1,304 @@
+# core/screen_state.py
+"""
+界面状态识别。
+
+根据预先采集的模板判断当前画面属于哪个界面状态 (赛程图、玩家详情、队伍阵容、结算弹窗、回放播放中等)，
+让各模式在点击没有生效时可以立即重试，而不是等满固定延迟后截到错误的画面。
+
+默认不启用 (global_settings.screen_state_enabled)。启用前需先采集模板：
+    在游戏中进入某个界面后运行模式11 (界面状态模板采集)，或调用 capture_state_template()，
+    当前客户区中该状态的相对区域被保存为模板目录 (global_settings.screen_state_template_dir，
+    相对路径基于程序目录，默认 screen_states) 下的 <状态名>.png，并写入 screen_states.json:
+          {"player_detail": {"file": "player_detail.png", "region": [0.3, 0.1, 0.4, 0.2], "client_size": [3840, 2160]}, ...}
+    每个状态比较的相对区域取 global_settings.screen_state_regions 中的设置，未设置时取
+    SCREEN_STATE_DEFAULT_REGIONS，仍没有则比较整个客户区。
+    没有清单时目录中的每个 <状态名>.png 视为整个客户区的截图。
+
+启用后，setup_app_environment 找到游戏窗口时即按当前客户区尺寸把模板预计算成多级灰度金字塔
+(客户区尺寸变化时重建)；识别时把当前帧缩小一次，从最粗的一级开始比较并逐级淘汰候选，单帧分类只需几毫秒。
+"""
+import os
+import json
+import time
+import logging
+from PIL import Image, ImageChops, ImageStat
+
+from . import constants as core_constants
+from .utils import capture_client_frame, get_base_path, get_screen_geometry, check_stop_signal
+
+SCREEN_STATE_MANIFEST = "screen_states.json"
+FULL_REGION = (0.0, 0.0, 1.0, 1.0)
+
+
+def _level_sizes(client_width: int, client_height: int) -> list:
+    """按当前客户区宽高比计算金字塔各级尺寸，顺序为从粗到细。"""
+    sizes = []
+    width = core_constants.SCREEN_STATE_FINEST_WIDTH
+    for _ in range(core_constants.SCREEN_STATE_PYRAMID_LEVELS):
+        height = max(1, round(width * client_height / client_width))
+        sizes.append((width, height))
+        width = max(8, width // 2)
+    return list(reversed(sizes))
+
+def _region_box(size: tuple, region_rel: tuple) -> tuple:
+    width, height = size
+    left = round(region_rel[0] * width)
+    top = round(region_rel[1] * height)
+    right = max(left + 1, left + round(region_rel[2] * width))
+    bottom = max(top + 1, top + round(region_rel[3] * height))
+    return (left, top, min(width, right), min(height, bottom))
+
+def _gray_pyramid(image: Image.Image, level_sizes: list) -> list:
+    """把整张图缩小为各级灰度图 (从粗到细)。先缩到最细一级，再由其逐级缩小。"""
+    finest = image.resize(level_sizes[-1], Image.BILINEAR, reducing_gap=2.0).convert('L')
+    levels = [finest]
+    for size in reversed(level_sizes[:-1]):
+        levels.append(levels[-1].resize(size, Image.BILINEAR))
+    return list(reversed(levels))
+
+
+class ScreenStateRecognizer:
+    """按当前客户区尺寸预计算的模板金字塔及粗到细的匹配。"""
+
+    def __init__(self, templates: dict, client_size: tuple, threshold: float, logger=None):
+        """
+        参数:
+            templates: {状态名: (该状态相对区域的 PIL Image, 相对区域 (x, y, w, h))}
+            client_size: 当前客户区 (宽, 高)。
+            threshold: 最细一级的平均灰度差 (0-255) 低于此值才认为匹配。
+        """
+        self.client_size = tuple(client_size)
+        self.threshold = float(threshold)
+        self.logger = logger or logging.getLogger(__name__)
+        self.level_sizes = _level_sizes(*self.client_size)
+        self.region_boxes = {}
+        self.pyramids = {}
+        for name, (image, region_rel) in templates.items():
+            boxes = [_region_box(size, region_rel) for size in self.level_sizes]
+            gray = image.convert('L')
+            levels = []
+            for left, top, right, bottom in reversed(boxes):  # 从最细一级开始逐级缩小
+                source = levels[-1] if levels else gray
+                levels.append(source.resize((right - left, bottom - top), Image.BILINEAR, reducing_gap=2.0))
+            self.region_boxes[name] = boxes
+            self.pyramids[name] = list(reversed(levels))
+
+    @property
+    def states(self) -> list:
+        return list(self.pyramids)
+
+    def classify_image(self, image: Image.Image):
+        """
+        对一张客户区图像分类。
+        返回:
+            (状态名或 None, 最细一级的平均灰度差)。
+        """
+        frame_levels = _gray_pyramid(image, self.level_sizes)
+        candidates = list(self.pyramids)
+        scores = {}
+        for level_index, frame_level in enumerate(frame_levels):
+            scores = {}
+            for name in candidates:
+                patch = frame_level.crop(self.region_boxes[name][level_index])
+                scores[name] = ImageStat.Stat(ImageChops.difference(patch, self.pyramids[name][level_index])).mean[0]
+            # 粗级别放宽阈值，只淘汰明显不匹配的候选
+            level_limit = self.threshold * core_constants.SCREEN_STATE_COARSE_SLACK
+            candidates = [name for name in candidates if scores[name] <= level_limit]
+            if not candidates:
+                return None, min(scores.values()) if scores else float('inf')
+        best = min(candidates, key=scores.get)
+        return (best if scores[best] <= self.threshold else None), scores[best]
+
+
+def _global_settings(context) -> dict:
+    app_config = getattr(getattr(context, 'shared', None), 'app_config', None) or {}
+    return app_config.get('global_settings', {})
+
+def screen_state_enabled(context) -> bool:
+    return bool(_global_settings(context).get('screen_state_enabled', False))
+
+def get_template_dir(context) -> str:
+    """模板目录的绝对路径 (相对路径基于程序目录，模板由用户采集，需可写)。"""
+    template_dir = _global_settings(context).get('screen_state_template_dir', core_constants.SCREEN_STATE_TEMPLATE_DIR)
+    return template_dir if os.path.isabs(template_dir) else os.path.join(get_base_path(), template_dir)
+
+def state_region(context, state_name: str) -> tuple:
+    """状态用于比较的相对区域：global_settings.screen_state_regions > SCREEN_STATE_DEFAULT_REGIONS > 整个客户区。"""
+    configured = _global_settings(context).get('screen_state_regions') or {}
+    region = configured.get(state_name) or core_constants.SCREEN_STATE_DEFAULT_REGIONS.get(state_name)
+    return tuple(region) if region else FULL_REGION
+
+
+def _read_manifest(template_dir: str, logger) -> dict:
+    manifest_path = os.path.join(template_dir, SCREEN_STATE_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"读取界面状态模板清单 '{manifest_path}' 失败: {e}")
+        return {}
+
+def _load_templates(template_dir: str, logger) -> dict:
+    """读取模板目录，返回 {状态名: (PIL Image, 相对区域)}；目录不存在时返回空字典。"""
+    if not template_dir or not os.path.isdir(template_dir):
+        return {}
+    entries = {}
+    manifest = _read_manifest(template_dir, logger)
+    if manifest:
+        for name, entry in manifest.items():
+            entries[name] = (entry.get('file', f"{name}.png"), tuple(entry.get('region', FULL_REGION)))
+    else:
+        for filename in sorted(os.listdir(template_dir)):
+            if filename.lower().endswith('.png'):
+                entries[os.path.splitext(filename)[0]] = (filename, FULL_REGION)
+
+    templates = {}
+    for name, (filename, region_rel) in entries.items():
+        path = os.path.join(template_dir, filename)
+        try:
+            with Image.open(path) as img:
+                templates[name] = (img.convert('RGB'), region_rel)
+        except Exception as e:
+            logger.warning(f"加载界面状态模板 '{path}' 失败，已跳过: {e}")
+    return templates
+
+
+def capture_state_template(context, window, state_name: str, region_rel: tuple = None):
+    """
+    把当前客户区中 state_name 的相对区域保存为模板 (<模板目录>/<状态名>.png)，并更新模板清单。
+    region_rel 为 None 时使用 state_region()。已缓存的识别器随之失效，下次使用时重建。
+    返回:
+        模板文件路径；截图或保存失败时返回 None。
+    """
+    logger = getattr(context.shared, 'logger', logging)
+    region_rel = tuple(region_rel) if region_rel else state_region(context, state_name)
+    frame = capture_client_frame(context, window)
+    if frame is None:
+        logger.error(f"采集界面状态模板 '{state_name}' 失败：无法截取客户区。")
+        return None
+    try:
+        image = frame.crop(region_rel)
+        if image is None:
+            logger.error(f"采集界面状态模板 '{state_name}' 失败：区域 {region_rel} 无效。")
+            return None
+        template_dir = get_template_dir(context)
+        os.makedirs(template_dir, exist_ok=True)
+        filename = f"{state_name}.png"
+        path = os.path.join(template_dir, filename)
+        image.save(path)
+        image.close()
+
+        manifest = _read_manifest(template_dir, logger)
+        manifest[state_name] = {
+            'file': filename,
+            'region': list(region_rel),
+            'client_size': [frame.client_width, frame.client_height],
+        }
+        manifest_path = os.path.join(template_dir, SCREEN_STATE_MANIFEST)
+        tmp_path = f"{manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, manifest_path)
+    except Exception as e:
+        logger.error(f"保存界面状态模板 '{state_name}' 失败: {e}")
+        return None
+    finally:
+        frame.close()
+    context.shared.screen_state_recognizer = None
+    logger.info(f"已采集界面状态模板 '{state_name}' (客户区 {frame.client_width}x{frame.client_height}，区域 {region_rel}): {path}")
+    return path
+
+
+def get_screen_state_recognizer(context, window):
+    """
+    获取 (并缓存于 context.shared.screen_state_recognizer) 与当前客户区尺寸匹配的识别器。
+    未启用或没有可用模板时返回 None。
+    """
+    shared = getattr(context, 'shared', None)
+    logger = getattr(shared, 'logger', logging)
+    if not screen_state_enabled(context):
+        return None
+    cached = getattr(shared, 'screen_state_recognizer', None)
+    if cached is False:
+        return None  # 已确认没有模板
+
+    geometry = get_screen_geometry(context, window)
+    if not geometry:
+        return None
+    client_size = tuple(geometry.client_rect[2:])
+    if cached is not None and cached.client_size == client_size:
+        return cached
+
+    template_dir = get_template_dir(context)
+    templates = _load_templates(template_dir, logger)
+    if not templates:
+        logger.warning(f"已启用界面状态识别，但未找到模板 ('{template_dir}')；请先运行模式11采集模板。")
+        if shared is not None:
+            shared.screen_state_recognizer = False
+        return None
+
+    start = time.perf_counter()
+    recognizer = ScreenStateRecognizer(
+        templates, client_size,
+        threshold=_global_settings(context).get('screen_state_match_threshold', core_constants.SCREEN_STATE_MATCH_THRESHOLD),
+        logger=logger,
+    )
+    for image, _ in templates.values():
+        image.close()
+    logger.info(f"界面状态识别器已就绪: {len(recognizer.states)} 个状态 {recognizer.states}，"
+                f"客户区 {client_size[0]}x{client_size[1]}，预计算耗时 {(time.perf_counter() - start) * 1000:.1f} ms")
+    if shared is not None:
+        shared.screen_state_recognizer = recognizer
+    return recognizer
+
+def init_screen_state_recognizer(context, window) -> bool:
+    """启动时 (找到游戏窗口后) 预计算模板金字塔。未启用时不做任何事。返回识别器是否可用。"""
+    if not screen_state_enabled(context):
+        return False
+    context.shared.screen_state_recognizer = None
+    return get_screen_state_recognizer(context, window) is not None
+
+
+def detect_screen_state(context, window, frame=None):
+    """
+    识别当前界面状态。frame 为可选的 ClientFrame (已截取的帧可直接复用)。
+    返回状态名；无法识别或识别器未启用时返回 None。
+    """
+    logger = getattr(context.shared, 'logger', logging)
+    recognizer = get_screen_state_recognizer(context, window)
+    if recognizer is None:
+        return None
+    own_frame = frame is None
+    if own_frame:
+        frame = capture_client_frame(context, window)
+        if frame is None:
+            return None
+    try:
+        start = time.perf_counter()
+        state, score = recognizer.classify_image(frame.image)
+        logger.debug(f"界面状态识别: {state} (差异 {score:.2f}，耗时 {(time.perf_counter() - start) * 1000:.1f} ms)")
+        return state
+    finally:
+        if own_frame:
+            frame.close()
+
+
+def expect_screen_state(context, window, expected_state: str, timeout: float = core_constants.SCREEN_STATE_EXPECT_TIMEOUT):
+    """
+    在 timeout 秒内反复识别，直到界面处于 expected_state。
+    返回:
+        True: 已确认处于 expected_state；False: 超时仍不是 (或被停止)；
+        None: 无法判断 (识别未启用或没有该状态的模板)，调用方应沿用原流程。
+    """
+    recognizer = get_screen_state_recognizer(context, window)
+    if recognizer is None or expected_state not in recognizer.states:
+        return None
+    deadline = time.perf_counter() + timeout
+    while True:
+        if detect_screen_state(context, window) == expected_state:
+            return True
+        if time.perf_counter() >= deadline or check_stop_signal(context):
+            return False
+        time.sleep(core_constants.STABILITY_SAMPLE_INTERVAL)
@@ -0,0 +1,558 @@
+# core/stitching.py
+"""
+图片拼接布局引擎。
+
+所有拼接 (垂直、水平、模式4/5 的 2x4 总览图、任意网格、模式10 的阵容卡) 都分两步完成:
+    1. 根据各输入图的尺寸计算一次布局 (LayoutPlan)：画布尺寸和每张图的放置位置；
+    2. 预先分配整张画布的 NumPy 数组，把各输入图的像素直接写入对应位置，最后只编码一次。
+与逐张 Image.paste 相比省去了中间的 PIL 画布操作，输入也可以是内存中的图像或数组。
+
+超大拼接图 (例如模式6 全部 8 组 × 7 场的赛事海报) 使用 stitch_streaming：按行条带逐条写入 PNG，
+输入图只在与当前条带相交时才解码，写完最后一个相交条带后立即释放，峰值内存与一个条带 (及其相交的输入) 成正比。
+
+输入图在共享线程池 (get_thread_pool) 上并行解码；较大的 PNG 输出按行块在线程池上并行压缩
+(encode_png_parallel，与 pigz 相同的做法：各块以前一块末尾 32KB 作为预设字典独立压缩后拼接成一个 zlib 流)。
+Pillow 和 zlib 在解码/压缩时都会释放 GIL，因此线程即可获得多核加速。
+
+此模块不依赖 core.utils，日志和停止信号由调用方处理。
+"""
+import os
+import time
+import zlib
+import struct
+import threading
+import concurrent.futures
+import numpy as np
+from PIL import Image
+
+
+class LayoutPlan:
+    """
+    拼接布局：画布尺寸 (width, height) 以及每个输入的放置框 (x, y, w, h)。
+    boxes 与输入顺序一一对应。
+    """
+
+    def __init__(self, width: int, height: int, boxes: list):
+        self.width = int(width)
+        self.height = int(height)
+        self.boxes = [tuple(int(v) for v in box) for box in boxes]
+
+    @property
+    def size(self) -> tuple:
+        return (self.width, self.height)
+
+    def __repr__(self):
+        return f"LayoutPlan({self.width}x{self.height}, {len(self.boxes)} 个输入)"
+
+
+def _align_offset(free_space: int, alignment: str) -> int:
+    if alignment == 'center':
+        return free_space // 2
+    if alignment in ('bottom', 'right'):
+        return free_space
+    return 0  # 'top' / 'left'
+
+def _gap_list(gaps, count: int) -> list:
+    """把单个间距或间距列表展开为 count 个间距 (列表不足时循环使用)。"""
+    if count <= 0:
+        return []
+    if isinstance(gaps, (list, tuple)):
+        if not gaps:
+            return [0] * count
+        return [int(gaps[i % len(gaps)]) for i in range(count)]
+    return [int(gaps)] * count
+
+
+def plan_vertical(sizes: list, alignment: str = 'center', spacing: int = 0) -> LayoutPlan:
+    """从上到下排列；alignment 为水平对齐方式 ('left', 'center', 'right')。"""
+    width = max(w for w, _ in sizes)
+    boxes = []
+    y = 0
+    for i, (w, h) in enumerate(sizes):
+        boxes.append((_align_offset(width - w, alignment), y, w, h))
+        y += h + (spacing if i < len(sizes) - 1 else 0)
+    return LayoutPlan(width, y, boxes)
+
+def plan_horizontal(sizes: list, alignment: str = 'center', spacing: int = 0) -> LayoutPlan:
+    """从左到右排列；alignment 为垂直对齐方式 ('top', 'center', 'bottom')。"""
+    height = max(h for _, h in sizes)
+    boxes = []
+    x = 0
+    for i, (w, h) in enumerate(sizes):
+        boxes.append((x, _align_offset(height - h, alignment), w, h))
+        x += w + (spacing if i < len(sizes) - 1 else 0)
+    return LayoutPlan(x, height, boxes)
+
+def plan_grid(sizes: list, columns: int, column_gaps=0, row_gaps=0, alignment: str = 'top-left',
+              cell_size: tuple = None) -> LayoutPlan:
+    """
+    按行优先排成 columns 列的网格。
+    column_gaps / row_gaps 可以是单个间距，也可以是逐个间隙的列表 (例如 [minor, major, minor])。
+    cell_size 为 None 时每列宽度取该列最宽的图、每行高度取该行最高的图；
+    alignment 为单元格内对齐方式，'top-left' 或 'center'。
+    """
+    columns = max(1, int(columns))
+    rows = (len(sizes) + columns - 1) // columns
+    if cell_size:
+        col_widths = [cell_size[0]] * columns
+        row_heights = [cell_size[1]] * rows
+    else:
+        col_widths = [0] * columns
+        row_heights = [0] * rows
+        for i, (w, h) in enumerate(sizes):
+            col_widths[i % columns] = max(col_widths[i % columns], w)
+            row_heights[i // columns] = max(row_heights[i // columns], h)
+
+    col_gap_list = _gap_list(column_gaps, columns - 1)
+    row_gap_list = _gap_list(row_gaps, rows - 1)
+    col_x = [0]
+    for c in range(1, columns):
+        col_x.append(col_x[-1] + col_widths[c - 1] + col_gap_list[c - 1])
+    row_y = [0]
+    for r in range(1, rows):
+        row_y.append(row_y[-1] + row_heights[r - 1] + row_gap_list[r - 1])
+
+    boxes = []
+    for i, (w, h) in enumerate(sizes):
+        c, r = i % columns, i // columns
+        x, y = col_x[c], row_y[r]
+        if alignment == 'center':
+            x += (col_widths[c] - w) // 2
+            y += (row_heights[r] - h) // 2
+        boxes.append((x, y, w, h))
+    width = col_x[-1] + col_widths[-1]
+    height = row_y[-1] + row_heights[-1] if rows else 0
+    return LayoutPlan(width, height, boxes)
+
+def plan_mode4_overview(sizes: list, spacing_major: int = 60, spacing_minor: int = 30) -> LayoutPlan:
+    """
+    模式4/5 总览图：8 张图排成 2 行 4 列。
+    列间距依次为 minor, major, minor，行间距为 major；单元格尺寸取第一张图的尺寸 (与原实现一致)。
+    """
+    return plan_grid(sizes, 4, column_gaps=[spacing_minor, spacing_major, spacing_minor],
+                     row_gaps=[spacing_major], cell_size=sizes[0])
+
+
+def to_rgb_array(source) -> np.ndarray:
+    """把 PIL Image 或数组转换为 (H, W, 3) 的 uint8 数组 (数组按原通道顺序使用)。"""
+    if isinstance(source, np.ndarray):
+        return source[:, :, :3] if source.ndim == 3 else np.repeat(source[:, :, None], 3, axis=2)
+    if source.mode != 'RGB':
+        source = source.convert('RGB')
+    return np.asarray(source)
+
+def render_plan(plan: LayoutPlan, sources: list, bg_color=(0, 0, 0), canvas: np.ndarray = None) -> np.ndarray:
+    """
+    按布局把各输入 (PIL Image 或 (H, W, 3) 数组) 直接写入预分配的画布数组并返回。
+    超出画布的部分会被裁掉。
+    """
+    if canvas is None:
+        canvas = np.empty((plan.height, plan.width, 3), dtype=np.uint8)
+        canvas[:, :] = bg_color
+    for source, (x, y, w, h) in zip(sources, plan.boxes):
+        if source is None:
+            continue
+        pixels = to_rgb_array(source)
+        h = min(h, pixels.shape[0], plan.height - y)
+        w = min(w, pixels.shape[1], plan.width - x)
+        if h > 0 and w > 0:
+            canvas[y:y + h, x:x + w] = pixels[:h, :w]
+    return canvas
+
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+PARALLEL_ENCODE_MIN_PIXELS = 4_000_000  # 超过此像素数的 PNG 输出才使用并行压缩
+PARALLEL_ENCODE_CHUNK_ROWS = 128  # 并行压缩时每块的行数
+DEFLATE_WINDOW = 32768
+
+_pool_lock = threading.Lock()
+_pool = None
+_pool_workers = 0
+
+
+def get_thread_pool(max_workers: int = None) -> concurrent.futures.ThreadPoolExecutor:
+    """
+    返回拼接共用的线程池。max_workers 为 None 或 <= 0 时使用 DEFAULT_WORKERS；
+    与现有线程池的线程数不同时重新创建。
+    """
+    global _pool, _pool_workers
+    workers = int(max_workers) if max_workers and max_workers > 0 else DEFAULT_WORKERS
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stitch")
+            _pool_workers = workers
+        return _pool
+
+def _decode(source):
+    if isinstance(source, Image.Image):
+        return source
+    img = Image.open(source)
+    img.load()  # 在工作线程中完成解码
+    return img
+
+def decode_images(sources: list, pool: concurrent.futures.ThreadPoolExecutor = None) -> list:
+    """
+    在线程池上并行打开并解码图片 (文件路径或 PIL Image)，按输入顺序返回。
+    任意一张失败时关闭已解码的图片并抛出该异常。
+    """
+    if pool is None or len(sources) <= 1:
+        return [_decode(source) for source in sources]
+    futures = [pool.submit(_decode, source) for source in sources]
+    images, error = [], None
+    for future in futures:
+        try:
+            images.append(future.result())
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        for img, source in zip(images, sources):
+            if img is not source:
+                img.close()
+        raise error
+    return images
+
+
+def _png_filter_up(canvas: np.ndarray) -> np.ndarray:
+    """对 (H, W, 3) 画布做 PNG "Up" 过滤，返回带过滤类型字节的扫描行 (H, W*3+1)。"""
+    height = canvas.shape[0]
+    rows = canvas.reshape(height, -1)
+    scanlines = np.empty((height, rows.shape[1] + 1), dtype=np.uint8)
+    scanlines[0, 0] = 0  # 第一行无上一行，使用 None 过滤
+    scanlines[0, 1:] = rows[0]
+    scanlines[1:, 0] = 2
+    np.subtract(rows[1:], rows[:-1], out=scanlines[1:, 1:])  # uint8 运算自动按 256 取模
+    return scanlines
+
+def _deflate_chunk(data: bytes, dictionary: bytes, level: int, last: bool) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary) if dictionary \
+        else zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_FULL_FLUSH)
+
+def encode_png_parallel(canvas: np.ndarray, output_path: str, compress_level: int = 6,
+                        pool: concurrent.futures.ThreadPoolExecutor = None,
+                        chunk_rows: int = PARALLEL_ENCODE_CHUNK_ROWS):
+    """
+    并行压缩写出 8 位 RGB PNG。扫描行按 chunk_rows 分块，各块在线程池上以原始 deflate 独立压缩
+    (以上一块末尾 32KB 作为预设字典以保持压缩率)，非最后一块以 Z_FULL_FLUSH 结束后按顺序拼接，
+    再加上 zlib 头和整体的 Adler-32 校验，得到标准的单个 IDAT 数据流。
+    """
+    height, width = canvas.shape[:2]
+    scanlines = _png_filter_up(np.ascontiguousarray(canvas[:, :, :3]))
+    row_bytes = scanlines.shape[1]
+    chunks = [scanlines[top:top + chunk_rows].tobytes() for top in range(0, height, chunk_rows)]
+    dictionaries = [b''] + [chunk[-DEFLATE_WINDOW:] for chunk in chunks[:-1]]
+    last_index = len(chunks) - 1
+    if pool is None:
+        compressed = [_deflate_chunk(c, d, compress_level, i == last_index)
+                      for i, (c, d) in enumerate(zip(chunks, dictionaries))]
+    else:
+        futures = [pool.submit(_deflate_chunk, c, d, compress_level, i == last_index)
+                   for i, (c, d) in enumerate(zip(chunks, dictionaries))]
+        compressed = [f.result() for f in futures]
+
+    adler = 1
+    for chunk in chunks:
+        adler = zlib.adler32(chunk, adler)
+
+    dir_name = os.path.dirname(output_path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    with open(output_path, 'wb') as f:
+        def write_chunk(tag, data):
+            f.write(struct.pack('>I', len(data)))
+            f.write(tag)
+            f.write(data)
+            f.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(tag)) & 0xffffffff))
+        f.write(PNG_SIGNATURE)
+        write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        # 每个压缩块单独作为一个 IDAT 块写出 (解码器按顺序拼接 IDAT 数据)
+        write_chunk(b'IDAT', b'\x78\x9c' + compressed[0])
+        for data in compressed[1:]:
+            write_chunk(b'IDAT', data)
+        write_chunk(b'IDAT', struct.pack('>I', adler & 0xffffffff))
+        write_chunk(b'IEND', b'')
+    return row_bytes * height
+
+# 输出配置 (global_settings.output_profile) 的默认值；编码格式由输出文件扩展名决定
+DEFAULT_OUTPUT_PROFILE = {
+    'format': 'png',          # 'png' / 'webp' / 'jpeg'
+    'png_compress_level': 6,  # 0-9
+    'webp_lossless': False,
+    'webp_quality': 90,       # 有损时为画质，无损时为压缩力度
+    'webp_method': 4,         # 0 (快) - 6 (小)
+    'jpeg_quality': 92,
+}
+OUTPUT_FORMAT_EXTENSIONS = {'png': '.png', 'webp': '.webp', 'jpeg': '.jpg', 'jpg': '.jpg'}
+
+
+def save_params_for(output_path: str, profile: dict = None) -> tuple:
+    """根据输出文件扩展名和输出配置返回 (Pillow 格式名, save() 参数)。"""
+    profile = {**DEFAULT_OUTPUT_PROFILE, **(profile or {})}
+    ext = os.path.splitext(output_path)[1].lower()
+    if ext == '.webp':
+        return 'WEBP', {'lossless': bool(profile['webp_lossless']), 'quality': int(profile['webp_quality']),
+                        'method': int(profile['webp_method'])}
+    if ext in ('.jpg', '.jpeg'):
+        return 'JPEG', {'quality': int(profile['jpeg_quality'])}
+    return 'PNG', {'compress_level': int(profile['png_compress_level'])}
+
+def save_image(img: Image.Image, output_path: str, profile: dict = None):
+    """按输出配置保存 PIL Image (格式由扩展名决定，自动创建目录)。"""
+    dir_name = os.path.dirname(output_path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    fmt, params = save_params_for(output_path, profile)
+    if fmt == 'JPEG' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    img.save(output_path, fmt, **params)
+
+def save_canvas(canvas: np.ndarray, output_path: str, pool: concurrent.futures.ThreadPoolExecutor = None,
+                profile: dict = None):
+    """
+    把画布数组编码保存到 output_path (自动创建目录)，格式由扩展名决定、参数取自输出配置 profile。
+    提供线程池且输出为较大的 PNG 时使用 encode_png_parallel，否则由 Pillow 编码。
+    """
+    dir_name = os.path.dirname(output_path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    fmt, params = save_params_for(output_path, profile)
+    if (pool is not None and fmt == 'PNG'
+            and canvas.shape[0] * canvas.shape[1] >= PARALLEL_ENCODE_MIN_PIXELS):
+        encode_png_parallel(canvas, output_path, compress_level=params['compress_level'], pool=pool)
+        return
+    Image.fromarray(canvas).save(output_path, fmt, **params)
+
+
+DEFAULT_STRIP_HEIGHT = 256  # 流式拼接每个条带的行数
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+class StreamingPNGWriter:
+    """
+    按行写入的 8 位 RGB PNG 编码器。每次 write_rows 的数据压缩后立即作为 IDAT 块写入文件，
+    不需要在内存中保留整张图。行数不足 height 时 close() 会抛出 ValueError。
+    """
+
+    def __init__(self, path: str, width: int, height: int, compress_level: int = 6):
+        self.path = path
+        self.width = int(width)
+        self.height = int(height)
+        self.rows_written = 0
+        dir_name = os.path.dirname(path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self._file = open(path, 'wb')
+        self._compressor = zlib.compressobj(compress_level)
+        self._file.write(PNG_SIGNATURE)
+        # IHDR: 宽, 高, 位深 8, 颜色类型 2 (RGB), 压缩 0, 过滤 0, 不隔行
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0))
+
+    def _write_chunk(self, tag: bytes, data: bytes):
+        self._file.write(struct.pack('>I', len(data)))
+        self._file.write(tag)
+        self._file.write(data)
+        self._file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(tag)) & 0xffffffff))
+
+    def write_rows(self, rows: np.ndarray):
+        """写入 (n, width, 3) 的 uint8 行数据。"""
+        n = rows.shape[0]
+        if rows.shape[1] != self.width or self.rows_written + n > self.height:
+            raise ValueError(f"行数据尺寸 {rows.shape} 与 PNG 尺寸 {self.width}x{self.height} 不符 (已写入 {self.rows_written} 行)。")
+        scanlines = np.empty((n, self.width * 3 + 1), dtype=np.uint8)
+        scanlines[:, 0] = 0  # 每行的过滤类型: None
+        scanlines[:, 1:] = rows.reshape(n, -1)
+        data = self._compressor.compress(scanlines.tobytes())
+        if data:
+            self._write_chunk(b'IDAT', data)
+        self.rows_written += n
+
+    def close(self):
+        if self._file is None:
+            return
+        try:
+            data = self._compressor.flush()
+            if data:
+                self._write_chunk(b'IDAT', data)
+            self._write_chunk(b'IEND', b'')
+        finally:
+            self._file.close()
+            self._file = None
+        if self.rows_written != self.height:
+            raise ValueError(f"PNG 只写入了 {self.rows_written}/{self.height} 行。")
+
+    def abort(self):
+        """放弃写入并删除未完成的文件。"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def read_image_sizes(paths: list) -> list:
+    """只读取文件头获取图片尺寸 (不解码像素)；路径为 None 时尺寸记为 (0, 0)。"""
+    sizes = []
+    for path in paths:
+        if path is None:
+            sizes.append((0, 0))
+            continue
+        with Image.open(path) as img:
+            sizes.append(img.size)
+    return sizes
+
+def load_for_box(source, size: tuple) -> Image.Image:
+    """打开 (或直接使用) 输入图，转换为 RGB，并在尺寸与放置框不同时缩放到该尺寸。"""
+    img = Image.open(source) if not isinstance(source, Image.Image) else source
+    if img.mode != 'RGB':
+        converted = img.convert('RGB')
+        if img is not source:
+            img.close()
+        img = converted
+    if img.size != tuple(size):
+        resized = img.resize(tuple(size), Image.LANCZOS)
+        if img is not source:
+            img.close()
+        img = resized
+    return img
+
+def stitch_streaming(plan: LayoutPlan, sources: list, output_path: str, bg_color=(0, 0, 0),
+                     strip_height: int = DEFAULT_STRIP_HEIGHT, loader=load_for_box,
+                     should_stop=None, compress_level: int = 6) -> bool:
+    """
+    按条带流式拼接并写出 PNG。
+
+    参数:
+        plan: 布局 (LayoutPlan)。
+        sources: 与 plan.boxes 对应的输入 (文件路径、PIL Image 或 None)。
+        loader: loader(source, (w, h)) -> PIL Image，在输入第一次与条带相交时调用。
+        should_stop: 可选的无参回调，返回 True 时中止并删除未完成的输出。
+    返回:
+        True 表示完整写出，False 表示被中止。
+    """
+    order = sorted(range(len(sources)), key=lambda i: plan.boxes[i][1])
+    active = {}  # 输入索引 -> 已解码的像素数组
+    next_pos = 0
+    with StreamingPNGWriter(output_path, plan.width, plan.height, compress_level) as writer:
+        for strip_top in range(0, plan.height, strip_height):
+            if should_stop and should_stop():
+                writer.abort()
+                return False
+            strip_bottom = min(plan.height, strip_top + strip_height)
+
+            # 解码从本条带开始出现的输入
+            while next_pos < len(order) and plan.boxes[order[next_pos]][1] < strip_bottom:
+                index = order[next_pos]
+                next_pos += 1
+                x, y, w, h = plan.boxes[index]
+                if sources[index] is None or w <= 0 or h <= 0 or y + h <= strip_top:
+                    continue
+                img = loader(sources[index], (w, h))
+                active[index] = np.array(img) # 复制像素后即可关闭图像
+                if img is not sources[index]:
+                    img.close()
+
+            strip = np.empty((strip_bottom - strip_top, plan.width, 3), dtype=np.uint8)
+            strip[:, :] = bg_color
+            for index in list(active):
+                pixels = active[index]
+                x, y, w, h = plan.boxes[index]
+                w = min(w, pixels.shape[1], plan.width - x)
+                top = max(y, strip_top)
+                bottom = min(y + h, y + pixels.shape[0], strip_bottom)
+                if bottom > top and w > 0:
+                    strip[top - strip_top:bottom - strip_top, x:x + w] = pixels[top - y:bottom - y, :w, :3]
+                if y + h <= strip_bottom:
+                    del active[index]  # 该输入已全部写出，释放
+            writer.write_rows(strip)
+    return True
+
+
+def benchmark_stitching(image_count: int = 8, image_size: tuple = (984, 2400), iterations: int = 5) -> dict:
+    """
+    比较逐张 Image.paste 与布局引擎 (NumPy 直接写入) 拼接 2x4 总览图的耗时 (不含编码)。
+
+    返回:
+        dict: {'paste_ms', 'blit_ms', 'speedup'}
+    """
+    rng = np.random.default_rng(0)
+    images = [Image.fromarray(rng.integers(0, 256, (image_size[1], image_size[0], 3), dtype=np.uint8))
+              for _ in range(image_count)]
+    plan = plan_mode4_overview([img.size for img in images])
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        canvas_img = Image.new('RGB', plan.size, (0, 0, 0))
+        for img, (x, y, _, _) in zip(images, plan.boxes):
+            canvas_img.paste(img, (x, y))
+    paste_ms = (time.perf_counter() - start) * 1000.0 / iterations
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        render_plan(plan, images, (0, 0, 0))
+    blit_ms = (time.perf_counter() - start) * 1000.0 / iterations
+
+    return {'paste_ms': paste_ms, 'blit_ms': blit_ms, 'speedup': paste_ms / blit_ms if blit_ms > 0 else float('inf')}
+
+
+def benchmark_overview_io(work_dir: str, image_count: int = 8, image_size: tuple = (984, 4200), workers: int = None) -> dict:
+    """
+    以模式4/5 总览图 (8 张竖长玩家图) 为基准，比较"顺序解码 + Pillow 编码"与
+    "线程池并行解码 + 并行 PNG 编码"的端到端耗时。输入图写入 work_dir。
+
+    返回:
+        dict: {'sequential_ms', 'parallel_ms', 'speedup'}
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(image_count):
+        # 带平滑渐变的随机块，压缩特性比纯噪声更接近真实截图
+        base = rng.integers(0, 256, (image_size[1] // 8, image_size[0] // 8, 3), dtype=np.uint8)
+        img = Image.fromarray(base).resize(image_size, Image.BILINEAR)
+        path = os.path.join(work_dir, f"bench_player_{i}.png")
+        img.save(path)
+        paths.append(path)
+    sizes = read_image_sizes(paths)
+    plan = plan_mode4_overview(sizes)
+
+    start = time.perf_counter()
+    images = decode_images(paths)
+    Image.fromarray(render_plan(plan, images)).save(os.path.join(work_dir, "bench_sequential.png"))
+    sequential_ms = (time.perf_counter() - start) * 1000.0
+    for img in images:
+        img.close()
+
+    pool = get_thread_pool(workers)
+    start = time.perf_counter()
+    images = decode_images(paths, pool)
+    save_canvas(render_plan(plan, images), os.path.join(work_dir, "bench_parallel.png"), pool=pool)
+    parallel_ms = (time.perf_counter() - start) * 1000.0
+    for img in images:
+        img.close()
+
+    return {'sequential_ms': sequential_ms, 'parallel_ms': parallel_ms,
+            'speedup': sequential_ms / parallel_ms if parallel_ms > 0 else float('inf')}
+
+
+if __name__ == '__main__':
+    # 用法: python -m core.stitching [基准测试临时目录]
+    import sys
+    import tempfile
+    result = benchmark_stitching()
+    print(f"逐张 paste: {result['paste_ms']:.1f} ms, 布局引擎: {result['blit_ms']:.1f} ms, 加速 {result['speedup']:.2f}x")
+    work_dir = sys.argv[1] if len(sys.argv) > 1 else tempfile.mkdtemp(prefix="nca_stitch_bench_")
+    result = benchmark_overview_io(work_dir)
+    print(f"总览图 顺序解码+编码: {result['sequential_ms']:.0f} ms, 并行: {result['parallel_ms']:.0f} ms, 加速 {result['speedup']:.2f}x")
@@ -1,17 +1,19 @@
 # core/utils.py
 import os
+import shutil
 import sys
 import time
 import logging
-import pyautogui
-from PIL import Image
-import pygetwindow
-import win32gui
-import win32con
-import win32process
+from PIL import Image, ImageChops, ImageStat
 import psutil
-import zipfile
 from . import constants as core_constants
+from .capture import get_capture_backend
+from .delay_learner import get_delay_learner
+from .window_geometry import get_window_geometry, invalidate_window_geometry
+from . import stitching
+from .archive_writer import ZipArchiveWriter
+# pyautogui / pygetwindow / win32gui 等只在真正操作桌面窗口时于函数内导入，
+# 使 core.utils 在无桌面环境 (例如使用回放截图后端的 Linux CI) 下也能导入
 
 # OCR 模块已移除
 # import easyocr
@@ -52,13 +54,164 @@ def check_stop_signal(context):
             logging.warning("检测到停止信号 (context.shared.logger 不可用)。")
         return True
     return False
+
+def report_status(context, text: str):
+    """
+    把一行进度/状态文字交给 context.shared.status_callback (GUI 状态栏)。
+    未设置回调 (命令行模式) 时不做任何事；回调本身负责切换到 GUI 线程。
+    """
+    callback = getattr(getattr(context, 'shared', None), 'status_callback', None)
+    if callback is None:
+        return
+    try:
+        callback(text)
+    except Exception as e:
+        logging.getLogger(__name__).debug(f"状态回调失败: {e}")
 # --- 临时定义结束 ---
 
 
-def click_coordinates(context, relative_coord: tuple, window: pygetwindow.Win32Window):
+def get_client_rect_on_screen(context, window: 'pygetwindow.Win32Window'):
+    """
+    返回窗口客户区在屏幕上的 (left, top, width, height)。
+    优先使用截图后端提供的客户区 (例如回放后端)，否则使用 context.shared.window_geometry 中缓存的值，
+    窗口移动或缩放后才会重新调用 GetClientRect + ClientToScreen。
+    失败或尺寸无效时记录错误并返回 None。
+    """
+    geometry = get_screen_geometry(context, window)
+    return geometry.client_rect if geometry else None
+
+
+def get_screen_geometry(context, window: 'pygetwindow.Win32Window'):
+    """返回当前窗口的 WindowGeometry (core.window_geometry)，用于相对坐标到屏幕坐标的换算；失败时返回 None。"""
+    logger = getattr(context.shared, 'logger', logging)
+    backend_rect = get_capture_backend(context).client_rect(window)
+    if backend_rect is None and not window:
+        logger.error("错误：'window' 参数无效 (None)。")
+        return None
+    return get_window_geometry(context, window, backend_rect)
+
+
+def _stability_setting(context, key: str, default):
+    app_config = getattr(context.shared, 'app_config', None) or {}
+    return app_config.get('global_settings', {}).get(key, default)
+
+def _stability_sample(context, window, relative_region):
+    """
+    截取用于稳定性比较的缩小灰度帧。
+    先用 reduce() 做整数倍盒式缩小，再转灰度并缩放到 STABILITY_SAMPLE_WIDTH，避免对整帧做灰度转换和重采样。
+    """
+    if relative_region:
+        img = capture_region_image(context, relative_region, window)
+    else:
+        frame = capture_client_frame(context, window)
+        img = frame.image if frame else None
+    if img is None:
+        return None
+    sample_width = core_constants.STABILITY_SAMPLE_WIDTH
+    factor = img.width // sample_width
+    small = img.reduce(factor) if factor >= 2 else img
+    gray = small.convert('L')
+    if small is not img:
+        small.close()
+    img.close()
+    if gray.width > sample_width:
+        sample_height = max(1, round(gray.height * sample_width / gray.width))
+        gray = gray.resize((sample_width, sample_height), Image.BILINEAR)
+    return gray
+
+def wait_until_stable(context, window, relative_region: tuple = None, timeout: float = core_constants.UNIVERSAL_ACTION_DELAY):
+    """
+    等待窗口 (或其中的相对区域) 画面停止变化，最长等待 timeout 秒。
+    取代点击后的固定 sleep：画面至少连续 STABILITY_REQUIRED_SAMPLES 个采样间隔无变化、
+    且无变化持续了 global_settings.stability_window 秒 (默认 STABILITY_WINDOW) 时返回，原固定延迟作为上限。
+    只有 2~3 帧 (约 0.1 秒) 不变不足以说明动画已结束 (例如过渡动画中的停顿)。
+    global_settings.stability_wait_enabled 为 false 时退化为 time.sleep(timeout)。
+
+    参数:
+        context: 应用上下文。
+        window: 目标窗口。
+        relative_region: 要观察的相对区域 (rel_left, rel_top, rel_width, rel_height)；
+            None 时使用 global_settings.stability_sample_region，仍未设置则观察整个客户区 (缩小后比较)。
+        timeout: 最长等待时间 (秒)，即原来的固定延迟。
+    返回:
+        (stable, elapsed): stable 表示是否在超时前检测到画面稳定，elapsed 为实际等待秒数。
+    """
+    start = time.perf_counter()
+    if timeout <= 0:
+        return True, 0.0
+    if not _stability_setting(context, 'stability_wait_enabled', True):
+        time.sleep(timeout)
+        return False, time.perf_counter() - start
+
+    min_wait = min(float(_stability_setting(context, 'stability_min_wait', core_constants.STABILITY_MIN_WAIT)), timeout)
+    stability_window = max(0.0, float(_stability_setting(context, 'stability_window', core_constants.STABILITY_WINDOW)))
+    if relative_region is None:
+        default_region = _stability_setting(context, 'stability_sample_region', None)
+        relative_region = tuple(default_region) if default_region else None
+    interval = core_constants.STABILITY_SAMPLE_INTERVAL
+    required = max(2, core_constants.STABILITY_REQUIRED_SAMPLES)
+    threshold = core_constants.STABILITY_DIFF_THRESHOLD
+
+    time.sleep(min_wait)
+    previous = None
+    unchanged = 0
+    unchanged_since = None # 当前无变化区间起点 (该区间第一帧的采样时间)
+    while True:
+        elapsed = time.perf_counter() - start
+        if elapsed >= timeout or check_stop_signal(context):
+            break
+        current = _stability_sample(context, window, relative_region)
+        sampled_at = time.perf_counter()
+        if current is None:
+            # 无法采样时按原固定延迟等待剩余时间
+            time.sleep(max(0.0, timeout - elapsed))
+            break
+        if previous is not None and previous.size == current.size:
+            diff = ImageStat.Stat(ImageChops.difference(previous, current)).mean[0]
+            if diff < threshold:
+                unchanged += 1
+            else:
+                unchanged, unchanged_since = 0, sampled_at
+            if unchanged >= required and sampled_at - unchanged_since >= stability_window:
+                return True, sampled_at - start
+        else:
+            unchanged, unchanged_since = 0, sampled_at
+        previous = current
+        time.sleep(min(interval, max(0.0, timeout - (time.perf_counter() - start))))
+    return False, time.perf_counter() - start
+
+
+def wait_for_transition(context, window, transition_name: str, default_delay: float, relative_region: tuple = None):
+    """
+    等待一次命名的界面切换完成，并把实际耗时记录到自适应延迟学习器 (core.delay_learner)。
+    等待上限由学习器根据历史百分位给出；学习器未启用或样本不足时使用 default_delay。
+    学习到的上限短于 default_delay 且超时时，继续等待到 default_delay，不会比固定延迟更早放弃。
+    只记录检测到画面稳定的耗时：超时的耗时只是当时的上限，记录下来会让上限逐次抬高
+    (画面持续变化的界面每次都超时，上限会一路涨到 ADAPTIVE_DELAY_MAX_FACTOR 倍)。
+
+    返回:
+        (stable, elapsed)，含义同 wait_until_stable。
+    """
+    learner = get_delay_learner(context)
+    timeout = learner.suggest_delay(transition_name, default_delay) if learner else default_delay
+    stable, elapsed = wait_until_stable(context, window, relative_region, timeout)
+    if not stable and elapsed < default_delay and not check_stop_signal(context):
+        stable, extra = wait_until_stable(context, window, relative_region, default_delay - elapsed)
+        elapsed += extra
+    # 仅在启用画面稳定检测时记录样本 (关闭时 elapsed 只是固定 sleep 的时长)
+    if learner and _stability_setting(context, 'stability_wait_enabled', True) and not check_stop_signal(context):
+        if stable:
+            learner.record(transition_name, elapsed)
+        logger = getattr(context.shared, 'logger', logging)
+        logger.debug(f"界面切换 '{transition_name}': {'稳定' if stable else '超时'}，耗时 {elapsed:.2f}s (上限 {timeout:.2f}s，默认 {default_delay:.2f}s)")
+    return stable, elapsed
+
+
+def click_coordinates(context, relative_coord: tuple, window: 'pygetwindow.Win32Window', wait_after: bool = True):
     """
     根据相对坐标和当前窗口尺寸/位置，计算实际屏幕坐标并模拟点击。
     相对坐标是 (比例X, 比例Y)，相对于窗口的客户区（内容区域）。
+    wait_after 为 False 时点击后不等待，由调用方自行等待 (例如 wait_for_transition)。
     """
     logger = getattr(context.shared, 'logger', logging)
     if check_stop_signal(context):
@@ -68,81 +221,78 @@ def click_coordinates(context, relative_coord: tuple, window: pygetwindow.Win32W
         logger.error("错误 (click_coordinates): 'window' 参数无效 (None)。")
         return False
     try:
-        hwnd = window._hWnd
-        if not hwnd:
-             logger.error("错误：无法从 pygetwindow 对象获取窗口句柄 (HWND)。")
-             return False
-
-        client_left, client_top, client_right, client_bottom = win32gui.GetClientRect(hwnd)
-        client_width = client_right - client_left
-        client_height = client_bottom - client_top
-
-        if client_width <= 0 or client_height <= 0:
-             logger.error(f"错误：获取到的窗口客户区尺寸无效 (Width={client_width}, Height={client_height})。")
-             return False
-
-        screen_client_left, screen_client_top = win32gui.ClientToScreen(hwnd, (client_left, client_top))
-
-        screen_x = screen_client_left + round(relative_coord[0] * client_width)
-        screen_y = screen_client_top + round(relative_coord[1] * client_height)
+        geometry = get_screen_geometry(context, window)
+        if not geometry:
+            return False
+        screen_client_left, screen_client_top, client_width, client_height = geometry.client_rect
+        screen_x, screen_y = geometry.to_screen_point(relative_coord)
 
-        logger.info(f"相对坐标 {relative_coord} -> 屏幕坐标 ({screen_x}, {screen_y}) (基于窗口 '{window.title}' HWND:{hwnd} 的客户区 at [{screen_client_left},{screen_client_top}] size [{client_width}x{client_height}])")
+        logger.info(f"相对坐标 {relative_coord} -> 屏幕坐标 ({screen_x}, {screen_y}) (基于窗口 '{window.title}' 的客户区 at [{screen_client_left},{screen_client_top}] size [{client_width}x{client_height}])")
 
-        pyautogui.moveTo(screen_x, screen_y, duration=0.2)
-        pyautogui.click(screen_x, screen_y)
-        time.sleep(core_constants.UNIVERSAL_ACTION_DELAY)
+        backend = get_capture_backend(context)
+        if backend.simulated:
+            # 回放后端没有真实窗口可点击：点击视为一次界面切换，前进到下一帧
+            backend.step()
+        else:
+            import pyautogui
+            pyautogui.moveTo(screen_x, screen_y, duration=0.2)
+            pyautogui.click(screen_x, screen_y)
+        if wait_after:
+            wait_until_stable(context, window, timeout=core_constants.UNIVERSAL_ACTION_DELAY)
         return True
 
     except Exception as e:
         logger.error(f"计算或点击相对坐标 {relative_coord} 时出错: {e}")
         return False
 
-def take_screenshot(context, relative_region: tuple, window: pygetwindow.Win32Window, filename: str):
+def capture_region_image(context, relative_region: tuple, window: 'pygetwindow.Win32Window'):
     """
-    根据相对区域定义和当前窗口尺寸/位置，计算实际屏幕区域并截图保存。
+    根据相对区域定义和当前窗口客户区，通过截图后端截取该区域并返回内存中的 RGB 图像。
     相对区域格式: (rel_left, rel_top, rel_width, rel_height)
-    (此函数从 _backup/c_arena_predition.py 迁移)
+
+    返回:
+        PIL Image，失败时返回 None。
     """
     logger = getattr(context.shared, 'logger', logging)
     if not all(isinstance(val, (int, float)) for val in relative_region) or len(relative_region) != 4:
         logger.error(f"无效的相对截图区域格式: {relative_region}. 需要 (rel_left, rel_top, rel_width, rel_height)。")
-        return False
+        return None
 
     if check_stop_signal(context):
-        logger.info("操作已取消 (take_screenshot)。")
-        return False
-    if not window:
-        logger.error("错误 (take_screenshot): 'window' 参数无效 (None)。")
-        return False
+        logger.info("操作已取消 (capture_region_image)。")
+        return None
     try:
-        hwnd = window._hWnd
-        if not hwnd:
-             logger.error("错误：无法从 pygetwindow 对象获取窗口句柄 (HWND)。")
-             return False
-
-        client_left, client_top, client_right, client_bottom = win32gui.GetClientRect(hwnd)
-        client_width = client_right - client_left
-        client_height = client_bottom - client_top
-
-        if client_width <= 0 or client_height <= 0:
-             logger.error(f"错误：获取到的窗口客户区尺寸无效 (Width={client_width}, Height={client_height})。")
-             return False
-
-        screen_client_left, screen_client_top = win32gui.ClientToScreen(hwnd, (client_left, client_top))
-
-        region_left = screen_client_left + round(relative_region[0] * client_width)
-        region_top = screen_client_top + round(relative_region[1] * client_height)
-        region_width = round(relative_region[2] * client_width)
-        region_height = round(relative_region[3] * client_height)
+        geometry = get_screen_geometry(context, window)
+        if not geometry:
+            return None
+        screen_client_left, screen_client_top, client_width, client_height = geometry.client_rect
+        region_left, region_top, region_width, region_height = geometry.to_screen_region(relative_region)
 
         if region_width <= 0 or region_height <= 0:
              logger.error(f"计算得到的截图区域尺寸无效: 宽度={region_width}, 高度={region_height} (基于客户区大小 {client_width}x{client_height} 和相对区域 {relative_region})。")
-             return False
+             return None
 
         actual_region = (region_left, region_top, region_width, region_height)
+        logger.debug(f"相对区域 {relative_region} -> 屏幕区域 {actual_region} (客户区 at [{screen_client_left},{screen_client_top}] size [{client_width}x{client_height}])")
+        return get_capture_backend(context).grab(actual_region)
+    except Exception as e:
+        logger.error(f"截取相对区域 {relative_region} 时出错: {e}")
+        return None
 
-        logger.info(f"相对区域 {relative_region} -> 屏幕区域 {actual_region} (基于窗口 '{window.title}' HWND:{hwnd} 的客户区 at [{screen_client_left},{screen_client_top}] size [{client_width}x{client_height}])")
-        logger.info(f"正在截取区域 {actual_region} 并保存为 '{filename}'...")
+def take_screenshot(context, relative_region: tuple, window: 'pygetwindow.Win32Window', filename: str):
+    """
+    根据相对区域定义和当前窗口尺寸/位置，计算实际屏幕区域并截图保存。
+    相对区域格式: (rel_left, rel_top, rel_width, rel_height)
+    (此函数从 _backup/c_arena_predition.py 迁移)
+    """
+    logger = getattr(context.shared, 'logger', logging)
+    screenshot = capture_region_image(context, relative_region, window)
+    if screenshot is None:
+        logger.error(f"未能截取 '{filename}' (相对区域 {relative_region})。")
+        return False
+
+    try:
+        logger.info(f"正在保存相对区域 {relative_region} 的截图为 '{filename}'...")
 
         # 确保目录存在
         # 如果 filename 是绝对路径，os.path.dirname 可能返回空，所以需要检查
@@ -150,7 +300,6 @@ def take_screenshot(context, relative_region: tuple, window: pygetwindow.Win32Wi
         if dir_name: # 只有当 dirname 不是空（即 filename 不是只有文件名）时才创建目录
             os.makedirs(dir_name, exist_ok=True)
 
-        screenshot = pyautogui.screenshot(region=actual_region)
         screenshot.save(filename)
         logger.info(f"截图已保存为 '{filename}'")
         time.sleep(core_constants.POST_SCREENSHOT_DELAY)
@@ -159,6 +308,70 @@ def take_screenshot(context, relative_region: tuple, window: pygetwindow.Win32Wi
     except Exception as e:
         logger.error(f"截取或保存截图 '{filename}' (相对区域 {relative_region}) 时出错: {e}")
         return False
+    finally:
+        screenshot.close()
+
+class ClientFrame:
+    """
+    窗口客户区的一帧内存截图。
+    同一界面状态下的多个区域可以从同一帧中按相对区域裁剪，无需重复截屏或写入磁盘。
+    """
+
+    def __init__(self, image: Image.Image, client_width: int, client_height: int):
+        self.image = image
+        self.client_width = client_width
+        self.client_height = client_height
+        self.timestamp = time.time()
+
+    def to_pixel_box(self, relative_region: tuple):
+        """将相对区域 (rel_left, rel_top, rel_width, rel_height) 转换为帧内像素框 (left, top, right, bottom)。"""
+        left = round(relative_region[0] * self.client_width)
+        top = round(relative_region[1] * self.client_height)
+        right = left + round(relative_region[2] * self.client_width)
+        bottom = top + round(relative_region[3] * self.client_height)
+        return (max(0, left), max(0, top), min(self.image.width, right), min(self.image.height, bottom))
+
+    def crop(self, relative_region: tuple):
+        """按相对区域裁剪，返回新的 PIL Image；区域无效时返回 None。"""
+        left, top, right, bottom = self.to_pixel_box(relative_region)
+        if right <= left or bottom <= top:
+            return None
+        return self.image.crop((left, top, right, bottom))
+
+    def close(self):
+        try:
+            self.image.close()
+        except Exception:
+            pass
+
+
+def capture_client_frame(context, window: 'pygetwindow.Win32Window'):
+    """
+    截取窗口整个客户区为一帧内存图像 (ClientFrame)。
+    与 take_screenshot 不同，此函数不写文件，也不执行截图后的固定等待。
+
+    返回:
+        ClientFrame 对象，失败时返回 None。
+    """
+    logger = getattr(context.shared, 'logger', logging)
+    if check_stop_signal(context):
+        logger.info("操作已取消 (capture_client_frame)。")
+        return None
+    if not window:
+        logger.error("错误 (capture_client_frame): 'window' 参数无效 (None)。")
+        return None
+    try:
+        client_rect = get_client_rect_on_screen(context, window)
+        if not client_rect:
+            return None
+        client_width, client_height = client_rect[2], client_rect[3]
+
+        image = get_capture_backend(context).grab(client_rect)
+        logger.debug(f"已截取客户区帧 {client_rect}")
+        return ClientFrame(image, client_width, client_height)
+    except Exception as e:
+        logger.error(f"截取窗口客户区帧时出错: {e}")
+        return None
 
 def recognize_player_id(context, image_path: str, lang_list: list = ["ch_sim", "en"]) -> str:
     """
@@ -166,9 +379,60 @@ def recognize_player_id(context, image_path: str, lang_list: list = ["ch_sim", "
     """
     return ""
 
+def _stitch_pool(context):
+    """拼接共用的解码/编码线程池，线程数由 global_settings.stitch_worker_threads 指定 (0 表示自动)。"""
+    app_config = getattr(context.shared, 'app_config', None) or {}
+    workers = app_config.get('global_settings', {}).get('stitch_worker_threads', 0)
+    return stitching.get_thread_pool(workers)
+
+def get_output_profile(context) -> dict:
+    """返回 global_settings.output_profile 与默认值合并后的输出配置 (见 core.stitching.DEFAULT_OUTPUT_PROFILE)。"""
+    app_config = getattr(context.shared, 'app_config', None) or {}
+    profile = app_config.get('global_settings', {}).get('output_profile', {}) or {}
+    return {**stitching.DEFAULT_OUTPUT_PROFILE, **profile}
+
+def get_output_extension(context) -> str:
+    """最终输出图片应使用的扩展名 (例如 '.png'、'.webp')。未知格式时记录警告并使用 '.png'。"""
+    fmt = str(get_output_profile(context).get('format', 'png')).lower()
+    ext = stitching.OUTPUT_FORMAT_EXTENSIONS.get(fmt)
+    if ext is None:
+        logger = getattr(context.shared, 'logger', logging)
+        logger.warning(f"未知的输出格式 '{fmt}'，将使用 PNG。")
+        return '.png'
+    return ext
+
+def save_final_image(context, src_path: str, dst_path: str) -> bool:
+    """
+    把中间结果图片 (通常是临时目录中的 PNG) 保存为最终输出：扩展名相同时直接复制，否则按输出配置重新编码。
+    """
+    logger = getattr(context.shared, 'logger', logging)
+    try:
+        if os.path.abspath(src_path) == os.path.abspath(dst_path):
+            return True
+        if os.path.splitext(src_path)[1].lower() == os.path.splitext(dst_path)[1].lower():
+            shutil.copy2(src_path, dst_path)
+        else:
+            with Image.open(src_path) as img:
+                stitching.save_image(img, dst_path, get_output_profile(context))
+        return True
+    except Exception as e:
+        logger.error(f"保存最终图片 '{src_path}' -> '{dst_path}' 失败: {e}")
+        return False
+
+def _close_all(images: list, logger=None):
+    """关闭拼接过程中打开的图片对象。"""
+    for img in images:
+        try:
+            img.close()
+        except Exception as e_close:
+            if logger:
+                logger.debug(f"关闭图片时出错: {e_close}")
+
 def stitch_images_vertically(context, image_paths: list, output_path: str):
     """
-    将一系列图片从上到下垂直拼接成一张图片。
+    将一系列图片从上到下垂直拼接成一张图片 (水平居中，黑色背景)。
+    image_paths 中的元素可以是图片文件路径，也可以是内存中的 PIL Image (例如 ClientFrame.crop 的结果)。
+    布局由 core.stitching 计算，像素直接写入预分配的画布后一次性编码。
     """
     logger = getattr(context.shared, 'logger', logging)
     logger.info(f"开始垂直拼接图片到 '{output_path}'...")
@@ -180,56 +444,30 @@ def stitch_images_vertically(context, image_paths: list, output_path: str):
         return False
 
     images = []
-    total_height = 0
-    max_width = 0
-
     try:
+        sources = []
         for path in image_paths:
-            if not os.path.exists(path):
+            if not isinstance(path, Image.Image) and not os.path.exists(path):
                 logger.warning(f"跳过拼接：找不到图片文件 '{path}'")
                 continue
-            img = Image.open(path)
-            images.append(img)
-            total_height += img.height
-            if img.width > max_width:
-                max_width = img.width
-            logger.debug(f"读取图片 '{path}' 尺寸: {img.size}")
+            sources.append(path)
+        pool = _stitch_pool(context)
+        images = stitching.decode_images(sources, pool) # 在线程池上并行解码
+        for path, img in zip(sources, images):
+            logger.debug(f"读取图片 '{path if not isinstance(path, Image.Image) else '<内存图像>'}' 尺寸: {img.size}")
 
         if not images:
              logger.error("无法打开任何有效的图片进行垂直拼接。")
              return False
 
-        logger.debug(f"创建垂直拼接画布，尺寸: ({max_width}, {total_height})")
-        stitched_image = Image.new('RGB', (max_width, total_height))
-
-        current_y = 0
-        for img in images:
-            if check_stop_signal(context):
-                logger.info("垂直拼接操作在循环中被中断。")
-                # 清理已打开的图片
-                for open_img in images: # images 列表包含了所有已成功打开的 Image 对象
-                    try:
-                        open_img.close()
-                    except Exception as e_close:
-                        logger.debug(f"关闭图片时出错 (中断后清理): {e_close}")
-                return False # 或者根据需要返回部分结果的状态
-            paste_x = (max_width - img.width) // 2
-            stitched_image.paste(img, (paste_x, current_y))
-            current_y += img.height
-            # img.close() # 在循环结束后统一关闭
-
-        for img in images: # 确保所有图片都被关闭
-            try:
-                img.close()
-            except Exception as e_close:
-                logger.debug(f"关闭图片时出错 (正常结束): {e_close}")
-
+        plan = stitching.plan_vertical([img.size for img in images], alignment='center')
+        logger.debug(f"垂直拼接布局: {plan}")
+        if check_stop_signal(context):
+            logger.info("垂直拼接操作在写入画布前被中断。")
+            return False
 
-        # 确保目录存在
-        dir_name = os.path.dirname(output_path)
-        if dir_name:
-            os.makedirs(dir_name, exist_ok=True)
-        stitched_image.save(output_path)
+        canvas = stitching.render_plan(plan, images, (0, 0, 0))
+        stitching.save_canvas(canvas, output_path, pool=pool, profile=get_output_profile(context))
         logger.info(f"垂直拼接完成，图片已保存为 '{output_path}'")
         return True
     except FileNotFoundError as e:
@@ -237,12 +475,9 @@ def stitch_images_vertically(context, image_paths: list, output_path: str):
         return False
     except Exception as e:
         logger.error(f"垂直拼接图片时出错: {e}")
-        for img in images: # 确保在异常情况下也尝试关闭图片
-            try:
-                img.close()
-            except:
-                pass
         return False
+    finally:
+        _close_all(images, logger) # 确保所有图片都被关闭
 
 def find_and_activate_window(context, selected_window_title_override: str = None, activate_now: bool = True):
     """
@@ -261,6 +496,10 @@ def find_and_activate_window(context, selected_window_title_override: str = None
     返回:
         pygetwindow.Win32Window 对象如果找到窗口 (且如果 activate_now=True 则已激活)，否则返回 None。
     """
+    import pygetwindow
+    import win32gui
+    import win32con
+    import win32process
     logger = getattr(context.shared, 'logger', logging)
     target_process_name = core_constants.TARGET_PROCESS_NAME
     
@@ -357,6 +596,7 @@ def find_and_activate_window(context, selected_window_title_override: str = None
                         win32gui.SetForegroundWindow(target_hwnd)
 
                     time.sleep(core_constants.POST_WINDOW_ACTIVATION_DELAY)
+                    invalidate_window_geometry(context) # 恢复/激活可能改变了窗口位置
                     
                     foreground_hwnd = win32gui.GetForegroundWindow()
                     if foreground_hwnd == target_hwnd:
@@ -393,70 +633,6 @@ def find_and_activate_window(context, selected_window_title_override: str = None
     logger.error(f"错误：尝试了所有指定/可能的标题 ({titles_to_try})，但未能找到 '{target_process_name}' 的窗口 (激活状态: {activate_now})。")
     return None
 
-def process_image_to_webp(context, input_image_path: str, output_webp_dir: str, quality: int = 85, lossless: bool = False):
-    """
-    将指定的 PNG/JPG 图片转换为 WebP 格式。
-    文件名将保持不变，只改变扩展名。
-
-    参数:
-        context: 应用上下文。
-        input_image_path: 输入图片路径。
-        output_webp_dir: WebP 图片的输出目录。
-        quality: WebP 压缩质量 (1-100)，仅当 lossless=False 时有效。
-        lossless: 是否使用无损压缩。
-    """
-    logger = getattr(context.shared, 'logger', logging)
-    if check_stop_signal(context):
-        logger.info("操作已取消 (process_image_to_webp)。")
-        return None
-
-    if not os.path.exists(input_image_path):
-        logger.error(f"输入图片文件不存在: {input_image_path}")
-        return None
-
-    try:
-        img = Image.open(input_image_path)
-        base_filename = os.path.basename(input_image_path)
-        name_without_ext = os.path.splitext(base_filename)[0]
-        output_webp_filename = f"{name_without_ext}.webp"
-        output_webp_path = os.path.join(output_webp_dir, output_webp_filename)
-
-        os.makedirs(output_webp_dir, exist_ok=True)
-
-        save_params = {'format': 'WEBP'}
-        if lossless:
-            save_params['lossless'] = True
-            # Pillow 文档指出，当 lossless=True 时，quality 参数会被忽略，但一些版本可能仍接受它。
-            # 为了清晰，可以只在有损压缩时明确传递 quality。
-            # 或者，如果 Pillow 版本支持，可以同时传递 lossless=True 和 method=6 (最慢但压缩最好)
-            # save_params['method'] = 6
-        else:
-            save_params['quality'] = quality
-        
-        # 处理透明度：如果图像有alpha通道 (RGBA)，转换为 RGB 以避免某些 WebP 查看器的问题
-        # 或者，如果需要保留透明度，确保 Pillow 和 WebP 库支持
-        if img.mode == 'RGBA' or img.mode == 'LA' or (img.mode == 'P' and 'transparency' in img.info):
-            # 如果目标是无损且需要保留透明度
-            if lossless:
-                 logger.debug(f"图片 '{input_image_path}' (模式: {img.mode}) 包含透明度，将尝试无损保存以保留。")
-            else:
-            # 对于有损压缩，通常最好转换为RGB，除非明确需要带alpha的有损WebP
-                 logger.debug(f"图片 '{input_image_path}' (模式: {img.mode}) 包含透明度，将转换为 RGB 后进行有损压缩。")
-                 img = img.convert('RGB')
-        
-        img.save(output_webp_path, **save_params)
-        logger.info(f"图片 '{input_image_path}' 已成功转换为 WebP (lossless={lossless}, quality={quality if not lossless else 'N/A'}) 并保存至 '{output_webp_path}'")
-        img.close()
-        return output_webp_path
-    except FileNotFoundError:
-        logger.error(f"打开图片失败，文件未找到: {input_image_path}")
-        return None
-    except Exception as e:
-        logger.error(f"处理图片 '{input_image_path}' 到 WebP 时出错: {e}")
-        if 'img' in locals() and hasattr(img, 'close'):
-            img.close()
-        return None
-
 def create_zip_archive(context, source_dir_to_zip: str, zip_file_path: str):
     """
     将指定目录的内容打包成一个 ZIP 文件。
@@ -475,41 +651,69 @@ def create_zip_archive(context, source_dir_to_zip: str, zip_file_path: str):
     if zip_dir: # 如果 zip_file_path 包含目录
         os.makedirs(zip_dir, exist_ok=True)
 
+    # 图片条目使用 STORED (见 core.archive_writer)，写入临时文件，完成后才替换原有 ZIP
+    writer = None
     try:
-        with zipfile.ZipFile(zip_file_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, _, files in os.walk(source_dir_to_zip):
+        writer = ZipArchiveWriter(zip_file_path, fresh=True, logger=logger)
+        for root, _, files in os.walk(source_dir_to_zip):
+            if check_stop_signal(context):
+                logger.warning(f"打包操作在遍历目录 '{root}' 时被中断。")
+                writer.abort()
+                return False # 指示操作未完成
+            for file in sorted(files):
                 if check_stop_signal(context):
-                    logger.warning(f"打包操作在遍历目录 '{root}' 时被中断。")
-                    # ZipFile 会在退出 with 块时自动关闭，部分写入的文件会保留。
-                    # 如果需要，可以在这里尝试删除部分创建的 zip 文件。
-                    # os.remove(zip_file_path) # 但这可能导致数据丢失，需谨慎
-                    return False # 指示操作未完成
-                for file in files:
-                    if check_stop_signal(context):
-                        logger.warning(f"打包操作在添加文件 '{file}' 时被中断。")
-                        return False
-                    file_path = os.path.join(root, file)
-                    # arcname 是文件在 zip 包内的相对路径
-                    arcname = os.path.relpath(file_path, source_dir_to_zip)
-                    zipf.write(file_path, arcname)
-                    logger.debug(f"已添加 '{file_path}' 到 ZIP 存档为 '{arcname}'")
+                    logger.warning(f"打包操作在添加文件 '{file}' 时被中断。")
+                    writer.abort()
+                    return False
+                file_path = os.path.join(root, file)
+                # arcname 是文件在 zip 包内的相对路径
+                arcname = os.path.relpath(file_path, source_dir_to_zip)
+                writer.add_file(arcname, file_path)
+                logger.debug(f"已添加 '{file_path}' 到 ZIP 存档为 '{arcname}'")
+        writer.commit()
         logger.info(f"目录 '{source_dir_to_zip}' 已成功打包到 '{zip_file_path}'")
         return True
     except Exception as e:
         logger.error(f"创建 ZIP 存档 '{zip_file_path}' 从目录 '{source_dir_to_zip}' 时出错: {e}")
-        # 如果发生错误，可以考虑删除可能已创建的不完整 zip 文件
-        if os.path.exists(zip_file_path):
-            try:
-                os.remove(zip_file_path)
-                logger.info(f"已删除因错误而可能不完整的 ZIP 文件: {zip_file_path}")
-            except Exception as e_remove:
-                logger.warning(f"删除不完整的 ZIP 文件 '{zip_file_path}' 时失败: {e_remove}")
+        if writer is not None:
+            writer.abort() # 删除不完整的临时 ZIP，原有文件保持不变
         return False
 
 
+def update_zip_archive(context, source_dir: str, zip_file_path: str, names: list):
+    """
+    把 source_dir 中的 names (相对路径) 写入已有的 ZIP，其他条目保持不变。
+    只新增条目时以追加模式写入；需要替换已有条目时重建归档 (见 core.archive_writer.ZipArchiveWriter)。
+    ZIP 不存在时等同于 create_zip_archive。
+    """
+    logger = getattr(context.shared, 'logger', logging)
+    if not os.path.exists(zip_file_path):
+        return create_zip_archive(context, source_dir, zip_file_path)
+    names = [name.replace(os.sep, '/') for name in names]
+    if not names:
+        return True
+    if check_stop_signal(context):
+        logger.info("操作已取消 (update_zip_archive)。")
+        return False
+
+    writer = None
+    try:
+        writer = ZipArchiveWriter(zip_file_path, replace_names=names, logger=logger)
+        for name in names:
+            writer.add_file(name, os.path.join(source_dir, name))
+        writer.commit()
+        logger.info(f"ZIP 存档 '{zip_file_path}' 已写入 {len(names)} 个文件。")
+        return True
+    except Exception as e:
+        logger.error(f"更新 ZIP 存档 '{zip_file_path}' 时出错: {e}")
+        if writer is not None:
+            writer.abort()
+        return False
+
 def stitch_images_horizontally(context, image_paths: list, output_path: str, alignment: str = 'center', spacing: int = 0, bg_color=(255, 255, 255)):
     """
     将一系列图片从左到右水平拼接成一张图片。
+    布局由 core.stitching 计算，像素直接写入预分配的画布后一次性编码。
 
     参数:
         context: 应用上下文对象。
@@ -533,81 +737,43 @@ def stitch_images_horizontally(context, image_paths: list, output_path: str, ali
         return False
 
     images = []
-    total_width = 0
-    max_height = 0
-
     try:
-        for i, path in enumerate(image_paths):
-            if check_stop_signal(context):
-                logger.info(f"水平拼接在加载图片 {i+1} ('{path}') 前被中断。")
-                for img_obj in images: img_obj.close()
-                return False
+        sources = []
+        for path in image_paths:
             if not os.path.exists(path):
                 logger.warning(f"跳过拼接：找不到图片文件 '{path}'")
                 continue
-            img = Image.open(path)
-            images.append(img)
-            total_width += img.width
-            if img.height > max_height:
-                max_height = img.height
+            sources.append(path)
+        if check_stop_signal(context):
+            logger.info("水平拼接在加载图片前被中断。")
+            return False
+        pool = _stitch_pool(context)
+        images = stitching.decode_images(sources, pool) # 在线程池上并行解码
+        for path, img in zip(sources, images):
             logger.debug(f"读取图片 '{path}' 尺寸: {img.size}")
 
         if not images:
             logger.error("无法打开任何有效的图片进行水平拼接。")
             return False
 
-        # 加上图片间的间距
-        if len(images) > 1:
-            total_width += spacing * (len(images) - 1)
-
-        logger.debug(f"创建水平拼接画布，尺寸: ({total_width}, {max_height}), 背景色: {bg_color}")
-        stitched_image = Image.new('RGB', (total_width, max_height), color=bg_color)
-
-        current_x = 0
-        for i, img in enumerate(images):
-            if check_stop_signal(context):
-                logger.info(f"水平拼接在粘贴图片 {i+1} ('{img.filename if hasattr(img, 'filename') else 'N/A'}') 前被中断。")
-                for img_obj in images: img_obj.close() # 关闭所有已打开的
-                # stitched_image.close() # Pillow Image 对象没有 close 方法
-                return False
-
-            paste_y = 0
-            if alignment == 'center':
-                paste_y = (max_height - img.height) // 2
-            elif alignment == 'bottom':
-                paste_y = max_height - img.height
-            # 'top' alignment is paste_y = 0 (default)
-
-            stitched_image.paste(img, (current_x, paste_y))
-            current_x += img.width + spacing
-            # img.close() # 在循环结束后统一关闭
-
-        for img in images: # 确保所有图片都被关闭
-            try:
-                img.close()
-            except Exception as e_close:
-                logger.debug(f"关闭图片时出错 (正常结束 - 水平拼接): {e_close}")
-
-        # 确保目录存在
-        dir_name = os.path.dirname(output_path)
-        if dir_name:
-            os.makedirs(dir_name, exist_ok=True)
+        plan = stitching.plan_horizontal([img.size for img in images], alignment=alignment, spacing=spacing)
+        logger.debug(f"水平拼接布局: {plan}, 背景色: {bg_color}")
+        if check_stop_signal(context):
+            logger.info("水平拼接在写入画布前被中断。")
+            return False
 
-        stitched_image.save(output_path)
+        canvas = stitching.render_plan(plan, images, bg_color)
+        stitching.save_canvas(canvas, output_path, pool=pool, profile=get_output_profile(context))
         logger.info(f"水平拼接完成，图片已保存为 '{output_path}'")
         return True
     except FileNotFoundError as e:
         logger.error(f"水平拼接时找不到文件：{e}")
-        for img_obj in images: img_obj.close()
         return False
     except Exception as e:
         logger.error(f"水平拼接图片时出错: {e}")
-        for img_obj in images: # 确保在异常情况下也尝试关闭图片
-            try:
-                img_obj.close()
-            except:
-                pass
         return False
+    finally:
+        _close_all(images, logger) # 确保所有图片都被关闭
 
 def stitch_mode4_overview(context, image_paths: list, output_path: str, spacing_major: int = 60, spacing_minor: int = 30, background_color=(0, 0, 0)):
     """
@@ -619,6 +785,7 @@ def stitch_mode4_overview(context, image_paths: list, output_path: str, spacing_
         - (2,3), (6,7) 之间为 spacing_major
         - 第1行和第2行之间为 spacing_major
     - 背景颜色由 background_color 指定。
+    布局由 core.stitching.plan_mode4_overview 计算。
     """
     logger = getattr(context.shared, 'logger', logging)
     logger.info(f"开始为模式4/5拼接总览图到 '{output_path}' (主间距: {spacing_major}, 次间距: {spacing_minor}, 背景: {background_color})...")
@@ -634,130 +801,175 @@ def stitch_mode4_overview(context, image_paths: list, output_path: str, spacing_
     images_opened = [] # 用于确保所有打开的图片都被关闭
     try:
         for i, path in enumerate(image_paths):
-            if check_stop_signal(context):
-                logger.info(f"拼接操作在加载图片 {i+1} ('{path}') 前被中断。")
-                for img_obj in images_opened: img_obj.close()
-                return None
             if not os.path.exists(path):
                 logger.error(f"找不到图片文件 '{path}' (图片 {i+1})，无法进行拼接。")
-                for img_obj in images_opened: img_obj.close()
                 return None
-            img = Image.open(path)
-            images_opened.append(img)
+        if check_stop_signal(context):
+            logger.info("拼接操作在加载图片前被中断。")
+            return None
+        pool = _stitch_pool(context)
+        images_opened = stitching.decode_images(image_paths, pool) # 8 张竖长图在线程池上并行解码
         
         # 假设所有图片尺寸相同，基于第一张图片
         img_width, img_height = images_opened[0].size
         if img_width <= 0 or img_height <= 0:
             logger.error(f"图片尺寸无效: {img_width}x{img_height}。")
-            for img_obj in images_opened: img_obj.close()
             return None
 
-        # 计算画布尺寸
-        row_width = (img_width * 4) + (spacing_minor * 2) + spacing_major
-        canvas_height = (img_height * 2) + spacing_major
-        canvas_width = row_width
-
+        plan = stitching.plan_mode4_overview([img.size for img in images_opened], spacing_major, spacing_minor)
         logger.debug(f"单张图片尺寸: {img_width}x{img_height}")
-        logger.debug(f"画布尺寸: {canvas_width}x{canvas_height}")
-
-        stitched_image = Image.new('RGB', (canvas_width, canvas_height), color=background_color)
-
-        # 粘贴图片 - 第1行
-        current_x_r1 = 0
-        stitched_image.paste(images_opened[0], (current_x_r1, 0))
-        current_x_r1 += img_width + spacing_minor
-        stitched_image.paste(images_opened[1], (current_x_r1, 0))
-        current_x_r1 += img_width + spacing_major
-        stitched_image.paste(images_opened[2], (current_x_r1, 0))
-        current_x_r1 += img_width + spacing_minor
-        stitched_image.paste(images_opened[3], (current_x_r1, 0))
-
-        # 粘贴图片 - 第2行
-        row2_y_offset = img_height + spacing_major
-        current_x_r2 = 0
-        stitched_image.paste(images_opened[4], (current_x_r2, row2_y_offset))
-        current_x_r2 += img_width + spacing_minor
-        stitched_image.paste(images_opened[5], (current_x_r2, row2_y_offset))
-        current_x_r2 += img_width + spacing_major
-        stitched_image.paste(images_opened[6], (current_x_r2, row2_y_offset))
-        current_x_r2 += img_width + spacing_minor
-        stitched_image.paste(images_opened[7], (current_x_r2, row2_y_offset))
-
-        # 调用者应确保 output_path 是唯一的，并且其目录已创建。
-        # 此函数现在直接使用传入的 output_path。
-        final_output_path_to_save = output_path # 直接使用传入的路径
-
-        # 确保目录存在 (虽然调用者也可能已创建，但再次检查无害)
-        dir_name = os.path.dirname(final_output_path_to_save)
-        if dir_name:
-            os.makedirs(dir_name, exist_ok=True)
+        logger.debug(f"画布尺寸: {plan.width}x{plan.height}")
+
+        canvas = stitching.render_plan(plan, images_opened, background_color)
 
-        stitched_image.save(final_output_path_to_save)
-        logger.info(f"模式4/5总览图拼接完成，图片已保存为 '{final_output_path_to_save}'")
-        return final_output_path_to_save # 返回实际保存的路径
+        # 调用者应确保 output_path 是唯一的，并且其目录已创建 (这里再次确保目录存在)。
+        stitching.save_canvas(canvas, output_path, pool=pool, profile=get_output_profile(context)) # 大图 PNG 使用并行压缩
+        logger.info(f"模式4/5总览图拼接完成，图片已保存为 '{output_path}'")
+        return output_path # 返回实际保存的路径
 
     except FileNotFoundError as e: # Should be caught by os.path.exists earlier
         logger.error(f"拼接模式4/5总览图时找不到文件：{e}")
         return None
     except Exception as e:
         logger.error(f"拼接模式4/5总览图时出错: {e}")
-        # import traceback # 用于调试
-        # traceback.print_exc()
         return None
     finally:
-        for img_obj in images_opened: # 确保关闭所有图片对象
-            try:
-                img_obj.close()
-            except: # nosec
-                pass
+        _close_all(images_opened) # 确保关闭所有图片对象
 
-def get_pixel_color_relative(context, window: pygetwindow.Win32Window, relative_coord: tuple):
+def stitch_grid_streaming(context, image_paths_grid: list, output_path: str, spacing: int = 30, bg_color=(0, 0, 0), scale: float = 1.0):
     """
-    获取指定窗口内相对坐标点的像素颜色。
-    使用 win32gui 获取客户区坐标以提高准确性。
+    把按行组织的图片 (image_paths_grid[行][列]，缺失的格子为 None) 拼接成一张超大网格图，
+    例如模式6 全部分组 × 全部比赛的赛事海报。
+    与其他拼接函数不同，输出按行条带流式写入 PNG (core.stitching.stitch_streaming)，
+    每张输入只在写到它所在的条带时才解码，峰值内存与一个条带成正比，而不是整张海报。
+
+    参数:
+        scale: 输入图的缩放比例 (例如 0.5)，用于控制海报尺寸。
+    返回:
+        成功时返回 output_path，失败或中断时返回 None。
     """
     logger = getattr(context.shared, 'logger', logging)
-    if not window:
-        logger.error("get_pixel_color_relative: NIKKE 窗口对象无效。")
+    if check_stop_signal(context):
+        logger.info("操作已取消 (stitch_grid_streaming)。")
+        return None
+    columns = max((len(row) for row in image_paths_grid), default=0)
+    paths = []
+    for row in image_paths_grid:
+        for col in range(columns):
+            path = row[col] if col < len(row) else None
+            paths.append(path if path and os.path.exists(path) else None)
+    if columns == 0 or not any(paths):
+        logger.warning("没有可用于网格拼接的图片。")
         return None
 
     try:
-        hwnd = window._hWnd
-        if not hwnd:
-            logger.error("get_pixel_color_relative: 无法从 pygetwindow 对象获取窗口句柄 (HWND)。")
+        sizes = [(max(1, round(w * scale)), max(1, round(h * scale))) if path else (0, 0)
+                 for path, (w, h) in zip(paths, stitching.read_image_sizes(paths))]
+        plan = stitching.plan_grid(sizes, columns, column_gaps=spacing, row_gaps=spacing, alignment='center')
+        logger.info(f"开始流式拼接网格图到 '{output_path}' ({len(image_paths_grid)} 行 x {columns} 列, "
+                    f"{sum(1 for p in paths if p)} 张图片, 画布 {plan.width}x{plan.height}, 缩放 {scale})...")
+        completed = stitching.stitch_streaming(
+            plan, paths, output_path, bg_color,
+            should_stop=lambda: getattr(context.shared, 'stop_requested', False),
+        )
+        if not completed:
+            logger.info("网格拼接被中断，未完成的输出已删除。")
             return None
+        logger.info(f"网格拼接完成，图片已保存为 '{output_path}'")
+        return output_path
+    except Exception as e:
+        logger.error(f"流式拼接网格图时出错: {e}")
+        return None
 
-        client_left_rel, client_top_rel, client_right_rel, client_bottom_rel = win32gui.GetClientRect(hwnd)
-        client_width = client_right_rel - client_left_rel
-        client_height = client_bottom_rel - client_top_rel
+def get_pixel_color_relative(context, window: 'pygetwindow.Win32Window', relative_coord: tuple):
+    """
+    获取指定窗口内相对坐标点的像素颜色。
+    使用 win32gui 获取客户区坐标以提高准确性，通过当前截图后端读取像素。
+    """
+    logger = getattr(context.shared, 'logger', logging)
+    if not window:
+        logger.error("get_pixel_color_relative: NIKKE 窗口对象无效。")
+        return None
 
-        if client_width <= 0 or client_height <= 0:
-            logger.error(f"get_pixel_color_relative: 获取到的窗口客户区尺寸无效 (Width={client_width}, Height={client_height})。")
+    try:
+        geometry = get_screen_geometry(context, window)
+        if not geometry:
+            logger.error("get_pixel_color_relative: 无法获取窗口客户区。")
             return None
 
-        # 将客户区左上角转换为屏幕坐标
-        screen_client_left, screen_client_top = win32gui.ClientToScreen(hwnd, (client_left_rel, client_top_rel))
+        # 目标点在客户区内的偏移量及屏幕绝对坐标 (来自几何缓存)
+        target_x_in_client, target_y_in_client = geometry.to_client_point(relative_coord)
+        screen_x, screen_y = geometry.to_screen_point(relative_coord)
 
-        # 计算目标点在客户区内的绝对偏移量
-        target_x_in_client = round(relative_coord[0] * client_width)
-        target_y_in_client = round(relative_coord[1] * client_height)
-        
-        # 计算目标点在屏幕上的绝对坐标
-        screen_x = screen_client_left + target_x_in_client
-        screen_y = screen_client_top + target_y_in_client
-
-        screen_w_pyautogui, screen_h_pyautogui = pyautogui.size()
-        if 0 <= screen_x < screen_w_pyautogui and 0 <= screen_y < screen_h_pyautogui:
-            color = pyautogui.pixel(screen_x, screen_y)
+        backend = get_capture_backend(context)
+        screen_w, screen_h = backend.screen_size()
+        if 0 <= screen_x < screen_w and 0 <= screen_y < screen_h:
+            color = backend.pixel(screen_x, screen_y)
             logger.debug(f"get_pixel_color_relative: 颜色 @ rel {relative_coord} (abs client {target_x_in_client},{target_y_in_client}; abs screen {screen_x},{screen_y}) -> RGB: {color}")
             return color
         else:
-            logger.error(f"get_pixel_color_relative: 计算的屏幕坐标 ({screen_x},{screen_y}) 超出屏幕范围 ({screen_w_pyautogui}x{screen_h_pyautogui})。")
+            logger.error(f"get_pixel_color_relative: 计算的屏幕坐标 ({screen_x},{screen_y}) 超出屏幕范围 ({screen_w}x{screen_h})。")
             return None
     except Exception as e:
         logger.error(f"get_pixel_color_relative: 获取相对坐标 {relative_coord} 的像素颜色时出错: {e}")
         return None
 
+def get_pixel_colors_relative(context, window: 'pygetwindow.Win32Window', relative_coords: list, radius: int = 0):
+    """
+    一次截图同时读取多个相对坐标点的颜色，保证各点来自同一时刻的画面。
+    只截取包含所有点的最小矩形区域；radius > 0 时取每个点周围 (2*radius+1)^2 像素的平均颜色。
+
+    返回:
+        与 relative_coords 一一对应的 RGB 元组列表；整体失败时返回 None，单个点越界时对应位置为 None。
+    """
+    logger = getattr(context.shared, 'logger', logging)
+    if not window:
+        logger.error("get_pixel_colors_relative: NIKKE 窗口对象无效。")
+        return None
+    if not relative_coords:
+        return []
+
+    try:
+        geometry = get_screen_geometry(context, window)
+        if not geometry:
+            logger.error("get_pixel_colors_relative: 无法获取窗口客户区。")
+            return None
+
+        backend = get_capture_backend(context)
+        screen_w, screen_h = backend.screen_size()
+        points = [geometry.to_screen_point(coord) for coord in relative_coords]
+        left = max(0, min(x for x, _ in points) - radius)
+        top = max(0, min(y for _, y in points) - radius)
+        right = min(screen_w, max(x for x, _ in points) + radius + 1)
+        bottom = min(screen_h, max(y for _, y in points) + radius + 1)
+        if right <= left or bottom <= top:
+            logger.error(f"get_pixel_colors_relative: 所有坐标点 {points} 均超出屏幕范围 ({screen_w}x{screen_h})。")
+            return None
+
+        region_img = backend.grab((left, top, right - left, bottom - top))
+        try:
+            colors = []
+            for coord, (x, y) in zip(relative_coords, points):
+                if not (0 <= x < screen_w and 0 <= y < screen_h):
+                    logger.error(f"get_pixel_colors_relative: 坐标 {coord} -> 屏幕 ({x},{y}) 超出屏幕范围 ({screen_w}x{screen_h})。")
+                    colors.append(None)
+                    continue
+                local_x, local_y = x - left, y - top
+                if radius > 0:
+                    box = (max(0, local_x - radius), max(0, local_y - radius),
+                           min(region_img.width, local_x + radius + 1), min(region_img.height, local_y + radius + 1))
+                    color = tuple(round(v) for v in ImageStat.Stat(region_img.crop(box)).mean[:3])
+                else:
+                    color = tuple(region_img.getpixel((local_x, local_y))[:3])
+                logger.debug(f"get_pixel_colors_relative: 颜色 @ rel {coord} (abs screen {x},{y}, 半径 {radius}) -> RGB: {color}")
+                colors.append(color)
+            return colors
+        finally:
+            region_img.close()
+    except Exception as e:
+        logger.error(f"get_pixel_colors_relative: 批量获取坐标 {relative_coords} 的像素颜色时出错: {e}")
+        return None
+
 def get_or_create_mode_output_subdir(context, mode_identifier, subdir_basename=None) -> str:
     """
     获取或创建指定模式的输出子目录路径。
@@ -868,6 +1080,8 @@ def activate_nikke_window_if_needed(context):
     """
     如果 context.shared.nikke_window 存在且未激活，则尝试激活它。
     """
+    import win32gui
+    import win32con
     logger = getattr(context.shared, 'logger', logging)
     nikke_window_obj = getattr(context.shared, 'nikke_window', None)
 
@@ -901,6 +1115,7 @@ def activate_nikke_window_if_needed(context):
             win32gui.SetForegroundWindow(target_hwnd) # 再次尝试置顶
 
         time.sleep(core_constants.POST_WINDOW_ACTIVATION_DELAY) # 等待激活操作生效
+        invalidate_window_geometry(context) # 恢复/激活可能改变了窗口位置
 
         final_foreground_hwnd = win32gui.GetForegroundWindow()
         if final_foreground_hwnd == target_hwnd:
@@ -0,0 +1,446 @@
+# core/video_tools.py
+"""
+模式10 视频后期工具 (FFmpeg / FFprobe)。
+
+原实现把整段录像和 2 秒阵容图一起送进 filter_complex 重新编码 (libx264 ultrafast)，
+一局 5 分钟的 1080p60 录像要编码数分钟且有画质损失。这里改为:
+    1. probe_media: 用 ffprobe 读取录像的编码、分辨率、帧率、时间基、像素格式和音频参数；
+    2. build_intro_clip: 只把阵容图编码为与录像参数一致的 2 秒片头 (含同格式的静音音轨)；
+    3. concat_copy: 各部分无损转为带码流内参数集的 MPEG-TS 后以 -c copy 拼接，录像本身不重新编码；
+    4. verify_join: 解码拼接点之后的画面与原录像比较，确认录像部分可以正确解码。
+参数无法匹配 (未知编码、缺少 ffprobe、探测失败等) 时 intro_encode_args 返回 None，由调用方回退到重新编码。
+片尾裁剪使用 keyframe_times (只读数据包的关键帧列表)、iter_raw_frames (低分辨率、低帧率解码) 和 trim_copy。
+run_ffmpeg 以 -progress pipe:1 运行 FFmpeg，把进度解析为 FFmpegProgress 交给回调，并支持在停止信号时终止子进程。
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+import subprocess
+import collections
+from fractions import Fraction
+
+import numpy as np
+
+# Windows 下不弹出控制台窗口；其他平台为 0
+CREATE_NO_WINDOW = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+
+STDERR_TAIL_LINES = 20
+STOP_POLL_INTERVAL = 0.2
+
+# -progress 输出的一个进度块。out_time: 已输出的内容时长 (秒)；speed: 相对实时的倍速；
+# percent: 按预期时长计算的百分比 (未知时为 None)；elapsed: 已运行秒数；done: 是否为最后一块 (progress=end)
+FFmpegProgress = collections.namedtuple('FFmpegProgress',
+                                        ['frame', 'fps', 'speed', 'out_time', 'percent', 'elapsed', 'done'])
+
+# 录像视频编码 -> 片头使用的编码器 (编码器输出必须能与录像码流直接拼接)
+VIDEO_ENCODERS = {'h264': 'libx264', 'hevc': 'libx265'}
+AUDIO_ENCODERS = {'aac': 'aac', 'mp3': 'libmp3lame'}
+# ffprobe 的 H.264 profile 名称 -> libx264 的 -profile:v 参数
+X264_PROFILES = {
+    'constrained baseline': 'baseline', 'baseline': 'baseline', 'main': 'main',
+    'high': 'high', 'high 10': 'high10', 'high 4:2:2': 'high422', 'high 4:4:4 predictive': 'high444',
+}
+# 视频编码 -> (转为 Annex-B 的码流过滤器, 允许码流内参数集的 MP4 标记)
+ANNEXB_FILTERS = {'h264': ('h264_mp4toannexb', 'avc3'), 'hevc': ('hevc_mp4toannexb', 'hev1')}
+# 拼接校验: 比较的画面尺寸和允许的平均灰度差 (0-255)
+JOIN_CHECK_WIDTH, JOIN_CHECK_HEIGHT = 160, 90
+JOIN_CHECK_MAX_DIFF = 24.0
+
+
+def find_ffmpeg_tools(base_dir: str = None) -> tuple:
+    """返回 (ffmpeg 路径, ffprobe 路径)。优先使用程序目录下的 exe，其次是 PATH；找不到的为 None。"""
+    base_dir = base_dir or os.getcwd()
+    found = []
+    for name in ('ffmpeg', 'ffprobe'):
+        local = os.path.join(base_dir, f"{name}.exe")
+        found.append(local if os.path.exists(local) else shutil.which(name))
+    return tuple(found)
+
+
+class MediaInfo:
+    """ffprobe 结果中拼接所需的字段。video / audio 为对应流的原始字典 (没有该流时为 None)。"""
+
+    def __init__(self, probe: dict):
+        streams = probe.get('streams', [])
+        self.format = probe.get('format', {})
+        self.video = next((s for s in streams if s.get('codec_type') == 'video'
+                           and not s.get('disposition', {}).get('attached_pic')), None)
+        self.audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+
+    @property
+    def duration(self) -> float:
+        try:
+            return float(self.format.get('duration', 0))
+        except (TypeError, ValueError):
+            return 0.0
+
+    @property
+    def size(self) -> tuple:
+        return int(self.video.get('width', 0)), int(self.video.get('height', 0))
+
+    @property
+    def frame_rate(self):
+        """恒定帧率 (Fraction)；r_frame_rate 与 avg_frame_rate 差距过大 (可变帧率) 或无效时为 None。"""
+        try:
+            rate = Fraction(self.video.get('r_frame_rate', '0/0'))
+        except (ValueError, ZeroDivisionError):
+            return None
+        if rate <= 0:
+            return None
+        try:
+            avg = Fraction(self.video.get('avg_frame_rate', '0/0'))
+            if avg > 0 and abs(float(avg - rate)) / float(rate) > 0.05:
+                return None
+        except (ValueError, ZeroDivisionError):
+            pass
+        return rate
+
+    def describe(self) -> str:
+        if not self.video:
+            return "无视频流"
+        text = (f"{self.video.get('codec_name')} {self.size[0]}x{self.size[1]} "
+                f"{self.video.get('r_frame_rate')}fps {self.video.get('pix_fmt')} tb={self.video.get('time_base')}")
+        if self.audio:
+            text += (f", {self.audio.get('codec_name')} {self.audio.get('sample_rate')}Hz "
+                     f"{self.audio.get('channel_layout') or self.audio.get('channels')}")
+        return text
+
+
+def probe_media(ffprobe_exe: str, path: str, logger=None):
+    """用 ffprobe 读取媒体信息；失败时返回 None。"""
+    logger = logger or logging.getLogger(__name__)
+    if not ffprobe_exe:
+        return None
+    cmd = [ffprobe_exe, "-v", "error", "-print_format", "json", "-show_streams", "-show_format", path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, check=True, creationflags=CREATE_NO_WINDOW)
+        info = MediaInfo(json.loads(result.stdout.decode('utf-8', errors='replace')))
+    except Exception as e:
+        logger.warning(f"ffprobe 读取 '{os.path.basename(path)}' 失败: {e}")
+        return None
+    return info if info.video else None
+
+
+def intro_encode_args(info: MediaInfo, logger=None):
+    """
+    生成片头的编码参数，使其码流参数与录像一致 (可以 -c copy 拼接)。
+    返回 (视频参数列表, 音频参数列表或 None)；无法匹配时返回 None。
+    """
+    logger = logger or logging.getLogger(__name__)
+    if info is None or info.video is None:
+        return None
+    video = info.video
+    codec = video.get('codec_name')
+    encoder = VIDEO_ENCODERS.get(codec)
+    width, height = info.size
+    rate = info.frame_rate
+    pix_fmt = video.get('pix_fmt')
+    if not encoder or not width or not height or rate is None or not pix_fmt:
+        logger.info(f"录像参数无法直接匹配 ({info.describe()})，使用重新编码拼接。")
+        return None
+
+    video_args = ["-c:v", encoder, "-preset", "veryfast", "-pix_fmt", pix_fmt, "-r", str(rate)]
+    if codec == 'h264':
+        profile = X264_PROFILES.get(str(video.get('profile', '')).lower())
+        if profile:
+            video_args += ["-profile:v", profile]
+    for key, option in (('color_range', '-color_range'), ('color_space', '-colorspace'),
+                        ('color_primaries', '-color_primaries'), ('color_transfer', '-color_trc')):
+        value = video.get(key)
+        if value and value != 'unknown':
+            video_args += [option, value]
+
+    audio = info.audio
+    if audio is None:
+        return video_args, None
+    audio_encoder = AUDIO_ENCODERS.get(audio.get('codec_name'))
+    sample_rate = audio.get('sample_rate')
+    channels = int(audio.get('channels') or 0)
+    if not audio_encoder or not sample_rate or not channels:
+        logger.info(f"录像音频参数无法直接匹配 ({info.describe()})，使用重新编码拼接。")
+        return None
+    audio_args = ["-c:a", audio_encoder, "-ar", str(sample_rate), "-ac", str(channels)]
+    if audio.get('bit_rate'):
+        audio_args += ["-b:a", str(audio['bit_rate'])]
+    return video_args, audio_args
+
+
+def build_intro_clip(ffmpeg_exe: str, image_path: str, info: MediaInfo, output_path: str,
+                     duration: float = 2.0, logger=None, **run_kwargs) -> bool:
+    """把静态图片编码为与录像参数一致的片头 (按录像分辨率等比缩放并补黑边)。run_kwargs 传给 run_ffmpeg。"""
+    logger = logger or logging.getLogger(__name__)
+    encode_args = intro_encode_args(info, logger)
+    if encode_args is None:
+        return False
+    video_args, audio_args = encode_args
+    width, height = info.size
+    sar = info.video.get('sample_aspect_ratio') or '1:1'
+    if sar in ('0:1', 'N/A'):
+        sar = '1:1'
+    video_filter = (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                    f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar={sar.replace(':', '/')}")
+
+    cmd = [ffmpeg_exe, "-y", "-v", "error", "-loop", "1", "-framerate", str(info.frame_rate),
+           "-t", str(duration), "-i", image_path]
+    if audio_args is not None:
+        layout = info.audio.get('channel_layout') or ('mono' if int(info.audio['channels']) == 1 else 'stereo')
+        cmd += ["-f", "lavfi", "-t", str(duration),
+                "-i", f"anullsrc=channel_layout={layout}:sample_rate={info.audio['sample_rate']}"]
+    cmd += ["-map", "0:v"] + (["-map", "1:a"] if audio_args is not None else [])
+    cmd += ["-vf", video_filter] + video_args + (audio_args or [])
+    cmd += ["-t", str(duration), output_path]
+    return run_ffmpeg(cmd, logger, "编码片头", duration=duration, **run_kwargs)
+
+
+def concat_copy(ffmpeg_exe: str, parts, output_path: str, codec: str = 'h264', logger=None, **run_kwargs) -> bool:
+    """
+    以 -c copy 按顺序拼接 parts (各部分的编码、分辨率、帧率和音频参数必须一致)。
+    MP4 的 concat demuxer 只保留第一个输入的编码配置 (avcC 中的 SPS/PPS)，而片头 (libx264) 与录像
+    (NVENC/AMF/QSV 等) 的 SPS/PPS 几乎不会相同，直接拼接时录像部分可能解码成花屏。因此先把每一部分
+    无损转为 Annex-B 的 MPEG-TS (关键帧前带有各自的参数集)，再拼接 TS 并封装为 MP4，
+    视频轨使用允许码流内参数集的 avc3 / hev1 标记。run_kwargs 传给 run_ffmpeg。
+    """
+    logger = logger or logging.getLogger(__name__)
+    bsf, tag = ANNEXB_FILTERS[codec]
+    segment_paths = [f"{output_path}.part{i}.ts" for i in range(len(parts))]
+    list_path = f"{output_path}.concat.txt"
+    try:
+        for part, segment in zip(parts, segment_paths):
+            cmd = [ffmpeg_exe, "-y", "-v", "error", "-i", part, "-map", "0:v:0", "-map", "0:a:0?",
+                   "-c", "copy", "-bsf:v", bsf, "-f", "mpegts", segment]
+            if not run_ffmpeg(cmd, logger, f"转为 MPEG-TS ({os.path.basename(part)})", **run_kwargs):
+                return False
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for segment in segment_paths:
+                # concat 列表中的单引号需写作 '\''
+                escaped = os.path.abspath(segment).replace('\\', '/').replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        cmd = [ffmpeg_exe, "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+               "-map", "0:v:0", "-map", "0:a:0?", "-c", "copy", "-tag:v", tag,
+               "-movflags", "+faststart", output_path]
+        return run_ffmpeg(cmd, logger, "无损拼接", **run_kwargs)
+    finally:
+        for path in segment_paths + [list_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def grab_gray_frame(ffmpeg_exe: str, path: str, timestamp: float, size: tuple):
+    """解码 path 在 timestamp 处的一帧，缩放为 size (宽, 高) 的灰度数组；失败时返回 None。"""
+    width, height = size
+    cmd = [ffmpeg_exe, "-v", "error", "-nostdin", "-ss", f"{max(0.0, timestamp):.3f}", "-i", path,
+           "-frames:v", "1", "-vf", f"scale={width}:{height},format=gray", "-f", "rawvideo", "pipe:1"]
+    try:
+        result = subprocess.run(cmd, capture_output=True, check=True, creationflags=CREATE_NO_WINDOW)
+    except Exception:
+        return None
+    if len(result.stdout) < width * height:
+        return None
+    return np.frombuffer(result.stdout[:width * height], dtype=np.uint8).reshape(height, width)
+
+
+def verify_join(ffmpeg_exe: str, source_path: str, joined_path: str, offset: float, source_duration: float,
+                logger=None) -> bool:
+    """
+    解码拼接结果中录像部分的几帧 (拼接点之后不久和中段)，与原录像同一时刻的帧比较。
+    编码配置不兼容时解码结果是花屏或直接报错，与原帧差异很大；任一采样点失败即返回 False。
+    """
+    logger = logger or logging.getLogger(__name__)
+    size = (JOIN_CHECK_WIDTH, JOIN_CHECK_HEIGHT)
+    for t in (min(0.5, source_duration / 4), source_duration / 2):
+        expected = grab_gray_frame(ffmpeg_exe, source_path, t, size)
+        actual = grab_gray_frame(ffmpeg_exe, joined_path, offset + t, size)
+        if expected is None or actual is None:
+            logger.warning(f"拼接校验: 无法解码 {t:.1f}s 处的画面。")
+            return False
+        diff = float(np.abs(expected.astype(np.int16) - actual.astype(np.int16)).mean())
+        if diff > JOIN_CHECK_MAX_DIFF:
+            logger.warning(f"拼接校验: {t:.1f}s 处画面与原录像差异过大 (平均差 {diff:.1f})。")
+            return False
+    return True
+
+
+def keyframe_times(ffprobe_exe: str, path: str, start: float, end: float, logger=None) -> list:
+    """[start, end] 区间内视频关键帧的时间戳 (秒，升序)。只读取数据包，不解码。"""
+    logger = logger or logging.getLogger(__name__)
+    cmd = [ffprobe_exe, "-v", "error", "-select_streams", "v:0", "-read_intervals", f"{max(0.0, start):.3f}%{end:.3f}",
+           "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, check=True, creationflags=CREATE_NO_WINDOW)
+    except Exception as e:
+        logger.warning(f"读取 '{os.path.basename(path)}' 的关键帧失败: {e}")
+        return []
+    times = []
+    for line in result.stdout.decode('utf-8', errors='replace').splitlines():
+        pts_time, _, flags = line.strip().partition(',')
+        if 'K' in flags:
+            try:
+                times.append(float(pts_time))
+            except ValueError:
+                continue
+    return sorted(t for t in times if start <= t <= end)
+
+
+def iter_raw_frames(ffmpeg_exe: str, path: str, start: float, duration: float, fps: float,
+                    video_filter: str, size: tuple, should_stop=None, logger=None):
+    """
+    以 rgb24 原始帧解码 path 的 [start, start + duration) 区间，逐帧产出 (时间戳, (H, W, 3) uint8 数组)。
+    fps: 解码后的采样帧率；video_filter: 在采样后执行的滤镜 (例如裁剪和缩小)，输出尺寸必须为 size (宽, 高)。
+    """
+    logger = logger or logging.getLogger(__name__)
+    width, height = size
+    frame_bytes = width * height * 3
+    vf = f"fps={fps}" + (f",{video_filter}" if video_filter else "")
+    cmd = [ffmpeg_exe, "-v", "error", "-nostdin", "-ss", f"{max(0.0, start):.3f}", "-t", f"{duration:.3f}",
+           "-i", path, "-an", "-vf", vf, "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, creationflags=CREATE_NO_WINDOW)
+    try:
+        index = 0
+        while True:
+            if should_stop is not None and should_stop():
+                return
+            data = process.stdout.read(frame_bytes)
+            if len(data) < frame_bytes:
+                break
+            yield start + index / fps, np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+            index += 1
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        process.wait()
+
+
+def trim_copy(ffmpeg_exe: str, path: str, end_time: float, output_path: str, logger=None, **run_kwargs) -> bool:
+    """以 -c copy 保留 path 的 [0, end_time) 部分 (end_time 应为关键帧时间，切点处不会出现残缺的 GOP)。"""
+    logger = logger or logging.getLogger(__name__)
+    cmd = [ffmpeg_exe, "-y", "-v", "error", "-i", path, "-t", f"{end_time:.3f}", "-map", "0", "-c", "copy",
+           "-avoid_negative_ts", "make_zero", output_path]
+    return run_ffmpeg(cmd, logger, "裁剪片尾", duration=end_time, **run_kwargs)
+
+
+def _parse_out_time(value: str) -> float:
+    """'00:01:02.500000' -> 62.5；无效值 (例如 'N/A') 返回 0。"""
+    try:
+        hours, minutes, seconds = value.split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except (ValueError, AttributeError):
+        return 0.0
+
+def _parse_float(value: str) -> float:
+    try:
+        return float(str(value).rstrip('x'))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def run_ffmpeg(cmd, logger=None, description: str = "FFmpeg", on_progress=None,
+               should_stop=None, duration: float = 0.0, stats: dict = None) -> bool:
+    """
+    执行 FFmpeg 命令并解析 -progress 输出。
+    on_progress: 每个进度块 (FFmpeg 默认约每 0.5 秒一次) 调用一次，参数为 FFmpegProgress；
+    should_stop: 返回 True 时终止子进程 (先请求正常退出，超时再强制结束)，本函数返回 False；
+    duration: 输出的预期时长 (秒)，用于计算百分比；stats: 可选字典，返回用时、平均速度等统计。
+    失败时记录 stderr 的最后几行。
+    """
+    logger = logger or logging.getLogger(__name__)
+    cmd = [cmd[0], "-nostats", "-progress", "pipe:1"] + list(cmd[1:])
+    start = time.time()
+    stderr_tail = collections.deque(maxlen=STDERR_TAIL_LINES)
+    try:
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   creationflags=CREATE_NO_WINDOW)
+    except Exception as e:
+        logger.warning(f"{description}失败: {e}")
+        return False
+
+    def drain_stderr():
+        for raw in iter(process.stderr.readline, b''):
+            line = raw.decode('utf-8', errors='replace').strip()
+            if line:
+                stderr_tail.append(line)
+    stderr_thread = threading.Thread(target=drain_stderr, daemon=True)
+    stderr_thread.start()
+
+    # 停止检查在独立线程中进行，stdout 阻塞读取时也能及时终止子进程
+    cancelled = threading.Event()
+    finished = threading.Event()
+    def watch_stop():
+        while not finished.wait(STOP_POLL_INTERVAL):
+            if should_stop():
+                cancelled.set()
+                _terminate(process)
+                return
+    if should_stop is not None:
+        threading.Thread(target=watch_stop, daemon=True).start()
+
+    fields, last = {}, None
+    try:
+        for raw in iter(process.stdout.readline, b''):
+            key, sep, value = raw.decode('utf-8', errors='replace').strip().partition('=')
+            if not sep:
+                continue
+            fields[key] = value
+            if key != 'progress':
+                continue
+            out_time = _parse_out_time(fields.get('out_time', ''))
+            last = FFmpegProgress(
+                frame=int(_parse_float(fields.get('frame', 0))),
+                fps=_parse_float(fields.get('fps', 0)),
+                speed=_parse_float(fields.get('speed', 0)),
+                out_time=out_time,
+                percent=min(100.0, out_time / duration * 100) if duration else None,
+                elapsed=time.time() - start,
+                done=(value == 'end'),
+            )
+            if on_progress is not None:
+                try:
+                    on_progress(last)
+                except Exception as e:
+                    logger.debug(f"FFmpeg 进度回调失败: {e}")
+            fields = {}
+        returncode = process.wait()
+    finally:
+        finished.set()
+        if process.poll() is None:
+            _terminate(process)
+        stderr_thread.join(timeout=2.0)
+
+    elapsed = time.time() - start
+    if stats is not None:
+        stats.update({'elapsed': elapsed, 'frames': last.frame if last else 0,
+                      'out_time': last.out_time if last else 0.0,
+                      'speed': (last.out_time / elapsed) if last and elapsed else 0.0,
+                      'cancelled': cancelled.is_set(), 'returncode': returncode})
+    if cancelled.is_set():
+        logger.warning(f"{description}已因停止信号被终止 (运行 {elapsed:.1f}s)。")
+        return False
+    if returncode != 0:
+        logger.warning(f"{description}失败 (返回码 {returncode}): {' | '.join(list(stderr_tail)[-3:])}")
+        return False
+    if last is not None:
+        logger.debug(f"{description}完成: {last.frame} 帧，{last.out_time:.1f}s 内容，用时 {elapsed:.1f}s "
+                     f"({last.out_time / elapsed if elapsed else 0:.1f}x)")
+    return True
+
+def _terminate(process, grace: float = 5.0):
+    """请求 FFmpeg 正常退出 (stdin 写入 'q')，超时后 terminate / kill。"""
+    try:
+        process.stdin.write(b'q')
+        process.stdin.flush()
+    except (OSError, ValueError):
+        pass
+    try:
+        process.wait(timeout=grace)
+        return
+    except subprocess.TimeoutExpired:
+        pass
+    process.terminate()
+    try:
+        process.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
@@ -0,0 +1,142 @@
+# core/window_geometry.py
+"""
+窗口几何缓存。
+
+click_coordinates / capture_region_image / get_pixel_color_relative 等函数原先每次调用都要
+GetClientRect + ClientToScreen 并重新换算相对坐标。WindowGeometry 缓存客户区在屏幕上的位置，
+并按需缓存换算过的相对坐标/区域的屏幕绝对值 (客户区变化时清空)；同一坐标之后的换算只是查表。
+
+窗口是否移动/缩放通过一次 GetWindowRect 比较判断 (间隔 GEOMETRY_CHECK_INTERVAL 秒内不重复检查)，
+窗口被激活、恢复等可能改变位置的操作之后应调用 invalidate()。
+"""
+import time
+import logging
+from . import constants as core_constants
+
+
+class WindowGeometry:
+    """
+    某个窗口客户区的几何信息及相对坐标 -> 屏幕坐标的换算表。
+
+    hwnd 为 None 时不查询 win32 (例如回放后端)，客户区由 set_client_rect() 直接提供。
+    """
+
+    def __init__(self, hwnd=None, check_interval: float = core_constants.GEOMETRY_CHECK_INTERVAL, logger=None):
+        self.hwnd = hwnd
+        self.check_interval = check_interval
+        self.logger = logger or logging.getLogger(__name__)
+        self.client_rect = None  # (left, top, width, height)，屏幕坐标
+        self._window_rect = None
+        self._last_check = 0.0
+        self._points = {}
+        self._regions = {}
+
+    def invalidate(self):
+        """强制下一次访问时重新读取窗口位置。"""
+        self._window_rect = None
+        self._last_check = 0.0
+
+    def refresh(self) -> bool:
+        """
+        必要时重新读取客户区。窗口未移动/缩放时不做任何换算。
+        返回 False 表示客户区无效 (例如窗口已关闭或最小化)。
+        """
+        if self.hwnd is None:
+            return self.client_rect is not None
+        now = time.perf_counter()
+        if self.client_rect is not None and now - self._last_check < self.check_interval:
+            return True
+        self._last_check = now
+
+        import win32gui  # 只有实时窗口 (hwnd 不为 None) 才需要 win32 API
+        window_rect = win32gui.GetWindowRect(self.hwnd)
+        if window_rect == self._window_rect and self.client_rect is not None:
+            return True
+
+        client_left, client_top, client_right, client_bottom = win32gui.GetClientRect(self.hwnd)
+        client_width = client_right - client_left
+        client_height = client_bottom - client_top
+        if client_width <= 0 or client_height <= 0:
+            self.logger.error(f"错误：获取到的窗口客户区尺寸无效 (Width={client_width}, Height={client_height})。")
+            self.client_rect = None
+            self._window_rect = None
+            return False
+
+        screen_left, screen_top = win32gui.ClientToScreen(self.hwnd, (client_left, client_top))
+        self._window_rect = window_rect
+        self.set_client_rect((screen_left, screen_top, client_width, client_height))
+        return True
+
+    def set_client_rect(self, client_rect: tuple):
+        """设置客户区；与当前值不同时清空换算缓存。"""
+        client_rect = tuple(client_rect)
+        if client_rect == self.client_rect:
+            return
+        self.client_rect = client_rect
+        self._points = {}
+        self._regions = {}
+        self.logger.debug(f"窗口客户区更新为 {client_rect}。")
+
+    def to_client_point(self, relative_coord: tuple) -> tuple:
+        """相对坐标 (比例X, 比例Y) -> 客户区内像素坐标。"""
+        return (round(relative_coord[0] * self.client_rect[2]), round(relative_coord[1] * self.client_rect[3]))
+
+    def to_screen_point(self, relative_coord: tuple) -> tuple:
+        """相对坐标 (比例X, 比例Y) -> 屏幕绝对坐标 (x, y)。"""
+        key = tuple(relative_coord)
+        point = self._points.get(key)
+        if point is None:
+            x, y = self.to_client_point(key)
+            point = (self.client_rect[0] + x, self.client_rect[1] + y)
+            self._points[key] = point
+        return point
+
+    def to_screen_region(self, relative_region: tuple) -> tuple:
+        """相对区域 (rel_left, rel_top, rel_width, rel_height) -> 屏幕区域 (left, top, width, height)。"""
+        key = tuple(relative_region)
+        region = self._regions.get(key)
+        if region is None:
+            left, top, width, height = self.client_rect
+            region = (
+                left + round(key[0] * width),
+                top + round(key[1] * height),
+                round(key[2] * width),
+                round(key[3] * height),
+            )
+            self._regions[key] = region
+        return region
+
+
+def get_window_geometry(context, window, backend_rect: tuple = None):
+    """
+    获取 (并缓存于 context.shared.window_geometry) 窗口的几何缓存，必要时刷新。
+    backend_rect 不为 None 时 (截图后端自行提供客户区)，直接使用它而不查询 win32。
+    失败时返回 None。
+    """
+    shared = getattr(context, 'shared', None)
+    logger = getattr(shared, 'logger', logging)
+    hwnd = None if backend_rect is not None else getattr(window, '_hWnd', None)
+    if backend_rect is None and not hwnd:
+        logger.error("错误：无法从 pygetwindow 对象获取窗口句柄 (HWND)。")
+        return None
+
+    geometry = getattr(shared, 'window_geometry', None)
+    if geometry is None or geometry.hwnd != hwnd:
+        app_config = getattr(shared, 'app_config', None) or {}
+        check_interval = app_config.get('global_settings', {}).get(
+            'geometry_check_interval', core_constants.GEOMETRY_CHECK_INTERVAL)
+        geometry = WindowGeometry(hwnd, check_interval=float(check_interval), logger=logger)
+        if shared is not None:
+            shared.window_geometry = geometry
+
+    if backend_rect is not None:
+        geometry.set_client_rect(backend_rect)
+        return geometry
+    return geometry if geometry.refresh() else None
+
+
+def invalidate_window_geometry(context):
+    """窗口可能被移动、恢复或重新激活后调用，使下一次换算重新读取窗口位置。"""
+    geometry = getattr(getattr(context, 'shared', None), 'window_geometry', None)
+    if geometry is not None:
+        geometry.invalidate()
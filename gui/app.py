@@ -192,6 +192,9 @@ class NikkeGuiApp(ctk.CTk):
 
         # 创建状态组件
         self.status_component = StatusComponent(control_area, self.event_handler.handle_retry_nikke)
+        # 脚本线程通过 core.utils.report_status 汇报进度，切换到 GUI 线程后更新状态栏
+        if hasattr(self.app_context, 'shared'):
+            self.app_context.shared.status_callback = lambda text: self.after(0, self.status_component.update_status, text)
 
         # 创建控制按钮组件
         self.control_buttons = ControlButtonComponent(
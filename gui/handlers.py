@@ -228,6 +228,15 @@ class EventHandler:
 
             mode_specific_inputs['m9_actual_input_dir'] = input_dir
 
+        # 模式11：要采集的界面状态名称
+        if self.app_instance.current_mode_value == 11:
+            state_name = self.app_instance.script_runner.prompt_for_mode11_state_name()
+            if not state_name:
+                self.app_instance.status_component.update_status("模式11启动取消：未输入界面状态名称。")
+                self._cancel_script_start()
+                return None
+            mode_specific_inputs['m11_state_name'] = state_name
+
         # 模式7：目标分组索引（预留，目前由app.py处理）
         if self.app_instance.current_mode_value == 7:
             # 预留：可以在这里添加GUI输入对话框
@@ -2,7 +2,7 @@ import threading
 import time
 import logging
 import os
-from customtkinter import filedialog
+from customtkinter import filedialog, CTkInputDialog
 from app import execute_mode, setup_app_environment
 from core.utils import activate_nikke_window_if_needed
 
@@ -130,6 +130,26 @@ class ScriptRunner:
             logger.warning("模式9输入目录未选择。")
             return None
 
+    def prompt_for_mode11_state_name(self):
+        """提示用户输入模式11要采集的界面状态名称 (默认取 config.json 中 mode11.state_name)"""
+        logger = self._get_logger()
+        app_config = getattr(getattr(self.app_context, 'shared', None), 'app_config', None) or {}
+        default_name = app_config.get('mode_specific_defaults', {}).get('mode11', {}).get('state_name', 'player_detail')
+
+        dialog = CTkInputDialog(
+            title="模式11 界面状态模板采集",
+            text=("请先在游戏中打开要识别的界面，然后输入界面状态名称\n"
+                  "(bracket_view / player_detail / team_view / result_overlay / replay_playing)，"
+                  f"留空使用 {default_name}:")
+        )
+        state_name = dialog.get_input()
+        if state_name is None:
+            logger.warning("模式11界面状态名称未输入。")
+            return None
+        state_name = state_name.strip() or default_name
+        logger.info(f"模式11界面状态名称: {state_name}")
+        return state_name
+
     def _get_logger(self):
         """获取日志记录器"""
         if self.app_context and hasattr(self.app_context, 'shared') and self.app_context.shared.logger:
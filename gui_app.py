@@ -1,5 +1,6 @@
 import ctypes
 import sys
+import multiprocessing
 from gui.app import NikkeGuiApp
 
 
@@ -23,6 +24,9 @@ def check_admin_and_exit_if_not():
 
 
 if __name__ == '__main__':
+    # 打包为 exe 后，模式9 的转换进程池启动的子进程需要在这里直接返回
+    multiprocessing.freeze_support()
+
     # 检查管理员权限
     check_admin_and_exit_if_not()
 
@@ -62,7 +62,7 @@ def run(context):
         player2_name_for_file = getattr(mode_config, 'm1_player2_name', 'P2').replace(' ', '_')
         
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        final_output_filename = f"{base_name}_{player1_name_for_file}_vs_{player2_name_for_file}{suffix}_{timestamp}.png"
+        final_output_filename = f"{base_name}_{player1_name_for_file}_vs_{player2_name_for_file}{suffix}_{timestamp}{core_utils.get_output_extension(context)}"
         
         # 使用新的辅助函数获取或创建模式输出子目录
         output_dir_for_mode1 = core_utils.get_or_create_mode_output_subdir(context, 1, "predictions")
@@ -4,6 +4,11 @@
 """
 from core import utils as core_utils
 from core import constants as core_constants
+from core import stitching
+from core import video_tools
+from core.job_queue import PostProcessQueue
+from core.recording_watcher import RecordingWatcher
+from core.intro_cache import IntroClipCache, intro_cache_key
 import os
 import datetime
 import time
@@ -12,7 +17,8 @@ import numpy as np
 import pyautogui
 import shutil
 import glob
-import subprocess
+import threading
+import collections
 
 
 class ExternalRecorderController:
@@ -29,11 +35,16 @@ class ExternalRecorderController:
         self.stop_hotkey = m10_config.get("m10_stop_hotkey", "alt+f9").lower().split("+")
         self.source_dir = m10_config.get("m10_source_dir", "")
         self.target_dir = m10_config.get("m10_target_dir", "")
+        self.file_wait_timeout = float(m10_config.get("m10_file_wait_timeout", 60.0))
+        self.file_stable_seconds = float(m10_config.get("m10_file_stable_seconds", 1.0))
         
         self.is_recording = False
+        self.watcher = RecordingWatcher(self.source_dir, logger=self.logger)
 
     def start_recording(self):
         if self.is_recording: return
+        # 先记录源目录中已有的文件，停止录制后只识别本次新产生的文件
+        self.watcher.snapshot()
         self.logger.info(f"触发开始录制热键: {'+'.join(self.start_hotkey)}")
         pyautogui.hotkey(*self.start_hotkey)
         self.is_recording = True
@@ -46,6 +57,21 @@ class ExternalRecorderController:
         self.is_recording = False
         return True
 
+    def wait_for_recording(self):
+        """
+        停止录制后等待本次录制的文件写入完成并返回其路径。
+        没有开始前快照时退回 get_latest_video (源目录未设置或不存在时立即返回 None)。
+        """
+        if not self.watcher.has_snapshot:
+            if not self.source_dir or not os.path.isdir(self.source_dir):
+                self.logger.warning(f"录像源目录未设置或不存在: '{self.source_dir}'，跳过视频合成。")
+                return None
+            time.sleep(3.0)
+            return self.get_latest_video()
+        return self.watcher.wait_for_recording(
+            timeout=self.file_wait_timeout, stable_seconds=self.file_stable_seconds,
+            should_stop=lambda: getattr(self.context.shared, 'stop_requested', False))
+
     def get_latest_video(self):
         """获取源目录下最新的视频文件"""
         if not self.source_dir or not os.path.exists(self.source_dir):
@@ -102,41 +128,14 @@ def capture_lineup(context, window, side="left", team_idx=0):
     return save_path, player_id
 
 
-def process_video_with_lineup(context, video_path, left_img, right_img, left_player_id, right_player_id, match_index, is_win=None):
-    """
-    使用 FFmpeg 将阵容图拼接到视频开头
-    """
-    logger = context.shared.logger
-    ffmpeg_exe = os.path.join(os.getcwd(), "ffmpeg.exe")
-    if not os.path.exists(ffmpeg_exe):
-        logger.error("未找到 ffmpeg.exe，跳过后期合成。")
-        return video_path
+INTRO_DURATION = 2.0  # 片头时长 (秒)
+INTRO_CARD_VERSION = 1  # 修改 render_lineup_card 的画面时递增，使旧的片头缓存失效
 
-    target_dir = context.shared.app_config.get("mode_10", {}).get("m10_target_dir", "")
-    if not target_dir: return video_path
-    
-    # 获取命名所需的配置信息
-    m10_config = context.shared.app_config.get("mode_10", {})
-    season = m10_config.get("m10_season", 1)
-    match_stage = m10_config.get("m10_match_stage", "未知阶段")
-    
-    # 构建新的文件名 (包含日期和时间)
-    now = datetime.datetime.now()
-    current_date = now.strftime("%Y-%m-%d")
-    current_time = now.strftime("%H%M%S")
-    filename = f"S{season}_{match_stage}_Match{match_index+1}_{current_date}_{current_time}.mp4"
-    
-    # 按赛季创建子文件夹
-    season_dir = os.path.join(target_dir, f"S{season}")
-    if not os.path.exists(season_dir):
-        os.makedirs(season_dir, exist_ok=True)
-    
-    final_output = os.path.join(season_dir, filename)
-    
-    # 1. 合成阵容对比图 (1920x1080 背景)
-    lineup_bg_path = os.path.join(context.shared.base_temp_dir, f"lineup_bg_{match_index}.png")
+
+def render_lineup_card(context, left_img, right_img, is_win, output_path):
+    """把双方阵容图和胜负标记合成为 1920x1080 的片头画面并写入 output_path；读取截图失败时返回 False。"""
+    logger = context.shared.logger
     bg_width, bg_height = 1920, 1080
-    bg = np.zeros((bg_height, bg_width, 3), dtype=np.uint8)
     
     img_l = cv2.imread(left_img)
     img_r = cv2.imread(right_img)
@@ -168,8 +167,12 @@ def process_video_with_lineup(context, video_path, left_img, right_img, left_pla
         start_x_r = bg_width // 2 + spacing // 2 - 20 # 额外右边距
         start_y_r = (bg_height - new_h_r) // 2
 
-        bg[start_y_l:start_y_l+new_h_l, start_x_l:start_x_l+new_w_l] = img_l_resized
-        bg[start_y_r:start_y_r+new_h_r, start_x_r:start_x_r+new_w_r] = img_r_resized
+        # 由布局引擎把两张阵容图直接写入预分配的黑色背景 (cv2 数组为 BGR，背景色与通道顺序无关)
+        plan = stitching.LayoutPlan(bg_width, bg_height, [
+            (start_x_l, start_y_l, new_w_l, new_h_l),
+            (start_x_r, start_y_r, new_w_r, new_h_r),
+        ])
+        bg = stitching.render_plan(plan, [img_l_resized, img_r_resized], (0, 0, 0))
 
         # 根据胜负添加 WIN 字样 (移除 VS)
         if is_win in [1, 2]:
@@ -187,18 +190,92 @@ def process_video_with_lineup(context, video_path, left_img, right_img, left_pla
             
             cv2.putText(bg, text, win_pos, font, font_scale, color, font_thickness)
         
-        cv2.imwrite(lineup_bg_path, bg)
+        cv2.imwrite(output_path, bg)
+        return True
+    logger.error("读取阵容截图失败，跳过合成。")
+    return False
+
+
+def process_video_with_lineup(context, video_path, left_img, right_img, left_player_id, right_player_id, match_index, is_win=None,
+                              client_size=None):
+    """
+    使用 FFmpeg 将阵容图拼接到视频开头
+    client_size: 录制时游戏窗口客户区的 (宽, 高)，片尾裁剪据此确认录像画面就是客户区。
+    原始录像只在最终视频生成成功后才删除。
+    """
+    logger = context.shared.logger
+    ffmpeg_exe, ffprobe_exe = video_tools.find_ffmpeg_tools()
+    if not ffmpeg_exe:
+        logger.error("未找到 ffmpeg.exe，跳过后期合成。")
+        return video_path
+
+    target_dir = context.shared.app_config.get("mode_10", {}).get("m10_target_dir", "")
+    if not target_dir: return video_path
+    
+    # 获取命名所需的配置信息
+    m10_config = context.shared.app_config.get("mode_10", {})
+    season = m10_config.get("m10_season", 1)
+    match_stage = m10_config.get("m10_match_stage", "未知阶段")
+    
+    # 构建新的文件名 (包含日期和时间)
+    now = datetime.datetime.now()
+    current_date = now.strftime("%Y-%m-%d")
+    current_time = now.strftime("%H%M%S")
+    filename = f"S{season}_{match_stage}_Match{match_index+1}_{current_date}_{current_time}.mp4"
+    
+    # 按赛季创建子文件夹
+    season_dir = os.path.join(target_dir, f"S{season}")
+    if not os.path.exists(season_dir):
+        os.makedirs(season_dir, exist_ok=True)
+    
+    final_output = os.path.join(season_dir, filename)
+    
+    # 裁剪后的录像是临时文件，合成结束 (无论成功与否) 后删除；原始录像只在合成成功后删除
+    try:
+        return _compose_final_video(context, ffmpeg_exe, ffprobe_exe, video_path, left_img, right_img,
+                                    match_index, is_win, client_size, final_output)
+    finally:
+        trimmed_path = _trimmed_path_for(video_path)
+        if os.path.exists(trimmed_path): os.remove(trimmed_path)
+
+
+def _compose_final_video(context, ffmpeg_exe, ffprobe_exe, video_path, left_img, right_img,
+                         match_index, is_win, client_size, final_output):
+    """process_video_with_lineup 的合成部分：成功返回 final_output 并删除原始录像，失败返回 video_path。"""
+    logger = context.shared.logger
+    source_path = video_path
+
+    # 1. 优先无损拼接: 取得 (缓存的或新编码的) 与录像参数一致的 2 秒片头，再以 -c copy 拼接，录像本身不重新编码
+    info = video_tools.probe_media(ffprobe_exe, video_path, logger)
+    if info is None:
+        logger.info("无法读取录像参数 (缺少 ffprobe 或探测失败)，使用重新编码拼接。")
     else:
-        logger.error("读取阵容截图失败，跳过合成。")
+        logger.info(f"录像参数: {info.describe()}")
+        source_path, info = trim_result_tail(context, ffmpeg_exe, ffprobe_exe, video_path, info, client_size)
+        intro_path, cached = get_intro_clip(context, ffmpeg_exe, info, left_img, right_img, is_win, INTRO_DURATION)
+        try:
+            if intro_path and _concat_intro_stream_copy(context, ffmpeg_exe, ffprobe_exe, info, intro_path,
+                                                        source_path, final_output, INTRO_DURATION):
+                if os.path.exists(video_path): os.remove(video_path)
+                return final_output
+        finally:
+            if intro_path and not cached and os.path.exists(intro_path): os.remove(intro_path)
+    if _stop_requested(context):
+        logger.warning("已收到停止信号，跳过视频合成，保留原始录像。")
         return video_path
 
-    # 2. FFmpeg 合成指令: [阵容图2秒] + [原视频]
+    # 2. 回退: 合成阵容对比图 (1920x1080 背景)，与录像一起整体重新编码
+    lineup_bg_path = os.path.join(context.shared.base_temp_dir, f"lineup_bg_{match_index}.png")
+    if not render_lineup_card(context, left_img, right_img, is_win, lineup_bg_path):
+        return video_path
+
+    # FFmpeg 合成指令: [阵容图2秒] + [原视频]
     # 使用 filter_complex 实现无缝拼接，并添加静音音轨
     cmd = [
         ffmpeg_exe, "-y",
         "-loop", "1", "-t", "2", "-i", lineup_bg_path, # 2秒图片
         "-f", "lavfi", "-i", "anullsrc=channel_layout=stereo:sample_rate=44100", # 2秒静音音轨
-        "-i", video_path,
+        "-i", source_path,
         "-filter_complex", 
         "[0:v]format=yuv420p,setsar=1[v0];" # 阵容图视频流
         "[1:a]atrim=duration=2[a0];" # 2秒静音音轨
@@ -211,71 +288,400 @@ def process_video_with_lineup(context, video_path, left_img, right_img, left_pla
         final_output
     ]
     
-    try:
-        logger.info(f"正在合成最终视频: {os.path.basename(final_output)}")
-        subprocess.run(cmd, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-        logger.info("合成完成！")
-        # 清理临时文件和原视频
-        if os.path.exists(video_path): os.remove(video_path)
-        if os.path.exists(lineup_bg_path): os.remove(lineup_bg_path)
-        return final_output
-    except Exception as e:
-        logger.error(f"FFmpeg 合成失败: {e}")
+    logger.info(f"正在合成最终视频: {os.path.basename(final_output)}")
+    run_kwargs = _ffmpeg_run_kwargs(context, "重新编码合成", info.duration + 2 if info else 0.0)
+    if not video_tools.run_ffmpeg(cmd, logger, "FFmpeg 合成", **run_kwargs):
+        logger.error(f"FFmpeg 合成失败，保留原始录像: {video_path}")
+        if os.path.exists(final_output): os.remove(final_output)
+        return video_path
+    _log_ffmpeg_metrics(context, "重新编码合成", run_kwargs['stats'])
+    # 确认输出完整后再删除原始录像 (ffprobe 不可用时只依赖 FFmpeg 的返回码)
+    result = video_tools.probe_media(ffprobe_exe, final_output, logger) if ffprobe_exe else None
+    if ffprobe_exe and (result is None or (info and result.duration < info.duration + 1.0)):
+        logger.error(f"合成结果校验失败，保留原始录像: {video_path}")
+        if os.path.exists(final_output): os.remove(final_output)
         return video_path
+    logger.info("合成完成！")
+    # 清理临时文件和原视频
+    if os.path.exists(video_path): os.remove(video_path)
+    if os.path.exists(lineup_bg_path): os.remove(lineup_bg_path)
+    return final_output
+
+
+def _stop_requested(context) -> bool:
+    return bool(getattr(context.shared, 'stop_requested', False))
+
+def _ffmpeg_run_kwargs(context, label, duration=0.0):
+    """
+    video_tools.run_ffmpeg 的进度/取消参数: 进度显示在 GUI 状态栏，停止信号终止 FFmpeg 子进程。
+    返回的 'stats' 字典在运行结束后包含用时和速度 (见 _log_ffmpeg_metrics)。
+    """
+    def on_progress(progress):
+        percent = f"{progress.percent:.0f}% " if progress.percent is not None else ""
+        core_utils.report_status(context, f"{label}: {percent}{progress.out_time:.0f}s "
+                                          f"帧 {progress.frame}，{progress.fps:.0f} fps，{progress.speed:.1f}x")
+    return {'on_progress': on_progress, 'should_stop': lambda: _stop_requested(context),
+            'duration': duration, 'stats': {}}
+
+def _log_ffmpeg_metrics(context, label, stats):
+    if not stats:
+        return
+    elapsed = stats.get('elapsed', 0.0)
+    context.shared.logger.info(f"{label}: {stats.get('frames', 0)} 帧 / {stats.get('out_time', 0.0):.1f}s 内容，"
+                               f"用时 {elapsed:.1f}s ({stats.get('speed', 0.0):.1f}x 实时)")
+
+
+def get_intro_clip(context, ffmpeg_exe, info, left_img, right_img, is_win, duration=INTRO_DURATION):
+    """
+    片头阶段: 返回 (片头路径, 是否来自缓存)。片头按录像参数 info 编码，可直接与录像 -c copy 拼接。
+    缓存键由两张阵容截图的内容、胜负结果和输出参数决定，命中时跳过阵容图渲染和片头编码；
+    参数无法匹配或编码失败时返回 (None, False)。
+    """
+    logger = context.shared.logger
+    encode_args = video_tools.intro_encode_args(info, logger)
+    if encode_args is None:
+        return None, False
+    cache = _get_intro_cache(context)
+    key = None
+    if cache is not None:
+        params = {'encode': encode_args, 'size': info.size, 'sar': info.video.get('sample_aspect_ratio'),
+                  'duration': duration, 'card': INTRO_CARD_VERSION}
+        try:
+            key = intro_cache_key([left_img, right_img], is_win, params)
+        except OSError as e:
+            logger.warning(f"计算片头缓存键失败: {e}")
+        cached_path = cache.get(key) if key else None
+        if cached_path:
+            logger.info(f"使用缓存的片头: {os.path.basename(cached_path)}")
+            return cached_path, True
+
+    stamp = f"{os.getpid()}_{threading.get_ident()}_{int(time.time() * 1000)}"
+    card_path = os.path.join(context.shared.base_temp_dir, f"lineup_card_{stamp}.png")
+    intro_path = os.path.join(context.shared.base_temp_dir, f"intro_{stamp}.mp4")
+    try:
+        if not render_lineup_card(context, left_img, right_img, is_win, card_path):
+            return None, False
+        intro_kwargs = _ffmpeg_run_kwargs(context, "编码片头", duration)
+        if not video_tools.build_intro_clip(ffmpeg_exe, card_path, info, intro_path, duration, logger, **intro_kwargs):
+            if os.path.exists(intro_path): os.remove(intro_path)
+            return None, False
+        _log_ffmpeg_metrics(context, "编码片头", intro_kwargs['stats'])
+    finally:
+        if os.path.exists(card_path): os.remove(card_path)
+
+    if cache is not None and key:
+        try:
+            return cache.put(key, intro_path), True
+        except OSError as e:
+            logger.warning(f"写入片头缓存失败: {e}")
+    return intro_path, False
+
+def _get_intro_cache(context):
+    """按 mode_10 配置创建 (一次) 片头缓存；创建失败时记为 False，之后不再缓存。"""
+    cache = getattr(context.shared, 'intro_cache', None)
+    if cache is None:
+        m10_config = context.shared.app_config.get("mode_10", {})
+        cache_dir = m10_config.get("m10_intro_cache_dir", "intro_cache")
+        if not os.path.isabs(cache_dir):
+            cache_dir = os.path.join(core_utils.get_base_path(), cache_dir)
+        try:
+            cache = IntroClipCache(cache_dir,
+                                   max_entries=m10_config.get("m10_intro_cache_max_entries", 32),
+                                   max_bytes=int(m10_config.get("m10_intro_cache_max_mb", 512)) * 1024 * 1024,
+                                   logger=context.shared.logger)
+        except OSError as e:
+            context.shared.logger.warning(f"无法创建片头缓存目录 '{cache_dir}'，本次不缓存片头: {e}")
+            cache = False
+        context.shared.intro_cache = cache
+    return cache or None
+
+def _concat_intro_stream_copy(context, ffmpeg_exe, ffprobe_exe, info, intro_path, video_path, final_output, duration=INTRO_DURATION):
+    """
+    把片头与录像 -c copy 拼接，并校验结果时长和录像部分能否正确解码 (见 video_tools.verify_join)。
+    成功返回 True；失败时删除不完整的输出并返回 False (由调用方回退到重新编码)。
+    """
+    logger = context.shared.logger
+    start = time.time()
+    logger.info(f"正在无损拼接最终视频: {os.path.basename(final_output)}")
+    concat_kwargs = _ffmpeg_run_kwargs(context, "无损拼接", info.duration + duration)
+    if not video_tools.concat_copy(ffmpeg_exe, [intro_path, video_path], final_output,
+                                   info.video.get('codec_name'), logger, **concat_kwargs):
+        if os.path.exists(final_output): os.remove(final_output)
+        return False
+    _log_ffmpeg_metrics(context, "无损拼接", concat_kwargs['stats'])
+    # 校验时长，防止拼接结果被截断 (例如录像中途参数变化)
+    result = video_tools.probe_media(ffprobe_exe, final_output, logger)
+    expected = info.duration + duration
+    if result is None or (info.duration and result.duration < expected - 1.0):
+        logger.warning(f"无损拼接结果时长异常 ({result.duration if result else 0:.1f}s / 预期 {expected:.1f}s)，改用重新编码。")
+        if os.path.exists(final_output): os.remove(final_output)
+        return False
+    if not video_tools.verify_join(ffmpeg_exe, video_path, final_output, duration, info.duration, logger):
+        logger.warning("无损拼接结果中的录像部分无法正确解码，改用重新编码。")
+        if os.path.exists(final_output): os.remove(final_output)
+        return False
+    logger.info(f"无损拼接完成，用时 {time.time() - start:.1f}s。")
+    return True
+
+
+# [WIN] 标志区域 (基于用户提供的 2372*1383 分辨率下的坐标 (990, 117) 到 (1368, 361))
+# x_rel = 990 / 2372 ≈ 0.417, y_rel = 117 / 1383 ≈ 0.085
+# w_rel = (1368-990) / 2372 ≈ 0.159, h_rel = (361-117) / 1383 ≈ 0.176
+WIN_REGION_REL = (0.417, 0.085, 0.159, 0.176)
+# 占比阈值 (占比 = 命中像素数 / (像素数 * 3)，与最初基于 img.size 的计算方式保持一致)
+WIN_BLUE_RATIO_THRESHOLD = 0.005
+WIN_RED_RATIO_THRESHOLD = 0.01
+WIN_DETECT_DOWNSAMPLE = 2  # 检测前按此步长对 ROI 降采样 (行列各取 1/N)
+WIN_DETECT_BAND_ROWS = 16  # 每次累计判断的行数，阈值一旦可判定即提前结束
+WIN_DETECT_INTERVAL = 0.1  # 结算监控的采样间隔 (秒)
+FRAME_BUFFER_SIZE = 8  # 后台截图线程的环形缓冲帧数
+
+
+def _build_win_luts():
+    """
+    为每个通道预计算 0-255 -> 位掩码的查找表。bit0 = 青色条件, bit1 = 红色条件。
+    三个通道的查表结果按位与后即为每个像素的分类结果，无需逐条件构造完整的布尔掩码。
+    青色 (左边赢): R < 120, G > 180, B > 180；红色 (右边赢): R > 200, G < 100, B < 100。
+    """
+    values = np.arange(256)
+    lut_r = ((values < 120) * 1 | (values > 200) * 2).astype(np.uint8)
+    lut_gb = ((values > 180) * 1 | (values < 100) * 2).astype(np.uint8)
+    return lut_r, lut_gb, lut_gb
+
+_WIN_LUT_R, _WIN_LUT_G, _WIN_LUT_B = _build_win_luts()
+
+
+def classify_win_banner(img_rgb, downsample: int = WIN_DETECT_DOWNSAMPLE):
+    """
+    对 [WIN] 标志区域的 RGB 数组 (H, W, 3) 做青/红像素占比分类。
+    按行带累计命中数，青色或红色结果一旦确定 (或已不可能越过阈值) 即提前返回。
+
+    返回:
+        (result, blue_ratio, red_ratio): result 为 1 (左边赢, 青色)、2 (右边赢, 红色) 或 None；
+        提前返回时占比为截至当时的累计值。
+    """
+    if downsample > 1:
+        img_rgb = img_rgb[::downsample, ::downsample]
+    rows = img_rgb.shape[0]
+    total = img_rgb.shape[0] * img_rgb.shape[1] * 3
+    if total == 0:
+        return None, 0.0, 0.0
+    blue_limit = WIN_BLUE_RATIO_THRESHOLD * total
+    red_limit = WIN_RED_RATIO_THRESHOLD * total
+    pixels_per_row = img_rgb.shape[1]
+
+    blue = red = 0
+    for top in range(0, rows, WIN_DETECT_BAND_ROWS):
+        band = img_rgb[top:top + WIN_DETECT_BAND_ROWS]
+        codes = _WIN_LUT_R[band[:, :, 0]] & _WIN_LUT_G[band[:, :, 1]] & _WIN_LUT_B[band[:, :, 2]]
+        counts = np.bincount(codes.ravel(), minlength=4)
+        blue += int(counts[1])
+        red += int(counts[2])
+        remaining = (rows - top - band.shape[0]) * pixels_per_row
+
+        # 与原判定顺序一致：青色优先
+        if blue > blue_limit:
+            return 1, blue / total, red / total
+        if blue + remaining <= blue_limit:
+            if red > red_limit:
+                return 2, blue / total, red / total
+            if red + remaining <= red_limit:
+                return None, blue / total, red / total
+    return None, blue / total, red / total
+
+
+def _classify_win_frame(context, img_rgb):
+    """对一帧 [WIN] 区域 RGB 数组分类并输出日志，返回值同 detect_win_screen。"""
+    m10_config = context.shared.app_config.get("mode_10", {})
+    downsample = int(m10_config.get("m10_win_detect_downsample", WIN_DETECT_DOWNSAMPLE))
+    result, blue_ratio, red_ratio = classify_win_banner(img_rgb, downsample)
+
+    # 采样频率较高，占比细节只在 debug 级别输出
+    context.shared.logger.debug(f"结算标志检测 - 青色占比: {blue_ratio:.4f}, 红色占比: {red_ratio:.4f}")
+    if result == 1:
+        context.shared.logger.info(f"检测到结算标志：[WIN] (青色/左赢, 占比: {blue_ratio:.4f})")
+    elif result == 2:
+        context.shared.logger.info(f"检测到结算标志：[WIN] (红色/右赢, 占比: {red_ratio:.4f})")
+    return result
 
 
 def detect_win_screen(context, window):
     """
-    检测胜负结果 (基于用户提供的 2372*1383 分辨率下的 [WIN] 标志坐标)
-    区域坐标: (990, 117) 到 (1368, 361)
+    检测胜负结果：通过截图后端在内存中截取 [WIN] 标志区域并用 classify_win_banner 分类。
     返回: 1 (左边赢, 青色), 2 (右边赢, 红色), None (未检测到)
     """
     try:
-        # 将绝对坐标转换为比例坐标 (针对 2372*1383)
-        # x_rel = 990 / 2372 ≈ 0.417, y_rel = 117 / 1383 ≈ 0.085
-        # w_rel = (1368-990) / 2372 ≈ 0.159, h_rel = (361-117) / 1383 ≈ 0.176
-        win_region_rel = (0.417, 0.085, 0.159, 0.176)
-        
-        temp_win_path = os.path.join(context.shared.base_temp_dir, "check_win.png")
-        core_utils.take_screenshot(context, win_region_rel, window, temp_win_path)
-        
-        result = None
-        if os.path.exists(temp_win_path):
-            img = cv2.imread(temp_win_path)
-            if img is not None:
-                img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                # 针对 [WIN] 标志的颜色判定 (提高颜色纯度要求)
-                # 青色判定 (左边赢): R低, G高, B高
-                blue_mask = (img_rgb[:,:,0] < 120) & (img_rgb[:,:,1] > 180) & (img_rgb[:,:,2] > 180)
-                # 红色判定 (右边赢): R高, G低, B低
-                red_mask = (img_rgb[:,:,0] > 200) & (img_rgb[:,:,1] < 100) & (img_rgb[:,:,2] < 100)
-                
-                blue_pixels = np.sum(blue_mask)
-                red_pixels = np.sum(red_mask)
-                blue_ratio = blue_pixels / img_rgb.size
-                red_ratio = red_pixels / img_rgb.size
-                
-                # 增加详细日志输出方便调试
-                context.shared.logger.info(f"结算标志检测 - 青色占比: {blue_ratio:.4f}, 红色占比: {red_ratio:.4f}")
-                
-                # 根据用户实测数据调整阈值：红色 0.01，青色 0.025
-                if blue_ratio > 0.005:
-                    context.shared.logger.info(f"检测到结算标志：[WIN] (青色/左赢, 占比: {blue_ratio:.4f})")
-                    result = 1
-                elif red_ratio > 0.01:
-                    context.shared.logger.info(f"检测到结算标志：[WIN] (红色/右赢, 占比: {red_ratio:.4f})")
-                    result = 2
-                else:
-                    result = None
-                    
-            os.remove(temp_win_path)
-        return result
+        win_img = core_utils.capture_region_image(context, WIN_REGION_REL, window)
+        if win_img is None:
+            return None
+        img_rgb = np.asarray(win_img)
+        win_img.close()
+        return _classify_win_frame(context, img_rgb)
     except Exception as e:
         context.shared.logger.error(f"检测胜负屏幕时出错: {e}")
         return None
 
 
-def record_single_match(context, window, match_index):
+def _win_region_filter(info, scale_step=WIN_DETECT_DOWNSAMPLE):
+    """录像帧中 [WIN] 区域的裁剪+缩小滤镜及输出尺寸。录屏软件录制的是游戏窗口客户区时，相对坐标与截图一致。"""
+    width, height = info.size
+    x_rel, y_rel, w_rel, h_rel = WIN_REGION_REL
+    crop_w, crop_h = max(2, int(width * w_rel)), max(2, int(height * h_rel))
+    out_w, out_h = max(1, crop_w // scale_step), max(1, crop_h // scale_step)
+    # 最近邻缩小相当于 classify_win_banner 的隔行隔列取样，不会混合出新的颜色
+    vf = f"crop={crop_w}:{crop_h}:{int(width * x_rel)}:{int(height * y_rel)},scale={out_w}:{out_h}:flags=neighbor"
+    return vf, (out_w, out_h)
+
+def find_result_start(context, ffmpeg_exe, info, video_path, scan_seconds, scan_fps, min_run=0.5):
+    """
+    在录像最后 scan_seconds 秒内查找结算画面 ([WIN] 标志) 第一次出现的时间 (秒)；没有找到返回 None。
+    先按 scan_fps 低帧率找到持续至少 min_run 秒的首个命中段，再以原帧率扫描命中点之前的一个采样间隔，得到准确的首帧。
+    """
+    logger = context.shared.logger
+    vf, size = _win_region_filter(info)
+    should_stop = lambda: _stop_requested(context)
+    scan_start = max(0.0, info.duration - scan_seconds)
+
+    run_start, run_end = None, None
+    for timestamp, frame in video_tools.iter_raw_frames(ffmpeg_exe, video_path, scan_start, scan_seconds, scan_fps,
+                                                        vf, size, should_stop, logger):
+        result = classify_win_banner(frame, 1)[0]
+        if result is None:
+            run_start = None
+            continue
+        if run_start is None:
+            run_start = timestamp
+        if timestamp - run_start >= min_run:
+            run_end = timestamp
+            break
+    if run_end is None:
+        return None
+
+    # 精确定位: 在上一个低帧率采样点和命中点之间按原帧率逐帧检查
+    fine_fps = float(info.frame_rate or 30)
+    fine_start = max(scan_start, run_start - 1.0 / scan_fps)
+    for timestamp, frame in video_tools.iter_raw_frames(ffmpeg_exe, video_path, fine_start, run_start - fine_start + 1.0 / fine_fps,
+                                                        fine_fps, vf, size, should_stop, logger):
+        if classify_win_banner(frame, 1)[0] is not None:
+            return timestamp
+    return run_start
+
+def _trimmed_path_for(video_path):
+    base, ext = os.path.splitext(video_path)
+    return f"{base}_trimmed{ext}"
+
+def trim_result_tail(context, ffmpeg_exe, ffprobe_exe, video_path, info, client_size=None):
+    """
+    片尾裁剪阶段: 找到结算画面首帧，保留 m10_tail_keep_seconds 秒后，在其后的第一个关键帧处以 -c copy 截断。
+    裁剪结果写入单独的临时文件 (_trimmed_path_for)，原始录像不变。
+    返回 (用于合成的录像路径, 对应的 MediaInfo)；未启用、画面尺寸与客户区不符、未检测到结算画面
+    或没有可用的关键帧时返回 (video_path, info)。
+
+    [WIN] 区域是相对游戏窗口客户区的坐标，只有录像画面恰好是客户区时才有意义；
+    全屏/桌面录制 (ShadowPlay 等) 时区域位置不对，误判会裁掉正常对局，因此默认关闭，且要求尺寸一致。
+    """
+    logger = context.shared.logger
+    m10_config = context.shared.app_config.get("mode_10", {})
+    if not m10_config.get("m10_tail_trim_enabled", False) or not ffprobe_exe or not info.duration:
+        return video_path, info
+    width, height = info.size
+    if not client_size or abs(width - client_size[0]) > 2 or abs(height - client_size[1]) > 2:
+        logger.info(f"录像画面 {width}x{height} 与游戏客户区 {client_size} 不一致 (可能是全屏/桌面录制)，不裁剪片尾。")
+        return video_path, info
+    scan_seconds = float(m10_config.get("m10_tail_scan_seconds", 20.0))
+    scan_fps = float(m10_config.get("m10_tail_scan_fps", 4.0))
+    keep_seconds = float(m10_config.get("m10_tail_keep_seconds", 1.0))
+
+    start = time.time()
+    result_start = find_result_start(context, ffmpeg_exe, info, video_path, scan_seconds, scan_fps)
+    if result_start is None:
+        logger.info(f"录像最后 {scan_seconds:.0f}s 内未检测到结算画面，不裁剪片尾。")
+        return video_path, info
+    keyframes = video_tools.keyframe_times(ffprobe_exe, video_path, result_start + keep_seconds, info.duration, logger)
+    if not keyframes or keyframes[0] >= info.duration - 0.5:
+        logger.info(f"结算画面位于 {result_start:.2f}s，其后没有可用于截断的关键帧，不裁剪片尾。")
+        return video_path, info
+    cut = keyframes[0]
+
+    trimmed_path = _trimmed_path_for(video_path)
+    run_kwargs = _ffmpeg_run_kwargs(context, "裁剪片尾", cut)
+    if not video_tools.trim_copy(ffmpeg_exe, video_path, cut, trimmed_path, logger, **run_kwargs):
+        if os.path.exists(trimmed_path): os.remove(trimmed_path)
+        return video_path, info
+    trimmed_info = video_tools.probe_media(ffprobe_exe, trimmed_path, logger)
+    if trimmed_info is None or trimmed_info.duration < cut - 1.0:
+        logger.warning("裁剪后的录像校验失败，使用未裁剪的录像。")
+        if os.path.exists(trimmed_path): os.remove(trimmed_path)
+        return video_path, info
+    logger.info(f"结算画面首帧 {result_start:.2f}s，在关键帧 {cut:.2f}s 处截断，"
+                f"去掉片尾 {info.duration - cut:.1f}s (用时 {time.time() - start:.1f}s)。")
+    return trimmed_path, trimmed_info
+
+
+TimedFrame = collections.namedtuple("TimedFrame", ["seq", "timestamp", "image"])
+
+
+class FrameRingBuffer:
+    """固定容量的带时间戳帧缓冲。生产者 push，消费者非阻塞地读取最新帧或等待更新的帧。"""
+
+    def __init__(self, capacity: int = FRAME_BUFFER_SIZE):
+        self._frames = collections.deque(maxlen=max(1, capacity))
+        self._cond = threading.Condition()
+        self._seq = 0
+
+    def push(self, image, timestamp: float = None):
+        with self._cond:
+            self._seq += 1
+            self._frames.append(TimedFrame(self._seq, timestamp if timestamp is not None else time.perf_counter(), image))
+            self._cond.notify_all()
+
+    def latest(self):
+        """返回最新帧 (TimedFrame)，缓冲为空时返回 None。"""
+        with self._cond:
+            return self._frames[-1] if self._frames else None
+
+    def wait_newer(self, seq: int, timeout: float):
+        """等待序号大于 seq 的帧，最长 timeout 秒；超时返回 None。"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._frames and self._frames[-1].seq > seq, timeout)
+            if self._frames and self._frames[-1].seq > seq:
+                return self._frames[-1]
+            return None
+
+
+class RoiCaptureThread(threading.Thread):
+    """后台截图线程：按固定间隔截取相对区域，转成 RGB 数组后写入 FrameRingBuffer。"""
+
+    def __init__(self, context, window, relative_region, frame_buffer: FrameRingBuffer, interval: float = WIN_DETECT_INTERVAL):
+        super().__init__(name="Mode10RoiCapture", daemon=True)
+        self.context = context
+        self.window = window
+        self.relative_region = relative_region
+        self.frame_buffer = frame_buffer
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        logger = self.context.shared.logger
+        while not self._stop_event.is_set() and not self.context.shared.stop_requested:
+            started = time.perf_counter()
+            try:
+                img = core_utils.capture_region_image(self.context, self.relative_region, self.window)
+                if img is not None:
+                    self.frame_buffer.push(np.asarray(img), started)
+                    img.close()
+            except Exception as e:
+                logger.error(f"后台截图线程出错: {e}")
+            self._stop_event.wait(max(0.0, self.interval - (time.perf_counter() - started)))
+
+    def stop(self, timeout: float = 2.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+def record_single_match(context, window, match_index, post_queue=None):
+    """录制一局。post_queue 不为空时，视频合成交给后台队列，函数在停止录制后立即返回。"""
     # 获取模式10的配置，用于判断是否跳过当前对局
     m10_config = context.shared.app_config.get("mode_10", {})
     if not m10_config.get(f"m10_match_{match_index+1}_selected", False):
@@ -299,48 +705,68 @@ def record_single_match(context, window, match_index):
     recorder.start_recording()
     
     # 3. 监控结算 (引入 1.5s 稳定性检测)
+    # 截图由后台线程完成，这里只读取最新帧并分类；稳定时长按帧的截取时间计算
     start_time = time.time()
     stable_start_time = None
     last_detected_result = None
     STABLE_THRESHOLD = 1.5  # 持续 1.5 秒稳定则判定结束
+    detect_interval = float(m10_config.get("m10_win_detect_interval", WIN_DETECT_INTERVAL))
+    frame_buffer = FrameRingBuffer(int(m10_config.get("m10_frame_buffer_size", FRAME_BUFFER_SIZE)))
+    capture_thread = RoiCaptureThread(context, window, WIN_REGION_REL, frame_buffer, detect_interval)
+    capture_thread.start()
+    last_seq = 0
 
-    while time.time() - start_time < 600:
-        if core_utils.check_stop_signal(context): break
-        
-        current_result = detect_win_screen(context, window)
-        
-        if current_result is not None:
-            if current_result == last_detected_result:
-                # 结果稳定，检查持续时间
-                if stable_start_time is None:
-                    stable_start_time = time.time()
-                elif time.time() - stable_start_time >= STABLE_THRESHOLD:
-                    logger.info(f"检测到稳定的结算界面 (持续 {STABLE_THRESHOLD}s)，准备停止录制。判定结果: {'左赢' if current_result == 1 else '右赢'}")
-                    time.sleep(3.0)
-                    core_utils.click_coordinates(context, (0.6284, 0.9465), window) # 统计按钮
-                    time.sleep(3.0)
-                    break
+    try:
+        while time.time() - start_time < 600:
+            if core_utils.check_stop_signal(context): break
+
+            # 非阻塞等待新帧 (最多一个采样间隔多一点)，保证停止热键能及时生效
+            frame = frame_buffer.wait_newer(last_seq, timeout=detect_interval * 2)
+            if frame is None:
+                continue
+            last_seq = frame.seq
+            current_result = _classify_win_frame(context, frame.image)
+
+            if current_result is not None:
+                if current_result == last_detected_result:
+                    # 结果稳定，检查持续时间
+                    if stable_start_time is None:
+                        stable_start_time = frame.timestamp
+                    elif frame.timestamp - stable_start_time >= STABLE_THRESHOLD:
+                        logger.info(f"检测到稳定的结算界面 (持续 {STABLE_THRESHOLD}s)，准备停止录制。判定结果: {'左赢' if current_result == 1 else '右赢'}")
+                        capture_thread.stop()
+                        time.sleep(3.0)
+                        core_utils.click_coordinates(context, (0.6284, 0.9465), window) # 统计按钮
+                        time.sleep(3.0)
+                        break
+                else:
+                    # 结果改变或首次检测到，重置计时器
+                    last_detected_result = current_result
+                    stable_start_time = frame.timestamp
             else:
-                # 结果改变或首次检测到，重置计时器
-                last_detected_result = current_result
-                stable_start_time = time.time()
-        else:
-            # 未检测到结果，重置
-            last_detected_result = None
-            stable_start_time = None
-            
-        time.sleep(0.3)  # 缩短采样间隔以提高灵敏度
+                # 未检测到结果，重置
+                last_detected_result = None
+                stable_start_time = None
+    finally:
+        capture_thread.stop()
     
-    # 4. 停止并处理
+    # 4. 停止并处理 (记录客户区尺寸，片尾裁剪据此判断录像画面是否就是游戏窗口)
+    client_rect = core_utils.get_client_rect_on_screen(context, window)
+    client_size = tuple(client_rect[2:]) if client_rect else None
     recorder.stop_recording()
-    time.sleep(3.0)
-    raw_video = recorder.get_latest_video()
+    raw_video = recorder.wait_for_recording()
     
     # 获取胜负结果
     is_win = detect_win_screen(context, window)
     
     if raw_video:
-        process_video_with_lineup(context, raw_video, left_img, right_img, left_player_id, right_player_id, match_index, is_win=is_win)
+        if post_queue is not None:
+            post_queue.submit(f"Round {match_index + 1:02d} 合成", process_video_with_lineup, context, raw_video,
+                              left_img, right_img, left_player_id, right_player_id, match_index, is_win=is_win,
+                              client_size=client_size)
+        else:
+            process_video_with_lineup(context, raw_video, left_img, right_img, left_player_id, right_player_id, match_index, is_win=is_win,
+                                      client_size=client_size)
     
     # 5. 退出
     exit_rel = (0.8428, 0.5401)
@@ -369,7 +795,16 @@ def run(context):
         logger.warning("没有选择任何对局进行录制，模式10结束。")
         return
 
-    for i in selected_matches:
-        if core_utils.check_stop_signal(context): break
-        record_single_match(context, window, i)
+    # FFmpeg 合成在后台执行，UI 自动化直接进入下一局；并发数默认 1，避免编码抢占录制的 CPU
+    post_queue = PostProcessQueue(context, m10_config.get("m10_postprocess_workers", 1))
+    try:
+        for i in selected_matches:
+            if core_utils.check_stop_signal(context): break
+            record_single_match(context, window, i, post_queue)
+    finally:
+        logger.info("等待后台视频合成任务完成...")
+        post_queue.wait()
+        post_queue.close()
+        logger.info(post_queue.summary())
+        core_utils.report_status(context, post_queue.summary())
     logger.info("===== 模式 10 执行完毕 =====")
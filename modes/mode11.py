@@ -0,0 +1,40 @@
+# modes/mode11.py
+import os
+from core import utils as core_utils
+from core import screen_state
+
+def run(context):
+    """
+    界面状态模板采集：把游戏当前界面中 state_name 对应的区域保存为模板 (见 core.screen_state)。
+    每个需要识别的界面 (bracket_view、player_detail、team_view、result_overlay、replay_playing) 各运行一次；
+    客户区尺寸或游戏界面改变后重新采集。
+    """
+    logger = context.shared.logger
+    nikke_window = context.shared.nikke_window
+    mode_config = context.mode_config
+
+    logger.info("===== 运行模式 11: 界面状态模板采集 =====")
+
+    if not nikke_window:
+        logger.error("模式11: NIKKE 窗口未找到或未激活。")
+        context.shared.final_message = "模式11执行失败：NIKKE 窗口未找到。"
+        return
+    if core_utils.check_stop_signal(context):
+        logger.info("模式11：检测到停止信号，提前退出。")
+        return
+
+    state_name = (getattr(mode_config, 'm11_state_name', '') or '').strip()
+    if not state_name:
+        logger.error("模式11: 未指定要采集的界面状态名称。")
+        context.shared.final_message = "模式11执行失败：未指定界面状态名称。"
+        return
+
+    path = screen_state.capture_state_template(context, nikke_window, state_name)
+    if not path:
+        context.shared.final_message = f"模式11执行失败：未能采集界面状态 '{state_name}' 的模板，详见日志。"
+        return
+
+    message = f"模式11：已采集界面状态 '{state_name}' 的模板: {os.path.basename(path)}"
+    if not screen_state.screen_state_enabled(context):
+        message += "\n(界面状态识别尚未启用，采集完所需模板后在 config.json 中设置 global_settings.screen_state_enabled = true)"
+    context.shared.final_message = message
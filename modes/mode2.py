@@ -93,7 +93,7 @@ def run(context):
         base_name = getattr(context.mode_config, 'output_filename_prefix', 'NCA')
         suffix = getattr(context.mode_config, 'm2_output_suffix', '_review')  # 使用 mode_config 中的后缀
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        final_output_filename = f"{base_name}{suffix}_{timestamp}.png"
+        final_output_filename = f"{base_name}{suffix}_{timestamp}{core_utils.get_output_extension(context)}"
         
         # 使用 core_utils.get_or_create_mode_output_subdir 来获取或创建输出子目录
         # output_subfolder_basename = "reviews" # 基础名称
@@ -140,14 +140,10 @@ def run(context):
 
         if len(final_images_to_stitch) >= 1:  # 至少有一张图就尝试处理
             if len(final_images_to_stitch) == 1:
-                # 如果只有一张图，直接复制/重命名到目标位置
+                # 如果只有一张图，直接复制 (或按输出格式转存) 到目标位置
                 logger.info(f"模式2: 只有一张图片 '{final_images_to_stitch[0]}', 将其复制到输出路径。")
-                try:
-                    import shutil  # 确保导入
-                    shutil.copy(final_images_to_stitch[0], final_output_path)
+                if core_utils.save_final_image(context, final_images_to_stitch[0], final_output_path):
                     logger.info(f"模式2: 单张图片已保存到 {final_output_path}")
-                except Exception as e_copy:
-                    logger.error(f"模式2: 复制单张图片失败: {e_copy}")
             else:  # 多于一张图，进行拼接
                 # 背景色从配置读取 (与模式1一致)
                 bg_color_str = getattr(context.mode_config, 'stitch_background_color_str', "0,0,0")
@@ -83,7 +83,7 @@ def run(context):
         base_name = getattr(context.mode_config, 'output_filename_prefix', 'NCA')
         suffix = getattr(context.mode_config, 'm3_output_suffix', '_counter_save') # 使用 mode_config 中的后缀
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        final_output_filename = f"{base_name}{suffix}_{timestamp}.png"
+        final_output_filename = f"{base_name}{suffix}_{timestamp}{core_utils.get_output_extension(context)}"
 
         # 使用 core_utils 中的辅助函数获取或创建模式输出子目录
         # mode_number for mode3 is 3. subdir_name is "counter_saves".
@@ -115,11 +115,8 @@ def run(context):
             logger.info(f"模式3: 结果已保存到 {final_output_path}")
         elif len(images_to_stitch) == 1:
             logger.info(f"模式3: 只收集到一张图片，将其复制到输出路径。源: {images_to_stitch[0]}")
-            try:
-                shutil.copy(images_to_stitch[0], final_output_path)
+            if core_utils.save_final_image(context, images_to_stitch[0], final_output_path):
                 logger.info(f"模式3: 单张图片已复制到 {final_output_path}")
-            except Exception as e_copy:
-                logger.error(f"模式3: 复制单张图片失败: {e_copy}")
         else:
             logger.error("模式3: 没有足够的图片进行处理。")
 
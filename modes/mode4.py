@@ -1,5 +1,4 @@
 import os
-import shutil
 from core import utils as core_utils
 from core import player_processing
 # constants 可以通过 context.shared.constants 访问
@@ -23,8 +22,9 @@ def run(context):
     prefix = getattr(context.mode_config, 'output_filename_prefix', 'NCA')
     suffix = getattr(context.mode_config, 'm45_output_suffix', '_64in8') # 模式4的默认后缀
 
-    final_output_player_basename_template = f"{prefix}_player{{}}_stitched{suffix}.png" # Renamed for clarity
-    final_output_overview_basename = f"{prefix}_overview{suffix}.png" # Renamed for clarity
+    output_ext = core_utils.get_output_extension(context) # 最终输出格式 (global_settings.output_profile)
+    final_output_player_basename_template = f"{prefix}_player{{}}_stitched{suffix}{output_ext}" # Renamed for clarity
+    final_output_overview_basename = f"{prefix}_overview{suffix}{output_ext}" # Renamed for clarity
 
     mode4_player_coords_map = [
         cc.P64IN8_PLAYER1_COORD_REL_M4, cc.P64IN8_PLAYER2_COORD_REL_M4,
@@ -33,6 +33,7 @@ def run(context):
         cc.P64IN8_PLAYER7_COORD_REL_M4, cc.P64IN8_PLAYER8_COORD_REL_M4
     ]
     mode4_individual_stitched_files = []
+    mode4_overview_sources = [] # 总览图直接从临时 PNG 拼接，避免解码有损输出
 
     try:
         for i, player_coord_rel in enumerate(mode4_player_coords_map):
@@ -68,8 +69,10 @@ def run(context):
                 player_output_basename = final_output_player_basename_template.format(i+1)
                 final_player_image_path = core_utils.generate_unique_filepath(mode4_output_dir, player_output_basename, logger)
                 
-                shutil.copy2(p_stitched_temp_path, final_player_image_path)
+                if not core_utils.save_final_image(context, p_stitched_temp_path, final_player_image_path):
+                    continue
                 mode4_individual_stitched_files.append(final_player_image_path)
+                mode4_overview_sources.append(p_stitched_temp_path)
                 logger.info(f"  模式4 - Player {i+1} 截图已保存为 '{final_player_image_path}'")
             else:
                 logger.error(f"  处理模式4 - Player {i+1} 失败。未找到截图: {p_stitched_temp_path}")
@@ -95,7 +98,7 @@ def run(context):
             
             # stitch_mode4_overview 现在接收已经唯一化处理的路径
             # 并且其内部不再进行文件名唯一化
-            actual_saved_overview_path = core_utils.stitch_mode4_overview(context, mode4_individual_stitched_files, unique_overview_output_path)
+            actual_saved_overview_path = core_utils.stitch_mode4_overview(context, mode4_overview_sources, unique_overview_output_path)
 
             if actual_saved_overview_path: # stitch_mode4_overview 返回实际保存的路径或 None
                 logger.info(f"模式4总览图已生成: {actual_saved_overview_path}.")
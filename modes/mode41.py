@@ -84,7 +84,7 @@ def run(context):
         suffix = getattr(mode_config, 'm41_output_suffix', '_group_stage_match')
         
         timestamp = core_utils.get_timestamp_for_filename() # 假设 core_utils.get_timestamp_for_filename() 存在
-        final_output_filename = f"{base_name}{suffix}_{timestamp}.png"
+        final_output_filename = f"{base_name}{suffix}_{timestamp}{core_utils.get_output_extension(context)}"
 
         output_dir_for_mode41 = core_utils.get_or_create_mode_output_subdir(context, 41, "group_stage_matches")
         
@@ -1,5 +1,4 @@
 import os
-import shutil
 from core import utils as core_utils
 from core import player_processing
 # constants 可以通过 context.shared.constants 访问
@@ -23,8 +22,9 @@ def run(context):
     prefix = getattr(context.mode_config, 'output_filename_prefix', 'NCA')
     suffix = getattr(context.mode_config, 'm45_output_suffix', '_champ_pred') # 模式5的默认后缀
 
-    final_output_player_basename = f"{prefix}_player{{}}_stitched{suffix}.png"
-    final_output_overview_filename = f"{prefix}_overview{suffix}.png"
+    output_ext = core_utils.get_output_extension(context) # 最终输出格式 (global_settings.output_profile)
+    final_output_player_basename = f"{prefix}_player{{}}_stitched{suffix}{output_ext}"
+    final_output_overview_filename = f"{prefix}_overview{suffix}{output_ext}"
 
     mode5_player_coords_map = [
         cc.CHAMPION_PLAYER1_COORD_REL_M5, cc.CHAMPION_PLAYER2_COORD_REL_M5,
@@ -33,6 +33,7 @@ def run(context):
         cc.CHAMPION_PLAYER7_COORD_REL_M5, cc.CHAMPION_PLAYER8_COORD_REL_M5
     ]
     mode5_individual_stitched_files = []
+    mode5_overview_sources = [] # 总览图直接从临时 PNG 拼接，避免解码有损输出
 
     try:
         # 获取模式5的专用输出子目录
@@ -68,8 +69,10 @@ def run(context):
                 # 在模式专用子目录中为每个玩家图片生成唯一路径
                 final_player_image_path = core_utils.generate_unique_filepath(mode5_output_dir, player_output_filename, logger)
                 
-                shutil.copy2(p_stitched_temp_path, final_player_image_path)
+                if not core_utils.save_final_image(context, p_stitched_temp_path, final_player_image_path):
+                    continue
                 mode5_individual_stitched_files.append(final_player_image_path)
+                mode5_overview_sources.append(p_stitched_temp_path)
                 logger.info(f"  模式5 - Player {i+1} 截图已保存为 '{final_player_image_path}'")
             else:
                 logger.error(f"  处理模式5 - Player {i+1} 失败。未找到截图: {p_stitched_temp_path}")
@@ -86,7 +89,7 @@ def run(context):
             # 为总览图在模式专用子目录中生成唯一路径
             overview_output_path = core_utils.generate_unique_filepath(mode5_output_dir, final_output_overview_filename, logger)
             # 复用 mode4 的总览图拼接逻辑，传递 context
-            success = core_utils.stitch_mode4_overview(context, mode5_individual_stitched_files, overview_output_path)
+            success = core_utils.stitch_mode4_overview(context, mode5_overview_sources, overview_output_path)
 
             if success:
                 logger.info(f"模式5总览图已生成: {overview_output_path}.")
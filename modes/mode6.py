@@ -7,6 +7,23 @@ from core import utils as core_utils
 from core import match_processing
 # Constants will be accessed via context.shared.constants
 
+def _build_tournament_poster(context, poster_grid, group_file_prefix_base):
+    """把本次运行的所有比赛总览图 (每组一行) 流式拼接成一张赛事海报。"""
+    logger = context.shared.logger
+    poster_scale = getattr(context.mode_config, 'm6_tournament_poster_scale', 0.5)
+    poster_filename = f"{group_file_prefix_base}_tournament_poster_{core_utils.get_timestamp_for_filename()}.png"
+    poster_path = core_utils.generate_unique_filepath(context.shared.base_output_dir, poster_filename, logger)
+    logger.info(f"Mode6: 开始生成赛事海报 ({len(poster_grid)} 组)...")
+    saved_path = core_utils.stitch_grid_streaming(
+        context, poster_grid, poster_path,
+        bg_color=context.shared.get_stitch_background_color(),
+        scale=poster_scale,
+    )
+    if saved_path:
+        logger.info(f"Mode6: 赛事海报已保存: {saved_path}")
+    else:
+        logger.error("Mode6: 生成赛事海报失败。")
+
 def run(context):
     logger = context.shared.logger
     nikke_window = context.shared.nikke_window
@@ -35,6 +52,7 @@ def run(context):
     # 确保 R_MATCH_NAMES 在常量中定义 (已在 core/constants.py 中添加)
     total_matches_overall = len(cc.R_MATCH_NAMES) * len(list(groups_to_process_config_indices))
     completed_matches_overall = 0
+    poster_grid = [] # 每组一行，记录各场比赛的总览图路径 (失败为 None)，用于赛事海报
 
     for group_config_idx in groups_to_process_config_indices: # group_config_idx is 0-indexed
         group_actual_number = group_config_idx + 1 # 1-indexed for display and keys
@@ -44,6 +62,8 @@ def run(context):
             return
         
         current_group_file_prefix = f"{group_file_prefix_base}{group_actual_number}"
+        poster_row = [None] * len(cc.R_MATCH_NAMES)
+        poster_grid.append(poster_row)
         logger.info(f"\n====== Mode6: 开始处理组: {current_group_file_prefix} (索引 {group_config_idx}) ======")
 
         group_button_key = f"group_{group_actual_number}" # Key for R_GROUP_BUTTONS_REL
@@ -53,10 +73,10 @@ def run(context):
             continue
         
         logger.info(f"Mode6: 点击组别 {group_actual_number} 按钮 at {group_button_coord_rel}...")
-        if not core_utils.click_coordinates(context, group_button_coord_rel, nikke_window):
+        if not core_utils.click_coordinates(context, group_button_coord_rel, nikke_window, wait_after=False):
             logger.error(f"Mode6: 点击组别 {group_actual_number} 按钮失败，跳过该组。")
             continue
-        time.sleep(cc.R_DELAY_AFTER_GROUP_CLICK) # 使用常量
+        core_utils.wait_for_transition(context, nikke_window, 'group_click', cc.UNIVERSAL_ACTION_DELAY + cc.R_DELAY_AFTER_GROUP_CLICK) # 常量作为默认等待上限
 
         if core_utils.check_stop_signal(context):
             logger.info(f"Mode6: 检测到停止信号，在点击组 {group_actual_number} 后退出。")
@@ -72,9 +92,9 @@ def run(context):
         
         logger.info(f"Mode6: 执行颜色判断 for {current_group_file_prefix}: Coord1={color_check_coord1_rel}, Coord2={color_check_coord2_rel}")
         
-        color1_rgb = core_utils.get_pixel_color_relative(context, nikke_window, color_check_coord1_rel)
-        if core_utils.check_stop_signal(context): return
-        color2_rgb = core_utils.get_pixel_color_relative(context, nikke_window, color_check_coord2_rel)
+        # 两个颜色点从同一次截图中读取 (取小邻域平均值)
+        colors = core_utils.get_pixel_colors_relative(context, nikke_window, [color_check_coord1_rel, color_check_coord2_rel], radius=cc.R_COLOR_PROBE_RADIUS)
+        color1_rgb, color2_rgb = colors if colors else (None, None)
         if core_utils.check_stop_signal(context): return
 
         if color1_rgb and color2_rgb:
@@ -125,26 +145,25 @@ def run(context):
 
             # --- 点击比赛入口 ---
             logger.info(f"Mode6: 点击比赛 '{match_name}' 入口 at {match_specific_entry_coord_rel}")
-            if not core_utils.click_coordinates(context, match_specific_entry_coord_rel, nikke_window):
+            if not core_utils.click_coordinates(context, match_specific_entry_coord_rel, nikke_window, wait_after=False):
                 logger.error(f"Mode6: 点击比赛 '{match_name}' 入口失败。跳过此比赛。")
                 continue
             
             delay_after_entry = cc.R_DELAY_AFTER_MATCH_ENTRY.get(match_name, cc.R_DELAY_DEFAULT_AFTER_MATCH_ENTRY)
-            logger.info(f"Mode6: 等待 {delay_after_entry} 秒...")
-            time.sleep(delay_after_entry)
+            logger.info(f"Mode6: 等待画面稳定 (最长 {delay_after_entry} 秒)...")
+            core_utils.wait_for_transition(context, nikke_window, 'match_entry', cc.UNIVERSAL_ACTION_DELAY + delay_after_entry)
             if core_utils.check_stop_signal(context): return
 
             if match_specific_second_entry_coord_rel:
                 logger.info(f"Mode6: 点击比赛 '{match_name}' 第二入口 at {match_specific_second_entry_coord_rel}")
-                if not core_utils.click_coordinates(context, match_specific_second_entry_coord_rel, nikke_window):
+                if not core_utils.click_coordinates(context, match_specific_second_entry_coord_rel, nikke_window, wait_after=False):
                     logger.error(f"Mode6: 点击比赛 '{match_name}' 第二入口失败。跳过此比赛。")
                     continue
                 # 使用 cc.R_DELAY_AFTER_SECOND_MATCH_ENTRY，如果常量存在的话
                 # 使用常量 cc.R_DELAY_AFTER_SECOND_MATCH_ENTRY
                 delay_after_second_entry = cc.R_DELAY_AFTER_SECOND_MATCH_ENTRY if match_name == "4in2_2" else 0
-                if delay_after_second_entry > 0:
-                    logger.info(f"Mode6: 等待 {delay_after_second_entry} 秒...")
-                    time.sleep(delay_after_second_entry)
+                logger.info(f"Mode6: 等待画面稳定 (最长 {cc.UNIVERSAL_ACTION_DELAY + delay_after_second_entry} 秒)...")
+                core_utils.wait_for_transition(context, nikke_window, 'match_second_entry', cc.UNIVERSAL_ACTION_DELAY + delay_after_second_entry)
                 if core_utils.check_stop_signal(context): return
             
             # --- 调用核心比赛处理流程 ---
@@ -176,6 +195,7 @@ def run(context):
 
             if success:
                 completed_matches_overall += 1
+                poster_row[match_idx] = success # process_match_flow 返回总览图路径
                 logger.info(f"Mode6: 比赛 {current_group_file_prefix}_{match_name} 处理成功。")
                 logger.info(f"Mode6: 整体进度: {completed_matches_overall}/{total_matches_overall} ({completed_matches_overall/total_matches_overall:.1%})")
             else:
@@ -197,6 +217,9 @@ def run(context):
         if group_config_idx < end_group_idx: # Check if it's not the last group to be processed in this run
             time.sleep(cc.R_DELAY_BETWEEN_GROUPS) # 使用常量
 
+    if getattr(mode_config, 'm6_tournament_poster', False) and any(any(row) for row in poster_grid):
+        _build_tournament_poster(context, poster_grid, group_file_prefix_base)
+
     logger.info("===== 模式 6: Reviewer 完整分组赛 执行完毕 =====")
     if completed_matches_overall == total_matches_overall:
         logger.info(f"Mode6: 所有 {total_matches_overall} 场比赛均已成功处理。")
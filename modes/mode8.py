@@ -48,9 +48,9 @@ def run(context):
     
     logger.info(f"Mode8: 执行颜色判断 for {file_prefix_base}: Coord1={color_check_coord1_rel}, Coord2={color_check_coord2_rel}")
     
-    color1_rgb = core_utils.get_pixel_color_relative(context, nikke_window, color_check_coord1_rel) # nikke_window is still needed by get_pixel_color_relative
-    if core_utils.check_stop_signal(context): return
-    color2_rgb = core_utils.get_pixel_color_relative(context, nikke_window, color_check_coord2_rel) # nikke_window is still needed by get_pixel_color_relative
+    # 两个颜色点从同一次截图中读取 (取小邻域平均值)
+    colors = core_utils.get_pixel_colors_relative(context, nikke_window, [color_check_coord1_rel, color_check_coord2_rel], radius=cc.R_COLOR_PROBE_RADIUS)
+    color1_rgb, color2_rgb = colors if colors else (None, None)
     if core_utils.check_stop_signal(context): return
 
     if color1_rgb and color2_rgb:
@@ -104,26 +104,25 @@ def run(context):
 
         # --- 点击比赛入口 ---
         logger.info(f"Mode8: 点击比赛 '{match_name_std}' 入口 at {match_specific_entry_coord_rel}")
-        if not core_utils.click_coordinates(context, match_specific_entry_coord_rel, nikke_window):
+        if not core_utils.click_coordinates(context, match_specific_entry_coord_rel, nikke_window, wait_after=False):
             logger.error(f"Mode8: 点击比赛 '{match_name_std}' 入口失败。跳过此比赛。")
             continue
         
         # 使用新的延迟常量 R_M8_DELAY_AFTER_MATCH_ENTRY (字典)
         delay_after_entry = cc.R_M8_DELAY_AFTER_MATCH_ENTRY.get(m8_match_key, cc.R_DELAY_DEFAULT_AFTER_MATCH_ENTRY)
-        logger.info(f"Mode8: 等待 {delay_after_entry} 秒...")
-        time.sleep(delay_after_entry)
+        logger.info(f"Mode8: 等待画面稳定 (最长 {delay_after_entry} 秒)...")
+        core_utils.wait_for_transition(context, nikke_window, 'match_entry', cc.UNIVERSAL_ACTION_DELAY + delay_after_entry)
         if core_utils.check_stop_signal(context): return
 
         if match_specific_second_entry_coord_rel:
             logger.info(f"Mode8: 点击比赛 '{match_name_std}' 第二入口 at {match_specific_second_entry_coord_rel}")
-            if not core_utils.click_coordinates(context, match_specific_second_entry_coord_rel, nikke_window):
+            if not core_utils.click_coordinates(context, match_specific_second_entry_coord_rel, nikke_window, wait_after=False):
                 logger.error(f"Mode8: 点击比赛 '{match_name_std}' 第二入口失败。跳过此比赛。")
                 continue
             # 使用新的延迟常量 R_M8_DELAY_AFTER_SECOND_MATCH_ENTRY
             delay_after_second_entry = cc.R_M8_DELAY_AFTER_SECOND_MATCH_ENTRY if match_name_std == "4in2_2" else 0
-            if delay_after_second_entry > 0:
-                logger.info(f"Mode8: 等待 {delay_after_second_entry} 秒...")
-                time.sleep(delay_after_second_entry)
+            logger.info(f"Mode8: 等待画面稳定 (最长 {cc.UNIVERSAL_ACTION_DELAY + delay_after_second_entry} 秒)...")
+            core_utils.wait_for_transition(context, nikke_window, 'match_second_entry', cc.UNIVERSAL_ACTION_DELAY + delay_after_second_entry)
             if core_utils.check_stop_signal(context): return
 
         # --- 调用核心比赛处理流程 ---
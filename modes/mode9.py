@@ -1,8 +1,13 @@
 # modes/mode9.py
 import os
-import glob
+import json
 import shutil # 导入 shutil 模块
 from core import utils as core_utils
+from core import image_conversion
+from core import conversion_manifest
+from core import file_discovery
+from core import image_dedup
+from core.archive_writer import ZipArchiveWriter
 
 def run(context):
     logger = context.shared.logger
@@ -24,6 +29,10 @@ def run(context):
         # 获取其他模式9特定配置
         webp_quality = getattr(context.mode_config, 'm9_webp_quality', 85)
         webp_lossless = getattr(context.mode_config, 'm9_webp_lossless', False) # 新增获取 lossless 配置
+        webp_method = getattr(context.mode_config, 'm9_webp_method', cc.R_M9_WEBP_METHOD)
+        worker_processes = getattr(context.mode_config, 'm9_worker_processes', 0)
+        target_width = (getattr(context.mode_config, 'm9_target_width', cc.R_M9_TARGET_WIDTH)
+                        if getattr(context.mode_config, 'm9_resize_enabled', False) else 0)
         delete_originals = getattr(context.mode_config, 'm9_del_orig_after_webp', False)
         delete_webp_after_zip = getattr(context.mode_config, 'm9_del_webp_after_zip', True)
 
@@ -48,69 +57,211 @@ def run(context):
         logger.info(f"模式9: 输入目录: {input_dir}")
         logger.info(f"模式9: WebP输出目录: {output_webp_dir}")
         logger.info(f"模式9: ZIP文件路径: {zip_filepath}")
-        logger.info(f"模式9: WebP质量: {webp_quality}, WebP无损: {webp_lossless}, 删除原图: {delete_originals}, 打包后删除WebP: {delete_webp_after_zip}")
+        logger.info(f"模式9: WebP质量: {webp_quality}, WebP无损: {webp_lossless}, 删除原图: {delete_originals}, 打包后删除WebP: {delete_webp_after_zip}, 目标宽度: {target_width or '不缩放'}")
 
         # 1. 处理图片到 WebP
         logger.info(f"模式9: 开始处理 '{input_dir}' 中的图片到 WebP 格式，输出到 '{output_webp_dir}' (质量: {webp_quality}, 无损: {webp_lossless})")
-        
-        # 支持的图片格式
-        supported_formats = ('*.png', '*.jpg', '*.jpeg', '*.bmp', '*.gif')
-        image_files_to_process = []
-        for fmt in supported_formats:
-            image_files_to_process.extend(glob.glob(os.path.join(input_dir, fmt)))
-        # 移除了处理 input_dir 为单个文件的逻辑
 
+        # 一次 os.scandir 遍历发现输入 (可递归、可过滤，顺序稳定)；结果边遍历边交给转换进程池
+        discovered_files = file_discovery.iter_image_files(
+            input_dir,
+            recursive=getattr(context.mode_config, 'm9_recursive', False),
+            include=getattr(context.mode_config, 'm9_include_patterns', []),
+            exclude=getattr(context.mode_config, 'm9_exclude_patterns', []),
+            min_size=int(float(getattr(context.mode_config, 'm9_min_size_kb', 0)) * 1024),
+            min_age=float(getattr(context.mode_config, 'm9_min_age_seconds', 0)),
+            skip_dirs=[output_webp_dir], # 输出目录可能位于输入目录内
+            logger=logger,
+        )
 
-        if not image_files_to_process:
-            logger.warning(f"模式9: 在输入目录 '{input_dir}' 中没有找到支持的图片文件进行处理。")
-        else:
-            processed_count = 0
-            for img_path in image_files_to_process:
-                if core_utils.check_stop_signal(context):
-                    logger.info("模式9: 图片处理过程中检测到停止信号。")
-                    break
-                
-                # 检查 img_path 是否是目录，如果是，则跳过
-                if os.path.isdir(img_path):
-                    logger.debug(f"模式9: 跳过目录 '{img_path}'。")
+        # 转换清单 (与 WebP 输出目录同级)：只转换新增或内容/参数变化的图片
+        manifest = conversion_manifest.ConversionManifest(
+            conversion_manifest.manifest_path_for(output_webp_dir), input_dir, output_webp_dir, logger)
+        convert_settings = {'quality': webp_quality, 'lossless': bool(webp_lossless), 'method': webp_method}
+        if target_width:
+            convert_settings['target_width'] = target_width
+        copy_settings = {'copy': True} # 已是 WebP 的输入 (global_settings.output_profile.format = "webp") 原样复制
+        zip_exists = os.path.exists(zip_filepath)
+
+        def settings_for(img_path):
+            return copy_settings if img_path.lower().endswith('.webp') else convert_settings
+
+        # 已有记录的图片沿用原输出名 (ZIP 内条目被替换而不是新增)，新图片避开所有已占用的名称
+        namer = image_conversion.OutputNamer(reserved_names=manifest.output_names)
+        discovery_stats = {'found': 0, 'skipped': 0, 'duplicates': 0}
+
+        # 近重复去重 (感知哈希)：哈希由转换进程顺带计算，结果按输入顺序汇报时判断；
+        # 重复图片的转换结果被丢弃，只记录到映射文件；代表图的哈希来自清单，可与以前的图片去重
+        dedup_index = None
+        if getattr(context.mode_config, 'm9_dedup_enabled', False):
+            dedup_index = image_dedup.DuplicateIndex(
+                max_distance=getattr(context.mode_config, 'm9_dedup_max_distance', image_dedup.DEFAULT_MAX_DISTANCE),
+                hash_size=getattr(context.mode_config, 'm9_dedup_hash_size', image_dedup.DEFAULT_HASH_SIZE))
+            dedup_outputs = {}
+            for key, output_name, dims, value in manifest.representatives(dedup_index.hash_size):
+                dedup_index.add(key, dims, value)
+                dedup_outputs[key] = output_name
+            logger.info(f"模式9: 已启用近重复去重 (汉明距离 <= {dedup_index.max_distance})，已知代表图 {len(dedup_index)} 张。")
+
+        def find_duplicate(result):
+            """返回重复的代表图键；不是重复时把该图片登记为代表图并返回 None。"""
+            if result.dhash is None:
+                logger.warning(f"模式9: 未能计算 '{result.input_path}' 的感知哈希，不参与去重。")
+                return None
+            dims, value = result.dhash
+            key = manifest.key_for(result.input_path)
+            representative = dedup_index.find(dims, value)
+            if representative is not None and representative != key:
+                return representative
+            dedup_index.add(key, dims, value)
+            dedup_outputs[key] = manifest.output_name(result.output_path)
+            return None
+
+        def discard_duplicate(result, representative):
+            """重复图片：删除已写出的转换结果 (流式写入时未落盘)，改为记录到代表图。"""
+            logger.debug(f"模式9: '{result.input_path}' 与 '{representative}' 重复，丢弃转换结果。")
+            if not stream_to_zip and os.path.abspath(result.output_path) != os.path.abspath(result.input_path):
+                try:
+                    os.remove(result.output_path)
+                except OSError as e:
+                    logger.warning(f"模式9: 删除重复图片的输出 '{result.output_path}' 失败: {e}")
+            manifest.record_duplicate(result.input_path, representative, dedup_outputs[representative],
+                                      settings_for(result.input_path))
+            discovery_stats['duplicates'] += 1
+            # 只有与代表图逐字节相同时才删除原图；近重复 (像素有差异) 的原图保留，避免永久丢失
+            if manifest.same_content(manifest.key_for(result.input_path), representative):
+                delete_original(result.input_path, os.path.join(output_webp_dir, dedup_outputs[representative]))
+            elif delete_originals:
+                logger.info(f"模式9: '{result.input_path}' 与代表图内容不完全相同，保留原图。")
+
+        def changed_tasks():
+            for found in discovered_files:
+                discovery_stats['found'] += 1
+                if manifest.is_up_to_date(found.path, settings_for(found.path), zip_exists, found.size, found.mtime_ns):
+                    discovery_stats['skipped'] += 1
                     continue
+                output_name = manifest.output_name_for(found.path) or namer.name_for(found.rel_path)
+                yield found.path, os.path.join(output_webp_dir, output_name)
 
-                logger.info(f"模式9: 正在处理图片 '{img_path}'")
-                # process_image_to_webp 需要接收 quality 参数
-                # 我们需要修改 core_utils.process_image_to_webp 来接受这个参数
-                # 暂时假设它已修改，或传递 context.mode_config.m9_webp_quality
-                # 为了简单起见，这里直接传递 quality 值
-                webp_path = core_utils.process_image_to_webp(context, img_path, output_webp_dir, quality=webp_quality, lossless=webp_lossless)
-                if webp_path:
-                    logger.info(f"模式9: 图片 '{img_path}' 已成功转换为 '{webp_path}'")
-                    processed_count += 1
-                    if delete_originals:
-                        try:
-                            os.remove(img_path)
-                            logger.info(f"模式9: 已删除原图 '{img_path}'")
-                        except Exception as e_del_orig:
-                            logger.warning(f"模式9: 删除原图 '{img_path}' 失败: {e_del_orig}")
+        # 打包后删除 WebP 目录时，转换结果直接流式写入 ZIP (图片条目 STORED)，不再经过 WebP 目录
+        stream_to_zip = delete_webp_after_zip
+        archive = None
+        processed_count = 0
+
+        def get_archive():
+            nonlocal archive
+            if archive is None:
+                archive = ZipArchiveWriter(zip_filepath, logger=logger)
+            return archive
+
+        def delete_original(img_path, output_path):
+            if not delete_originals or os.path.abspath(img_path) == os.path.abspath(output_path):
+                return
+            try:
+                os.remove(img_path)
+                logger.info(f"模式9: 已删除原图 '{img_path}'")
+            except Exception as e_del_orig:
+                logger.warning(f"模式9: 删除原图 '{img_path}' 失败: {e_del_orig}")
+
+        def on_result(result):
+            nonlocal processed_count
+            if result.output_path:
+                if dedup_index is not None:
+                    representative = find_duplicate(result)
+                    if representative is not None:
+                        discard_duplicate(result, representative)
+                        return
+                if stream_to_zip:
+                    get_archive().add_bytes(manifest.output_name(result.output_path), result.data)
+                logger.debug(f"模式9: 图片 '{result.input_path}' 已成功转换为 '{result.output_path}'")
+                processed_count += 1
+                extra = None
+                if dedup_index is not None and result.dhash is not None:
+                    dims, value = result.dhash
+                    extra = {'dims': list(dims), 'dhash': f"{value:x}", 'hash_size': dedup_index.hash_size}
+                manifest.record(result.input_path, result.output_path, settings_for(result.input_path), extra)
+                delete_original(result.input_path, result.output_path)
+            else:
+                logger.error(f"模式9: 图片 '{result.input_path}' 转换失败: {result.error}")
+
+        try:
+            image_conversion.convert_images_to_webp(
+                context, changed_tasks(),
+                quality=webp_quality, lossless=webp_lossless, method=webp_method,
+                workers=worker_processes, on_result=on_result,
+                in_memory=stream_to_zip, target_width=target_width,
+                hash_size=dedup_index.hash_size if dedup_index is not None else 0,
+            )
+            if stream_to_zip:
+                # 之前的运行留在 WebP 目录中、尚未打包 (且本次没有重新生成) 的文件一并写入
+                written = set(archive.names_written) if archive is not None else set()
+                for name in manifest.unarchived_outputs():
+                    if name not in written:
+                        get_archive().add_file(name, os.path.join(output_webp_dir, name))
+            if discovery_stats['duplicates']:
+                # 重复图片映射文件 (输入路径 -> 代表图输出名)，与图片一起归档
+                map_data = json.dumps(manifest.duplicate_map(), indent=1, ensure_ascii=False).encode('utf-8')
+                if stream_to_zip:
+                    get_archive().add_bytes(image_dedup.DUPLICATE_MAP_FILENAME, map_data)
                 else:
-                    logger.error(f"模式9: 图片 '{img_path}' 转换失败。")
-            logger.info(f"模式9: WebP 图片处理完成，共处理 {processed_count} 张图片。")
+                    os.makedirs(output_webp_dir, exist_ok=True)
+                    with open(os.path.join(output_webp_dir, image_dedup.DUPLICATE_MAP_FILENAME), 'wb') as f:
+                        f.write(map_data)
+            if archive is not None:
+                # 被停止时已写入的条目同样有效，照常提交
+                archive.commit()
+                manifest.mark_archived(archive.names_written)
+                logger.info(f"模式9: 已向 '{zip_filepath}' 直接写入 {len(archive.names_written)} 个文件。")
+        except Exception:
+            if archive is not None:
+                archive.abort()
+            raise
+        finally:
+            manifest.save() # 被停止时也保存，已完成的转换下次不再重复
+
+        if not discovery_stats['found']:
+            logger.warning(f"模式9: 在输入目录 '{input_dir}' 中没有找到支持的图片文件进行处理。")
+        elif discovery_stats['skipped']:
+            logger.info(f"模式9: {discovery_stats['skipped']} 张图片自上次运行后未变化，跳过转换。")
+        if discovery_stats['duplicates']:
+            logger.info(f"模式9: {discovery_stats['duplicates']} 张近重复图片未单独归档，对应关系见 {image_dedup.DUPLICATE_MAP_FILENAME}。")
+        logger.info(f"模式9: WebP 图片处理完成，共发现 {discovery_stats['found']} 张，处理 {processed_count} 张图片。")
 
         if core_utils.check_stop_signal(context):
             logger.info("模式9：检测到停止信号，打包操作将被跳过。")
             return
 
-        # 2. 打包 WebP 图片 (如果 output_webp_dir 中有内容)
-        if os.path.exists(output_webp_dir) and os.listdir(output_webp_dir):
-            logger.info(f"模式9: 开始将 '{output_webp_dir}' 的内容打包到 '{zip_filepath}'")
-            success = core_utils.create_zip_archive(context, output_webp_dir, zip_filepath)
+        # 2. 打包 WebP 图片：流式写入时已经完成；否则 ZIP 不存在时打包整个输出目录，存在时只写入新转换的条目
+        pending_outputs = manifest.unarchived_outputs()
+        if not stream_to_zip and discovery_stats['duplicates']:
+            pending_outputs.append(image_dedup.DUPLICATE_MAP_FILENAME)
+        if stream_to_zip:
+            if archive is None and zip_exists:
+                logger.info(f"模式9: ZIP 文件 '{zip_filepath}' 已是最新，无需重新打包。")
+            if os.path.isdir(output_webp_dir) and not pending_outputs:
+                try:
+                    shutil.rmtree(output_webp_dir)
+                    logger.info(f"模式9: WebP目录 '{output_webp_dir}' 已删除。")
+                except Exception as e_del_webp:
+                    logger.warning(f"模式9: 删除WebP目录 '{output_webp_dir}' 失败: {e_del_webp}")
+        elif zip_exists and not pending_outputs:
+            logger.info(f"模式9: ZIP 文件 '{zip_filepath}' 已是最新，无需重新打包。")
+        elif os.path.exists(output_webp_dir) and os.listdir(output_webp_dir):
+            if zip_exists:
+                logger.info(f"模式9: 开始将 {len(pending_outputs)} 个新转换的文件写入 '{zip_filepath}'")
+                success = core_utils.update_zip_archive(context, output_webp_dir, zip_filepath, pending_outputs)
+                archived_names = pending_outputs
+            else:
+                logger.info(f"模式9: 开始将 '{output_webp_dir}' 的内容打包到 '{zip_filepath}'")
+                success = core_utils.create_zip_archive(context, output_webp_dir, zip_filepath)
+                archived_names = [
+                    os.path.relpath(os.path.join(root, name), output_webp_dir).replace(os.sep, '/')
+                    for root, _, files in os.walk(output_webp_dir) for name in files
+                ]
             if success:
+                manifest.mark_archived(archived_names)
+                manifest.save()
                 logger.info(f"模式9: 目录 '{output_webp_dir}' 已成功打包到 '{zip_filepath}'")
-                if delete_webp_after_zip:
-                    logger.info(f"模式9: 打包成功，开始删除WebP目录 '{output_webp_dir}'")
-                    try:
-                        shutil.rmtree(output_webp_dir)
-                        logger.info(f"模式9: WebP目录 '{output_webp_dir}' 已删除。")
-                    except Exception as e_del_webp:
-                        logger.warning(f"模式9: 删除WebP目录 '{output_webp_dir}' 失败: {e_del_webp}")
             else:
                 logger.error(f"模式9: 打包目录 '{output_webp_dir}' 失败。")
         else: